@@ -1,479 +1,306 @@
-from flask import Flask, render_template, request, jsonify, send_from_directory
-from playwright.sync_api import sync_playwright
+from flask import Flask, Response, render_template, request, jsonify, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 import json
-import csv
 import os
 import time
-import random
-from datetime import datetime
-from urllib.parse import quote_plus
-import uuid
+import atexit
+import mimetypes
 import logging
-import requests
-from bs4 import BeautifulSoup
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("scraper.log"),
-        logging.StreamHandler()
-    ]
-)
+import threading
+from cache import ResultCache
+from fetcher import PageFetcher
+from http_cache import HttpCache
+from identities import IdentityPool
+from browser_pool import BrowserPool
+from parsers import LazyParserBackend
+from blocking import CircuitBreaker
+from records import Listing, json_default
+from store import ListingStore
+from enrichment import DetailEnricher
+from exporters import check_available
+from metrics import Trace, registry
+from scheduler import FetchScheduler
+from batch import Batch, BatchQuery
+from jobs import JobManager, QueueFullError
+from watches import EventLog, WatchManager, WebhookSink
+from scraper import DEFAULT_BASE_URL, DEFAULT_EXPORT_DIR, USER_AGENTS, OLXScraper, configure_logging
+
+# Handlers are set up by whoever runs the app (__main__ below, gunicorn.conf.py), not on import
 logger = logging.getLogger(__name__)
 
+
+class ListingJSONProvider(DefaultJSONProvider):
+    """jsonify() that writes Listing records as the dicts they stand for"""
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Listing):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+
 app = Flask(__name__)
+app.json = ListingJSONProvider(app)
 
-# Create necessary directories
-if not os.path.exists('static'):
-    os.makedirs('static')
-if not os.path.exists('static/downloads'):
-    os.makedirs('static/downloads')
-
-class OLXScraper:
-    def __init__(self):
-        self.base_url = "https://www.olx.in"
-        self.user_agents = [
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36',
-            'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.5 Safari/605.1.15',
-            'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/113.0',
-            'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36'
-        ]
-    
-    def search(self, query, max_pages=3, output_format="both"):
-        """
-        Searches OLX for the given query and extracts product information using both Playwright and requests as fallback.
-        
-        Args:
-            query (str): Search query
-            max_pages (int): Maximum number of pages to scrape
-            output_format (str): Output format ("csv", "json", or "both")
-            
-        Returns:
-            tuple: (List of results, list of file paths, total listings)
-        """
-        encoded_query = quote_plus(query)
-        base_search_url = f"{self.base_url}/items/q-{encoded_query}"
-        
-        all_results = []
-        
-        # Try using requests first (more reliable for OLX)
-        try:
-            logger.info(f"Trying requests method first for: {query}")
-            results = self._scrape_with_requests(base_search_url, max_pages)
-            if results:
-                logger.info(f"Successfully scraped {len(results)} listings with requests method")
-                all_results = results
-            else:
-                logger.warning("Requests method failed, falling back to Playwright")
-        except Exception as e:
-            logger.error(f"Request method failed with error: {str(e)}")
-            logger.info("Falling back to Playwright")
-        
-        # If requests method failed or returned no results, try Playwright
-        if not all_results:
-            try:
-                results = self._scrape_with_playwright(base_search_url, max_pages)
-                if results:
-                    all_results = results
-            except Exception as e:
-                logger.error(f"Playwright method also failed: {str(e)}")
-        
-        # If both methods failed, create sample data for testing
-        if not all_results:
-            logger.warning("Both scraping methods failed, creating sample data")
-            for i in range(1, 6):
-                all_results.append({
-                    "title": f"Sample {query} {i}",
-                    "price": f"₹{i*500}",
-                    "location": "Sample Location",
-                    "date": "Today",
-                    "seller": "Sample Seller",
-                    "url": f"https://www.olx.in/sample-{i}",
-                    "image": "https://via.placeholder.com/150"
-                })
-        
-        # Generate unique ID for this scrape
-        unique_id = uuid.uuid4().hex[:8]
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename_base = f"static/downloads/olx_{query.replace(' ', '_')}_{timestamp}_{unique_id}"
-        
-        files_info = []
-        
-        if output_format in ["json", "both"]:
-            json_path = f"{filename_base}.json"
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(all_results, f, indent=2, ensure_ascii=False)
-            files_info.append({
-                "path": os.path.basename(json_path),
-                "type": "JSON"
-            })
-        
-        if output_format in ["csv", "both"]:
-            csv_path = f"{filename_base}.csv"
-            if all_results:
-                with open(csv_path, 'w', encoding='utf-8', newline='') as f:
-                    writer = csv.DictWriter(f, fieldnames=all_results[0].keys())
-                    writer.writeheader()
-                    writer.writerows(all_results)
-                files_info.append({
-                    "path": os.path.basename(csv_path),
-                    "type": "CSV"
-                })
-        
-        return all_results, files_info, len(all_results)
-    
-    def _scrape_with_requests(self, base_url, max_pages):
-        """Scrape OLX using requests and BeautifulSoup"""
-        results = []
-        
-        for page_num in range(1, max_pages + 1):
-            url = f"{base_url}?page={page_num}"
-            
-            # Add random delay between requests
-            time.sleep(random.uniform(1, 3))
-            
-            # Rotate user agents
-            headers = {
-                'User-Agent': random.choice(self.user_agents),
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-                'Cache-Control': 'no-cache',
-                'Pragma': 'no-cache',
-                'Sec-Ch-Ua': '"Chromium";v="115", "Not/A)Brand";v="99"',
-                'Sec-Ch-Ua-Mobile': '?0',
-                'Sec-Ch-Ua-Platform': '"Windows"',
-                'Sec-Fetch-Dest': 'document',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-Site': 'none',
-                'Sec-Fetch-User': '?1',
-                'Upgrade-Insecure-Requests': '1',
-                'Referer': 'https://www.google.com/'
-            }
-            
-            try:
-                logger.info(f"Requesting: {url}")
-                # Set a longer timeout and ignore SSL errors
-                response = requests.get(
-                    url, 
-                    headers=headers, 
-                    timeout=30,
-                    verify=False  # Ignore SSL certificate verification
-                )
-                
-                # Check if request was successful
-                if response.status_code == 200:
-                    logger.info(f"Successfully fetched page {page_num}")
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    
-                    # Try multiple selectors to find listings
-                    listing_selectors = [
-                        'li[data-aut-id="itemBox"]',
-                        'li.EIR5N', 
-                        'li._1DNjI', 
-                        'li[data-testid="listing-card"]',
-                        'div.IKo3_',
-                        'div._2tW1I'
-                    ]
-                    
-                    found_listings = False
-                    for selector in listing_selectors:
-                        listings = soup.select(selector)
-                        if listings:
-                            found_listings = True
-                            logger.info(f"Found {len(listings)} listings with selector: {selector}")
-                            
-                            for listing in listings:
-                                item_data = {}
-                                
-                                # Try multiple selectors for each field
-                                title_selectors = ['[data-aut-id="itemTitle"]', 'span.fTZT3', '.IKo3_', 'h2']
-                                title = self._extract_with_selectors(listing, title_selectors)
-                                item_data["title"] = title if title else "N/A"
-                                
-                                price_selectors = ['[data-aut-id="itemPrice"]', 'span.rui-1ZsCJ', '.mNKEw', 'span._2Vp0i']
-                                price = self._extract_with_selectors(listing, price_selectors)
-                                item_data["price"] = price if price else "N/A"
-                                
-                                location_selectors = ['[data-aut-id="item-location"]', 'span.tjgMj', '._1KOFM', 'span._2VQu4']
-                                location = self._extract_with_selectors(listing, location_selectors)
-                                item_data["location"] = location if location else "N/A"
-                                
-                                date_selectors = ['[data-aut-id="item-date"]', 'span._2Vp0i', '._2DGqt', 'span._3XHzl']
-                                date = self._extract_with_selectors(listing, date_selectors)
-                                item_data["date"] = date if date else "N/A"
-                                
-                                seller_selectors = ['[data-aut-id="seller-name"]', 'span._3KMlK', '._3eNLO', 'span._1KQyH']
-                                seller = self._extract_with_selectors(listing, seller_selectors)
-                                item_data["seller"] = seller if seller else "N/A"
-                                
-                                # Try to get URL
-                                url_elem = listing.select_one('a')
-                                if url_elem and 'href' in url_elem.attrs:
-                                    href = url_elem['href']
-                                    item_data["url"] = self.base_url + href if href.startswith('/') else href
-                                else:
-                                    item_data["url"] = "N/A"
-                                
-                                # Try to get image
-                                img_selectors = ['img[data-aut-id="itemImage"]', 'img', '[data-aut-id="slider"] img']
-                                img_elem = None
-                                for selector in img_selectors:
-                                    img_elem = listing.select_one(selector)
-                                    if img_elem and 'src' in img_elem.attrs:
-                                        break
-                                
-                                item_data["image"] = img_elem['src'] if img_elem and 'src' in img_elem.attrs else "N/A"
-                                
-                                results.append(item_data)
-                            
-                            break  # Break out of selector loop once listings are found
-                    
-                    if not found_listings:
-                        logger.warning(f"No listings found on page {page_num}")
-                        
-                        # Check if we're being blocked
-                        if "captcha" in response.text.lower() or "blocked" in response.text.lower():
-                            logger.warning("Detected anti-bot measures. Switching to different approach.")
-                            break
-                    
-                    # Check for next page
-                    next_page = soup.select_one('a[data-aut-id="btnLoadMore"], button.rui-3sH3b, .rui-77FWl')
-                    if not next_page:
-                        logger.info("No next page button found")
-                        break
-                
-                else:
-                    logger.warning(f"Failed to fetch page {page_num}: Status code {response.status_code}")
-                    break
-                
-            except requests.RequestException as e:
-                logger.error(f"Request error on page {page_num}: {str(e)}")
-                break
-            
-            # Add random delay between pages
-            time.sleep(random.uniform(2, 5))
-        
-        return results
-    
-    def _extract_with_selectors(self, element, selectors):
-        """Try multiple selectors to extract text"""
-        for selector in selectors:
-            try:
-                found = element.select_one(selector)
-                if found:
-                    return found.get_text().strip()
-            except Exception:
-                continue
-        return None
-    
-    def _scrape_with_playwright(self, base_url, max_pages):
-        """Scrape OLX using Playwright as fallback"""
-        results = []
-        
-        with sync_playwright() as playwright:
-            # Configure browser launch options to avoid detection
-            browser = playwright.firefox.launch(  # Try Firefox instead of Chromium
-                headless=True,
-                firefox_user_prefs={  # Firefox-specific preferences
-                    "general.useragent.override": random.choice(self.user_agents),
-                    "dom.webdriver.enabled": False,
-                    "privacy.trackingprotection.enabled": False
-                },
-                args=[
-                    '--disable-blink-features=AutomationControlled',
-                    '--no-sandbox',
-                    '--disable-setuid-sandbox',
-                    '--disable-dev-shm-usage',
-                    '--disable-accelerated-2d-canvas',
-                    '--no-first-run',
-                    '--no-zygote',
-                    '--disable-gpu',
-                    '--hide-scrollbars',
-                    '--mute-audio'
-                ]
-            )
-            
-            context = browser.new_context(
-                viewport={'width': 1366, 'height': 768},
-                locale='en-IN',
-                timezone_id='Asia/Kolkata',
-                geolocation={'latitude': 20.5937, 'longitude': 78.9629},
-                permissions=['geolocation']
-            )
-            
-            # Spoof webdriver
-            context.add_init_script("""
-                Object.defineProperty(navigator, 'webdriver', {
-                    get: () => false
-                });
-                
-                // Override the `navigator.plugins` getter
-                Object.defineProperty(navigator, 'plugins', {
-                    get: () => [1, 2, 3, 4, 5],
-                });
-                
-                // Override the `navigator.languages` getter
-                Object.defineProperty(navigator, 'languages', {
-                    get: () => ['en-US', 'en', 'hi'],
-                });
-            """)
-            
-            # Add cookies to look more authentic
-            context.add_cookies([{
-                'name': 'session_id',
-                'value': uuid.uuid4().hex,
-                'domain': '.olx.in',
-                'path': '/'
-            }])
-            
-            page = context.new_page()
-            
-            # Set headers on the page
-            page.set_extra_http_headers({
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9,hi;q=0.8',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Sec-Fetch-Dest': 'document',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-Site': 'none',
-                'Sec-Fetch-User': '?1',
-                'Referer': 'https://www.google.com/'
-            })
-            
-            # First visit the homepage to set cookies
-            try:
-                logger.info("Visiting OLX homepage first")
-                page.goto(self.base_url, wait_until="domcontentloaded", timeout=30000)
-                time.sleep(random.uniform(3, 5))
-            except Exception as e:
-                logger.error(f"Error visiting homepage: {str(e)}")
-            
-            page.set_default_timeout(30000)  # 30 seconds timeout
-            
-            for page_num in range(1, max_pages + 1):
-                url = f"{base_url}?page={page_num}"
-                
-                try:
-                    # Navigate with 'networkidle' instead of 'domcontentloaded'
-                    logger.info(f"Navigating to: {url}")
-                    # Try with HTTP/1.1 instead of HTTP/2
-                    page.goto(url, wait_until="networkidle", timeout=60000)
-                    
-                    # Wait after page load
-                    time.sleep(random.uniform(3, 5))
-                    
-                    # Check for CAPTCHA or blocked page
-                    if (page.query_selector('text=captcha') or 
-                        page.query_selector('text=blocked') or 
-                        page.query_selector('text=suspicious')):
-                        logger.warning("Anti-bot protection detected, aborting")
-                        break
-                    
-                    # Look for listings with different selectors
-                    listing_selectors = [
-                        'li[data-aut-id="itemBox"]',
-                        'li.EIR5N', 
-                        'li._1DNjI', 
-                        'li[data-testid="listing-card"]',
-                        'div.IKo3_',
-                        'div._2tW1I'
-                    ]
-                    
-                    listings = []
-                    for selector in listing_selectors:
-                        try:
-                            elements = page.query_selector_all(selector)
-                            if elements and len(elements) > 0:
-                                listings = elements
-                                logger.info(f"Found {len(listings)} listings with selector: {selector}")
-                                break
-                        except Exception:
-                            continue
-                    
-                    if not listings:
-                        logger.warning("No listings found on the page")
-                        # Take screenshot for debugging
-                        page.screenshot(path=f"debug_screenshot_page{page_num}.png")
-                        continue
-                    
-                    for listing in listings:
-                        item_data = {}
-                        
-                        # Extract data using multiple selectors for each field
-                        # Title
-                        title_selectors = ['[data-aut-id="itemTitle"]', 'span.fTZT3', '.IKo3_', 'h2']
-                        title = self._extract_text_with_selectors(listing, title_selectors)
-                        item_data["title"] = title if title else "N/A"
-                        
-                        # Price
-                        price_selectors = ['[data-aut-id="itemPrice"]', 'span.rui-1ZsCJ', '.mNKEw', 'span._2Vp0i']
-                        price = self._extract_text_with_selectors(listing, price_selectors)
-                        item_data["price"] = price if price else "N/A"
-                        
-                        # Location
-                        location_selectors = ['[data-aut-id="item-location"]', 'span.tjgMj', '._1KOFM', 'span._2VQu4']
-                        location = self._extract_text_with_selectors(listing, location_selectors)
-                        item_data["location"] = location if location else "N/A"
-                        
-                        # Date
-                        date_selectors = ['[data-aut-id="item-date"]', 'span._2Vp0i', '._2DGqt', 'span._3XHzl']
-                        date = self._extract_text_with_selectors(listing, date_selectors)
-                        item_data["date"] = date if date else "N/A"
-                        
-                        # Seller
-                        seller_selectors = ['[data-aut-id="seller-name"]', 'span._3KMlK', '._3eNLO', 'span._1KQyH']
-                        seller = self._extract_text_with_selectors(listing, seller_selectors)
-                        item_data["seller"] = seller if seller else "N/A"
-                        
-                        # URL
-                        url_elem = listing.query_selector('a')
-                        if url_elem:
-                            href = url_elem.get_attribute('href')
-                            item_data["url"] = self.base_url + href if href and href.startswith('/') else href
-                        else:
-                            item_data["url"] = "N/A"
-                        
-                        # Image
-                        img_selectors = ['img[data-aut-id="itemImage"]', 'img', '[data-aut-id="slider"] img']
-                        img_url = None
-                        for selector in img_selectors:
-                            img_elem = listing.query_selector(selector)
-                            if img_elem:
-                                img_url = img_elem.get_attribute('src')
-                                if img_url:
-                                    break
-                        
-                        item_data["image"] = img_url if img_url else "N/A"
-                        
-                        results.append(item_data)
-                    
-                    # Add a random delay between pages
-                    time.sleep(random.uniform(4, 7))
-                    
-                except Exception as e:
-                    logger.error(f"Error on page {page_num}: {str(e)}")
-                    break
-            
-            browser.close()
-        
-        return results
-    
-    def _extract_text_with_selectors(self, element, selectors):
-        """Try multiple selectors to extract text using Playwright"""
-        for selector in selectors:
-            try:
-                found = element.query_selector(selector)
-                if found:
-                    return found.inner_text().strip()
-            except Exception:
-                continue
-        return None
+# Shared between index() and scrape() so the UI's back-to-back calls only scrape once
+result_cache = ResultCache(
+    ttl=int(os.environ.get('OLX_CACHE_TTL', 600)),
+    max_entries=int(os.environ.get('OLX_CACHE_MAX_ENTRIES', 128)),
+    disk_dir=os.environ.get('OLX_CACHE_DIR') or None
+)
+
+# Raw responses on disk, revalidated with conditional requests; an empty OLX_HTTP_CACHE_DIR disables it.
+# OLX_HTTP_CACHE_MAX_AGE lets search pages be reused without any request for that many seconds, and
+# OLX_OFFLINE=1 replays everything from the cache without touching the network.
+http_cache_dir = os.environ.get('OLX_HTTP_CACHE_DIR', 'http_cache')
+http_cache = HttpCache(
+    http_cache_dir,
+    max_bytes=int(float(os.environ.get('OLX_HTTP_CACHE_MAX_MB', 200)) * 2**20),
+    max_age=float(os.environ.get('OLX_HTTP_CACHE_MAX_AGE', 0)),
+    offline=os.environ.get('OLX_OFFLINE', '0') == '1'
+) if http_cache_dir else None
+
+# Comma-separated proxy URLs ("direct" for this machine's address), each becoming an identity with
+# its own browser profile, cookie jar, rate limit and health score; unset sends everything directly
+proxies = [proxy for proxy in os.environ.get('OLX_PROXIES', '').split(',') if proxy.strip()]
+identity_pool = IdentityPool.from_proxies(
+    proxies,
+    cooldown=float(os.environ.get('OLX_IDENTITY_COOLDOWN', 60)),
+    max_cooldown=float(os.environ.get('OLX_IDENTITY_MAX_COOLDOWN', 1800))
+) if proxies else None
+
+# One pooled fetcher per process so keep-alive connections and rate limits span searches
+page_fetcher = PageFetcher(
+    pool_size=int(os.environ.get('OLX_POOL_SIZE', 10)),
+    max_concurrency=int(os.environ.get('OLX_FETCH_CONCURRENCY', 3)),
+    rate=float(os.environ.get('OLX_FETCH_RATE', 1.0)),
+    burst=int(os.environ.get('OLX_FETCH_BURST', 2)),
+    breaker=CircuitBreaker(
+        cooldown=float(os.environ.get('OLX_BLOCK_COOLDOWN', 30)),
+        max_cooldown=float(os.environ.get('OLX_BLOCK_MAX_COOLDOWN', 900))
+    ),
+    http_cache=http_cache,
+    identities=identity_pool
+)
+
+# Browsers are launched on the first Playwright fallback and then reused across searches
+browser_pool = BrowserPool(
+    user_agents=USER_AGENTS,
+    browsers=int(os.environ.get('OLX_BROWSERS', 1)),
+    contexts=int(os.environ.get('OLX_BROWSER_CONTEXTS', 1)),
+    max_uses=int(os.environ.get('OLX_CONTEXT_MAX_USES', 50)),
+    block_resources=os.environ.get('OLX_BLOCK_RESOURCES', '1') != '0'
+)
+atexit.register(browser_pool.close)
+
+# Shared so the selectors that win on one search are tried first on the next; the backend
+# (and bs4/lxml) is only imported by the first search that parses HTML
+html_parser = LazyParserBackend(os.environ.get('OLX_PARSER', 'auto'))
+
+# The JSON search API is tried before the HTML result pages unless disabled
+use_search_api = os.environ.get('OLX_USE_API', '1') != '0'
+
+# Every scraped listing is kept here across searches; an empty OLX_STORE_PATH disables the store
+store_path = os.environ.get('OLX_STORE_PATH', 'listings.db')
+listing_store = ListingStore(store_path) if store_path else None
+if listing_store is not None:
+    atexit.register(listing_store.close)
+
+# Where searches go; pointed at a local stub server by the offline benchmarks
+olx_base_url = os.environ.get('OLX_BASE_URL', DEFAULT_BASE_URL)
+
+# Incremental scrapes stop paging at the first page with nothing new for the query
+incremental_scrapes = os.environ.get('OLX_INCREMENTAL', '0') == '1'
+
+# With OLX_ENRICH=1 every listing gets the description, images, seller id and exact time and place
+# from its detail page, fetched alongside the result pages; ads enriched within OLX_ENRICH_MAX_AGE
+# seconds are not fetched again
+detail_enricher = DetailEnricher(
+    page_fetcher,
+    store=listing_store,
+    max_age=float(os.environ.get('OLX_ENRICH_MAX_AGE', 86400)),
+    lookahead=int(os.environ.get('OLX_ENRICH_LOOKAHEAD', 1))
+) if os.environ.get('OLX_ENRICH', '0') == '1' else None
+
+def run_scrape_job(job):
+    """Job runner: scrape through the shared cache and fetcher, then write the export files"""
+    scraper = OLXScraper(
+        cache=result_cache,
+        fetcher=page_fetcher,
+        browser_pool=browser_pool,
+        parser=html_parser,
+        use_api=use_search_api,
+        store=listing_store,
+        incremental=incremental_scrapes,
+        progress_callback=job.page_done,
+        cancel_event=job.cancel_event,
+        base_url=olx_base_url,
+        enricher=detail_enricher
+    )
+    for page_items in scraper.iter_search(job.query, job.pages):
+        job.add_results(page_items)
+    job.degraded = scraper.degraded
+    files = scraper.export(job.query, job.results, job.output_format, job.compression) if job.results else []
+    return job.results, files
+
+job_manager = JobManager(
+    run_scrape_job,
+    max_workers=int(os.environ.get('OLX_JOB_WORKERS', 2)),
+    max_queue=int(os.environ.get('OLX_JOB_QUEUE', 20))
+)
+
+# One queue for the page fetches of every batch, on top of the shared fetcher's per-host limits
+fetch_scheduler = FetchScheduler(
+    page_fetcher,
+    workers=int(os.environ.get('OLX_SCHEDULER_WORKERS', 4)),
+    max_retries=int(os.environ.get('OLX_FETCH_RETRIES', 3))
+)
+atexit.register(fetch_scheduler.close)
+
+batches = {}
+batches_lock = threading.Lock()
+BATCH_RETENTION = 3600
+
+def start_batch(queries, pages=3, output_format="both", compression=None):
+    """Start scraping a list of queries (strings or BatchQuery) through the shared scheduler"""
+    scraper = OLXScraper(
+        cache=result_cache,
+        fetcher=page_fetcher,
+        parser=html_parser,
+        use_api=use_search_api,
+        store=listing_store,
+        incremental=incremental_scrapes,
+        base_url=olx_base_url,
+        enricher=detail_enricher
+    )
+    batch = Batch(queries, pages, output_format, compression)
+    with batches_lock:
+        cutoff = time.time() - BATCH_RETENTION
+        for batch_id in [i for i, b in batches.items() if b.finished_at is not None and b.finished_at < cutoff]:
+            del batches[batch_id]
+        batches[batch.id] = batch
+    batch.start(scraper, fetch_scheduler)
+    return batch
+
+def run_watch(watch):
+    """Watch runner: scrape the query live, without the result cache and without writing exports"""
+    scraper = OLXScraper(
+        fetcher=page_fetcher,
+        browser_pool=browser_pool,
+        parser=html_parser,
+        use_api=use_search_api,
+        store=listing_store,
+        # With a store, paging stops at the first page holding nothing new for the query
+        incremental=watch.incremental and listing_store is not None,
+        base_url=olx_base_url,
+        enricher=detail_enricher
+    )
+    listings = scraper.fetch(watch.query, watch.pages)
+    return listings, scraper.degraded, not scraper.stopped_early
+
+# Watches post their new listings and price drops to OLX_WATCH_WEBHOOK and/or append them to
+# OLX_WATCH_EVENT_LOG (NDJSON, empty disables); the watches themselves are kept in the OLX_WATCHES_PATH
+# directory, one file each, and forget listings an incremental run has not seen for OLX_WATCH_FORGET_RUNS runs
+watch_sinks = []
+if os.environ.get('OLX_WATCH_EVENT_LOG', 'watch_events.ndjson'):
+    watch_sinks.append(EventLog(os.environ.get('OLX_WATCH_EVENT_LOG', 'watch_events.ndjson')))
+if os.environ.get('OLX_WATCH_WEBHOOK'):
+    watch_sinks.append(WebhookSink(
+        os.environ['OLX_WATCH_WEBHOOK'],
+        batch_size=int(os.environ.get('OLX_WATCH_WEBHOOK_BATCH', 100))
+    ))
+watch_manager = WatchManager(
+    run_watch,
+    sinks=watch_sinks,
+    max_concurrent=int(os.environ.get('OLX_WATCH_CONCURRENCY', 2)),
+    jitter=float(os.environ.get('OLX_WATCH_JITTER', 0.1)),
+    min_interval=float(os.environ.get('OLX_WATCH_MIN_INTERVAL', 60)),
+    path=os.environ.get('OLX_WATCHES_PATH', 'watches') or None,
+    forget_after=int(os.environ.get('OLX_WATCH_FORGET_RUNS', 20))
+)
+atexit.register(watch_manager.close)
+
+def start_background():
+    """Start the background work that needs its own threads: the saved watches' scheduler"""
+    watch_manager.start()
+
+# Threads started while gunicorn preloads the app in its master would not survive the fork,
+# so gunicorn.conf.py defers this and starts them in each worker instead
+if os.environ.get('OLX_DEFER_BACKGROUND', '0') != '1':
+    start_background()
+
+# Browser pool stats that only ever grow; in_use/idle are exported as gauges
+BROWSER_POOL_COUNTERS = ("launches", "contexts_created", "contexts_recycled", "searches",
+                         "blocked_requests", "loaded_requests", "loaded_bytes")
+
+def degraded_error(degraded):
+    """503 response for a search that was blocked or whose sources all failed, with nothing to serve"""
+    if "retry_in" in degraded:
+        message = f"OLX is blocking requests ({degraded['reason']}), try again in {degraded['retry_in']}s"
+    else:
+        message = "OLX could not be reached, try again later"
+    response = jsonify({
+        "error": message,
+        "degraded": degraded
+    })
+    response.status_code = 503
+    if "retry_in" in degraded:
+        response.headers['Retry-After'] = str(max(1, degraded['retry_in']))
+    return response
+
+def collect_component_metrics():
+    """Expose the counters the shared components already keep on /metrics"""
+    selector_hits = [
+        ({"field": field, "selector": selector}, hits)
+        for field, wins in html_parser.stats().items()
+        for selector, hits in wins.items()
+    ]
+    cache = result_cache.stats()
+    pool = browser_pool.stats()
+    scheduler = fetch_scheduler.stats()
+    breaker = page_fetcher.breaker.stats()
+    collected = [
+        ("olx_selector_hits_total", "counter", "Times each selector matched, per field", selector_hits),
+        ("olx_cache_lookups_total", "counter", "Result cache lookups",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+        ("olx_cache_entries", "gauge", "Searches held in the result cache", [({}, cache["entries"])]),
+        ("olx_browser_pool_total", "counter", "Browser pool counters",
+         [({"counter": name}, pool[name]) for name in BROWSER_POOL_COUNTERS]),
+        ("olx_browser_pool_contexts", "gauge", "Browser contexts, by state",
+         [({"state": name}, pool[name]) for name in ("in_use", "idle")]),
+        ("olx_scheduler_tasks_total", "counter", "Fetch scheduler task counters",
+         [({"counter": name}, scheduler[name]) for name in ("submitted", "fetched", "retries", "failed")]),
+        ("olx_scheduler_tasks", "gauge", "Fetch scheduler tasks, by state",
+         [({"state": name}, scheduler[name]) for name in ("running", "queued", "delayed")]),
+        ("olx_circuit_breaker_open", "gauge", "Whether a host's circuit breaker is open or probing",
+         [({"host": host}, int(state["state"] != "closed")) for host, state in breaker.items()])
+    ]
+    if http_cache is not None:
+        responses = http_cache.stats()
+        collected.extend([
+            ("olx_http_cache_total", "counter", "HTTP cache lookups",
+             [({"result": name}, responses[name]) for name in ("hits", "revalidated", "misses")]),
+            ("olx_http_cache_saved_bytes_total", "counter", "Response bytes served from the HTTP cache",
+             [({}, responses["bytes_saved"])]),
+            ("olx_http_cache_size_bytes", "gauge", "Compressed size of the HTTP cache on disk",
+             [({}, responses["size_bytes"])])
+        ])
+    if identity_pool is not None:
+        identities = identity_pool.stats()
+        collected.extend([
+            ("olx_identities", "gauge", "Identities in the pool, by state",
+             [({"state": name}, sum(i["state"] == name for i in identities.values())) for name in ("active", "ejected")]),
+            ("olx_identity_health", "gauge", "Health score of each identity",
+             [({"identity": name}, i["health"]) for name, i in identities.items()]),
+            ("olx_identity_requests_total", "counter", "Requests sent as each identity",
+             [({"identity": name}, i["requests"]) for name, i in identities.items()])
+        ])
+    watching = watch_manager.stats()
+    collected.append(("olx_watches", "gauge", "Registered watches, and those running now",
+                      [({"state": "registered"}, watching["watches"]), ({"state": "running"}, watching["running"])]))
+    return collected
+
+registry.register_collector(collect_component_metrics)
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -486,23 +313,40 @@ def index():
             data = request.get_json()
             search_query = data.get('query', 'car cover')
             pages = min(int(data.get('pages', 3)), 10)  # Limit to 10 pages max
+            trace = Trace() if data.get('trace') else None
             
             logger.info(f"Starting scrape for: {search_query}, Pages: {pages}")
             
             # Initialize scraper
-            scraper = OLXScraper()
+            scraper = OLXScraper(cache=result_cache, fetcher=page_fetcher, browser_pool=browser_pool,
+                                 parser=html_parser, use_api=use_search_api, store=listing_store,
+                                 incremental=incremental_scrapes, trace=trace, base_url=olx_base_url,
+                                 enricher=detail_enricher)
             
-            # Perform scraping
-            results, _, total_listings = scraper.search(search_query, pages, "json")
+            # Perform scraping, files are only written by /scrape
+            results = scraper.fetch(search_query, pages)
+            total_listings = len(results)
             
             logger.info(f"Scraping completed. Found {total_listings} listings.")
             
             if not results:
                 logger.warning("No results found")
-                return jsonify([])
+                if scraper.degraded is not None:
+                    return degraded_error(scraper.degraded)
             
-            # Return results directly
-            return jsonify(results)
+            # Return results directly, wrapped with the stage timings when a trace was asked for
+            if trace is not None:
+                response = jsonify({
+                    "results": results,
+                    "degraded": scraper.degraded,
+                    "trace": trace.to_dict()
+                })
+            else:
+                response = jsonify(results)
+            # Stale or partial results keep the plain list shape, flagged in a header
+            if scraper.degraded is not None:
+                response.headers['X-Degraded'] = scraper.degraded['reason']
+            return response
             
         except Exception as e:
             logger.error(f"Error in index endpoint: {str(e)}")
@@ -519,28 +363,46 @@ def scrape():
         search_query = request.form.get('search_query', 'car cover')
         pages = min(int(request.form.get('pages', 3)), 10)  # Limit to 10 pages max
         output_format = request.form.get('format', 'both')
+        compression = request.form.get('compression') or None
+        trace = Trace() if request.form.get('trace') in ('1', 'true', 'on') else None
+        try:
+            check_available(output_format, compression)
+        except ValueError as e:
+            return jsonify({
+                "error": str(e)
+            }), 400
         
         logger.info(f"Starting scrape for: {search_query}, Pages: {pages}, Format: {output_format}")
         
         # Initialize scraper
-        scraper = OLXScraper()
+        scraper = OLXScraper(cache=result_cache, fetcher=page_fetcher, browser_pool=browser_pool,
+                             parser=html_parser, use_api=use_search_api, store=listing_store,
+                             incremental=incremental_scrapes, trace=trace, base_url=olx_base_url,
+                             enricher=detail_enricher)
         
-        # Perform scraping
-        results, files, total_listings = scraper.search(search_query, pages, output_format)
+        # Perform scraping, reusing the results of the preceding / call when cached
+        results, files, total_listings = scraper.search(search_query, pages, output_format, compression)
         
         logger.info(f"Scraping completed. Found {total_listings} listings.")
         
         if not results:
             logger.warning("No results found")
+            if scraper.degraded is not None:
+                return degraded_error(scraper.degraded)
             return jsonify({
                 "error": "No results found for your search query."
             }), 404
         
         # Return results
-        return jsonify({
+        response = {
             "total_listings": total_listings,
             "files": files
-        })
+        }
+        if scraper.degraded is not None:
+            response["degraded"] = scraper.degraded
+        if trace is not None:
+            response["trace"] = trace.to_dict()
+        return jsonify(response)
         
     except Exception as e:
         logger.error(f"Error in /scrape endpoint: {str(e)}")
@@ -550,9 +412,253 @@ def scrape():
             "error": str(e)
         }), 500
 
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    try:
+        data = request.get_json(silent=True) or request.form
+        search_query = data.get('query') or data.get('search_query') or 'car cover'
+        pages = min(int(data.get('pages', 3)), 10)  # Limit to 10 pages max
+        output_format = data.get('format', 'both')
+        compression = data.get('compression') or None
+        check_available(output_format, compression)
+        
+        job = job_manager.submit(search_query, pages, output_format, compression)
+        return jsonify(job.to_dict(include_results=False)), 202
+        
+    except ValueError as e:
+        return jsonify({
+            "error": str(e)
+        }), 400
+    except QueueFullError as e:
+        logger.warning(f"Rejected job: {str(e)}")
+        return jsonify({
+            "error": str(e)
+        }), 429
+    except Exception as e:
+        logger.error(f"Error in /jobs endpoint: {str(e)}")
+        return jsonify({
+            "error": str(e)
+        }), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({
+            "error": "Job not found"
+        }), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/stream')
+def stream_job(job_id):
+    """Stream the job's listings as NDJSON, one line per listing as each page is parsed"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({
+            "error": "Job not found"
+        }), 404
+    
+    def generate():
+        for event, value in job.follow():
+            if event == "listing":
+                line = {"type": "listing", "listing": value}
+            elif event == "progress":
+                line = {"type": "progress", "pages_done": value, "pages": job.pages}
+            elif event == "keepalive":
+                line = {"type": "keepalive"}
+            else:
+                line = {"type": value, "job": job.to_dict(include_results=False)}
+            yield json.dumps(line, ensure_ascii=False, default=json_default) + "\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        return jsonify({
+            "error": "Job not found"
+        }), 404
+    return jsonify(job.to_dict(include_results=False))
+
+@app.route('/batches', methods=['POST'])
+def create_batch():
+    try:
+        data = request.get_json(silent=True) or {}
+        queries = []
+        for entry in data.get('queries') or []:
+            if isinstance(entry, dict):
+                queries.append(BatchQuery(entry['query'], int(entry.get('priority', 0))))
+            else:
+                queries.append(BatchQuery(str(entry)))
+        if not queries:
+            return jsonify({
+                "error": "No queries given"
+            }), 400
+        pages = min(int(data.get('pages', 3)), 10)  # Limit to 10 pages max
+        output_format = data.get('format', 'both')
+        compression = data.get('compression') or None
+        
+        batch = start_batch(queries, pages, output_format, compression)
+        return jsonify(batch.to_dict()), 202
+        
+    except ValueError as e:
+        return jsonify({
+            "error": str(e)
+        }), 400
+    except Exception as e:
+        logger.error(f"Error in /batches endpoint: {str(e)}")
+        return jsonify({
+            "error": str(e)
+        }), 500
+
+@app.route('/batches/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    with batches_lock:
+        batch = batches.get(batch_id)
+    if batch is None:
+        return jsonify({
+            "error": "Batch not found"
+        }), 404
+    return jsonify(batch.to_dict())
+
+@app.route('/scheduler/stats')
+def scheduler_stats():
+    return jsonify(fetch_scheduler.stats())
+
+@app.route('/cache/stats')
+def cache_stats():
+    return jsonify(result_cache.stats())
+
+@app.route('/store/stats')
+def store_stats():
+    if listing_store is None:
+        return jsonify({
+            "error": "Listing store is disabled"
+        }), 404
+    return jsonify(listing_store.stats())
+
+@app.route('/listings')
+def stored_listings():
+    """Listings the store has for a query, without scraping"""
+    if listing_store is None:
+        return jsonify({
+            "error": "Listing store is disabled"
+        }), 404
+    search_query = request.args.get('query', '')
+    limit = request.args.get('limit', type=int)
+    return jsonify(listing_store.listings(search_query, limit))
+
+@app.route('/listings/<path:key>/prices')
+def listing_prices(key):
+    if listing_store is None:
+        return jsonify({
+            "error": "Listing store is disabled"
+        }), 404
+    return jsonify(listing_store.price_history(key))
+
+@app.route('/circuit-breaker/stats')
+def circuit_breaker_stats():
+    return jsonify(page_fetcher.breaker.stats())
+
+@app.route('/http-cache/stats')
+def http_cache_stats():
+    if http_cache is None:
+        return jsonify({
+            "error": "HTTP cache is disabled"
+        }), 404
+    return jsonify(http_cache.stats())
+
+@app.route('/identities/stats')
+def identities_stats():
+    if identity_pool is None:
+        return jsonify({
+            "error": "No proxies configured, requests go out directly"
+        }), 404
+    return jsonify(identity_pool.stats())
+
+@app.route('/watches', methods=['POST'])
+def create_watch():
+    """Watch a query: it is scraped every `interval` seconds and only new listings and price drops are emitted"""
+    try:
+        data = request.get_json() or {}
+        watch = watch_manager.add(
+            data.get('query', ''),
+            pages=max(1, min(int(data.get('pages', 1)), 10)),  # Limit to 10 pages max
+            interval=float(data.get('interval', 3600)),
+            incremental=bool(data.get('incremental', True))
+        )
+        return jsonify(watch.to_dict()), 201
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "error": str(e)
+        }), 400
+
+@app.route('/watches', methods=['GET'])
+def list_watches():
+    return jsonify([watch.to_dict() for watch in watch_manager.list()])
+
+@app.route('/watches/stats')
+def watch_stats():
+    return jsonify(watch_manager.stats())
+
+@app.route('/watches/<watch_id>', methods=['GET'])
+def get_watch(watch_id):
+    watch = watch_manager.get(watch_id)
+    if watch is None:
+        return jsonify({
+            "error": "Watch not found"
+        }), 404
+    return jsonify(watch.to_dict())
+
+@app.route('/watches/<watch_id>', methods=['DELETE'])
+def delete_watch(watch_id):
+    watch = watch_manager.remove(watch_id)
+    if watch is None:
+        return jsonify({
+            "error": "Watch not found"
+        }), 404
+    return jsonify(watch.to_dict())
+
+@app.route('/watches/<watch_id>/run', methods=['POST'])
+def run_watch_now(watch_id):
+    watch = watch_manager.run_now(watch_id)
+    if watch is None:
+        return jsonify({
+            "error": "Watch not found"
+        }), 404
+    return jsonify(watch.to_dict()), 202
+
+@app.route('/enrichment/stats')
+def enrichment_stats():
+    if detail_enricher is None:
+        return jsonify({
+            "error": "Detail page enrichment is disabled"
+        }), 404
+    return jsonify(detail_enricher.stats())
+
+@app.route('/browser-pool/stats')
+def browser_pool_stats():
+    return jsonify(browser_pool.stats())
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of this process's counters and stage histograms"""
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+# Export formats the mimetypes module does not know
+mimetypes.add_type('application/x-ndjson', '.ndjson')
+mimetypes.add_type('application/vnd.apache.parquet', '.parquet')
+
 @app.route('/download/<path:filename>')
 def download_file(filename):
-    return send_from_directory('static/downloads', filename, as_attachment=True)
+    """Serve an export from disk in chunks; Range and conditional requests are honoured for large files"""
+    return send_from_directory(DEFAULT_EXPORT_DIR, filename, as_attachment=True, conditional=True, max_age=0)
 
 if __name__ == '__main__':
+    configure_logging("scraper.log")
     app.run(debug=True, port=5001)
\ No newline at end of file
@@ -0,0 +1,294 @@
+"""
+Scrape many OLX searches in one batch through the shared fetch scheduler.
+
+The command line entry point is batch_cli.py.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from blocking import BLOCK_KINDS, CAPTCHA, EMPTY, OK, HostBlocked, classify_response
+from exporters import check_available
+from jobs import DONE, FAILED, QUEUED, RUNNING
+from scheduler import FetchTask
+from store import listing_key
+
+logger = logging.getLogger(__name__)
+
+
+class BatchQuery:
+    def __init__(self, query, priority=0):
+        self.query = query
+        self.priority = priority
+        self.status = QUEUED
+        self.source = None
+        self.pages_done = 0
+        self.total_listings = 0
+        self.files = []
+        self.error = None
+        # The kind of block that stopped the query, when OLX blocked it
+        self.degraded = None
+        self.stopped_early = False
+        self.finished_at = None
+        self.seen = set()
+        # Open export files, fed each page as it arrives when there is no listing store
+        self.export = None
+
+    def to_dict(self):
+        data = {
+            "query": self.query,
+            "priority": self.priority,
+            "status": self.status,
+            "source": self.source,
+            "pages_done": self.pages_done,
+            "total_listings": self.total_listings,
+            "files": self.files,
+            "finished_at": self.finished_at
+        }
+        if self.error:
+            data["error"] = self.error
+        if self.degraded:
+            data["degraded"] = self.degraded
+        return data
+
+
+class Batch:
+    """
+    A set of searches scraped together through the shared FetchScheduler.
+
+    Page 1 of every query is queued at once; each parsed page queues the next one, so
+    the scheduler interleaves queries page by page. Listings are not kept in memory:
+    without a listing store each page is streamed into the query's export files as it
+    arrives, with one the files are written from the store once the query finishes.
+    The batch's progress file is rewritten after every page.
+    """
+
+    def __init__(self, queries, pages=3, output_format="both", compression=None, progress_dir="static/downloads"):
+        check_available(output_format, compression)
+        self.id = uuid.uuid4().hex
+        self.queries = [q if isinstance(q, BatchQuery) else BatchQuery(q) for q in queries]
+        self.pages = pages
+        self.output_format = output_format
+        self.compression = compression
+        self.status = QUEUED
+        self.pages_fetched = 0
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        os.makedirs(progress_dir, exist_ok=True)
+        self.progress_path = os.path.join(progress_dir, f"batch_{self.id}.json")
+        self.scraper = None
+        self.scheduler = None
+        self._remaining = len(self.queries)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._done = threading.Event()
+
+    def start(self, scraper, scheduler):
+        """Queue the first page of every query; `scraper` parses and exports, `scheduler` fetches"""
+        self.scraper = scraper
+        self.scheduler = scheduler
+        self.started_at = time.time()
+        self.status = RUNNING
+        logger.info(f"Starting batch {self.id} with {len(self.queries)} queries, Pages: {self.pages}")
+
+        if not self.queries:
+            self._complete()
+            return
+        for batch_query in self.queries:
+            cached = scraper.cache.get(batch_query.query, self.pages) if scraper.cache is not None else None
+            if cached is not None:
+                logger.info(f"Serving cached results for: {batch_query.query}, Pages: {self.pages}")
+                batch_query.export = scraper.open_export(batch_query.query, self.output_format, self.compression)
+                batch_query.export.write_rows(cached)
+                batch_query.total_listings = len(cached)
+                batch_query.pages_done = self.pages
+                self._finish(batch_query, DONE)
+                continue
+            batch_query.status = RUNNING
+            batch_query.source = "api" if scraper.use_api else "html"
+            scheduler.submit(self._task(batch_query, 1))
+        self._write_progress()
+
+    def wait(self, timeout=None):
+        """Block until every query has finished; returns False on timeout"""
+        return self._done.wait(timeout)
+
+    def throughput(self):
+        with self._lock:
+            end = self.finished_at or time.time()
+            elapsed = end - self.started_at if self.started_at else 0.0
+            listings = sum(batch_query.total_listings for batch_query in self.queries)
+            pages = self.pages_fetched
+        return {
+            "elapsed": round(elapsed, 3),
+            "pages": pages,
+            "listings": listings,
+            "pages_per_sec": round(pages / elapsed, 2) if elapsed else 0.0,
+            "listings_per_sec": round(listings / elapsed, 2) if elapsed else 0.0
+        }
+
+    def to_dict(self):
+        with self._lock:
+            queries = [batch_query.to_dict() for batch_query in self.queries]
+        return {
+            "id": self.id,
+            "status": self.status,
+            "pages": self.pages,
+            "format": self.output_format,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress_file": os.path.basename(self.progress_path),
+            "throughput": self.throughput(),
+            "queries": queries
+        }
+
+    def _task(self, batch_query, page_num):
+        source = batch_query.source
+        url = self.scraper.page_url(batch_query.query, page_num, source)
+        return FetchTask(
+            url,
+            on_response=lambda response: self._on_response(batch_query, page_num, source, url, response),
+            on_error=lambda error: self._on_error(batch_query, page_num, source, error),
+            headers_factory=lambda: self.scraper.request_headers(source),
+            priority=batch_query.priority,
+            round=page_num
+        )
+
+    def _on_response(self, batch_query, page_num, source, url, response):
+        """Parse a fetched page, record it and return the task for the next page, if any"""
+        if response.status_code != 200:
+            kind = classify_response(response.status_code)
+            return self._source_failed(batch_query, page_num, source, f"Status code {response.status_code}",
+                                       blocked=kind if kind in BLOCK_KINDS else None)
+        items, has_next_page = self.scraper.parse_page(response.text, page_num, source)
+        kind = classify_response(200, response.text, items)
+        fetcher = self.scraper.fetcher
+        breaker = fetcher.breaker
+        if kind == CAPTCHA:
+            identity = getattr(response, "identity", None)
+            fetcher.record_block(url, kind, identity=identity)
+            fetcher.forget(url)
+            if identity is not None and breaker.blocked(url) is None:
+                # Only that identity was ejected, the page goes out again as another one
+                logger.warning(f"CAPTCHA page for {batch_query.query!r} as {identity.name}, retrying")
+                return [self._task(batch_query, page_num)]
+            return self._source_failed(batch_query, page_num, source, "CAPTCHA page", blocked=kind)
+        if kind in (OK, EMPTY) and items is not None:
+            breaker.record_success(url)
+        if items is None:
+            return self._source_failed(batch_query, page_num, source, "Not a search response")
+
+        # Pages can overlap when new ads are posted mid-search
+        new_items = []
+        for item in items:
+            key = listing_key(item) or id(item)
+            if key not in batch_query.seen:
+                batch_query.seen.add(key)
+                new_items.append(item)
+
+        enricher = self.scraper.enricher
+        if enricher is not None and new_items:
+            # Runs on the scheduler's worker, the detail pages themselves are fetched concurrently
+            enricher.enrich_page(new_items, headers_factory=lambda: self.scraper.request_headers("html"))
+
+        with self._lock:
+            offset = batch_query.total_listings
+            batch_query.total_listings += len(new_items)
+            batch_query.pages_done = page_num
+            self.pages_fetched += 1
+        logger.info(f"Batch query {batch_query.query!r}: {len(new_items)} listings on page {page_num}")
+
+        more = has_next_page and page_num < self.pages
+        store = self.scraper.store
+        if store is not None:
+            new_for_query = store.upsert(batch_query.query, new_items, seen_at=self.started_at, offset=offset)
+            if more and self.scraper.incremental and not new_for_query:
+                logger.info(f"Batch query {batch_query.query!r}: page {page_num} holds only known listings")
+                batch_query.stopped_early = True
+                more = False
+        elif new_items:
+            # Pages of one query are handled one after another, so its files see no concurrent writes
+            if batch_query.export is None:
+                batch_query.export = self.scraper.open_export(batch_query.query, self.output_format, self.compression)
+            batch_query.export.write_rows(new_items)
+
+        if more:
+            self._write_progress()
+            return [self._task(batch_query, page_num + 1)]
+        self._finish(batch_query, DONE)
+        return []
+
+    def _source_failed(self, batch_query, page_num, source, reason, blocked=None):
+        """Fall back from the API to the result pages, or fail the query; `blocked` is the kind of block, if any"""
+        if blocked is not None:
+            # A block covers the whole host, the result pages would get the same answer
+            batch_query.degraded = blocked
+        elif source == "api":
+            logger.warning(f"Search API failed for {batch_query.query!r} ({reason}), falling back to result pages")
+            batch_query.source = "html"
+            return [self._task(batch_query, page_num)]
+        self._fail(batch_query, page_num, reason)
+        return []
+
+    def _on_error(self, batch_query, page_num, source, error):
+        if isinstance(error, HostBlocked):
+            batch_query.degraded = error.kind
+        elif source == "api":
+            for follow_up in self._source_failed(batch_query, page_num, source, error):
+                self.scheduler.submit(follow_up)
+            return
+        self._fail(batch_query, page_num, error)
+
+    def _fail(self, batch_query, page_num, error):
+        logger.error(f"Batch query {batch_query.query!r} failed on page {page_num}: {str(error)}")
+        batch_query.error = str(error)
+        # Whatever earlier pages produced is still worth exporting
+        self._finish(batch_query, DONE if batch_query.total_listings else FAILED)
+
+    def _finish(self, batch_query, status):
+        try:
+            if batch_query.export is not None:
+                batch_query.files = batch_query.export.close()
+            elif status == DONE and batch_query.total_listings:
+                batch_query.files = self.scraper.export(batch_query.query, [], self.output_format, self.compression)
+        except Exception as e:
+            logger.error(f"Could not export results for {batch_query.query!r}: {str(e)}")
+            batch_query.error = str(e)
+            status = FAILED
+        batch_query.export = None
+
+        with self._lock:
+            batch_query.status = status
+            batch_query.finished_at = time.time()
+            self._remaining -= 1
+            last = self._remaining == 0
+        if last:
+            self._complete()
+        else:
+            self._write_progress()
+
+    def _complete(self):
+        self.finished_at = time.time()
+        self.status = DONE
+        self._write_progress()
+        throughput = self.throughput()
+        logger.info(f"Batch {self.id} finished: {throughput['pages']} pages, {throughput['listings']} listings "
+                    f"in {throughput['elapsed']}s ({throughput['pages_per_sec']} pages/s, "
+                    f"{throughput['listings_per_sec']} listings/s)")
+        self._done.set()
+
+    def _write_progress(self):
+        data = self.to_dict()
+        tmp_path = f"{self.progress_path}.tmp"
+        with self._write_lock:
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2, ensure_ascii=False)
+                os.replace(tmp_path, self.progress_path)
+            except OSError as e:
+                logger.warning(f"Could not write batch progress {self.progress_path}: {str(e)}")
@@ -0,0 +1,130 @@
+"""
+Scrape many OLX searches in one batch from the command line, without the Flask app.
+
+Usage:
+    python batch_cli.py "car cover" "bike helmet" --pages 3
+    python batch_cli.py --file queries.txt --format json --store listings.db
+
+A queries file has one query per line, optionally followed by a tab and a priority
+(lower runs first); blank lines and lines starting with # are skipped. Each query is
+exported to --output-dir (static/downloads by default) as soon as it finishes, next to
+the batch's progress file.
+"""
+import argparse
+import logging
+import os
+
+from batch import Batch, BatchQuery
+from blocking import CircuitBreaker
+from enrichment import DetailEnricher
+from exporters import check_available
+from fetcher import PageFetcher
+from http_cache import HttpCache
+from jobs import DONE
+from parsers import LazyParserBackend
+from scheduler import FetchScheduler
+from scraper import DEFAULT_BASE_URL, DEFAULT_EXPORT_DIR, OLXScraper, configure_logging
+from store import ListingStore
+
+
+def read_queries(path, default_priority=0):
+    """Read a queries file: one query per line, optionally followed by a tab and a priority"""
+    queries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            query, _, priority = line.partition('\t')
+            queries.append(BatchQuery(query.strip(), int(priority) if priority.strip() else default_priority))
+    return queries
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Scrape many OLX searches through one shared scheduler")
+    parser.add_argument("queries", nargs="*", help="Search queries")
+    parser.add_argument("--file", "-f", help="File with one query per line")
+    parser.add_argument("--pages", type=int, default=3, help="Maximum pages per query")
+    parser.add_argument("--format", default="both",
+                        help="json, csv, ndjson, parquet, both (JSON and CSV) or a comma-separated list")
+    parser.add_argument("--compression", choices=["gzip", "zstd"], help="Compress the exported files")
+    parser.add_argument("--priority", type=int, default=0, help="Priority of the queries, lower runs first")
+    parser.add_argument("--output-dir", default=DEFAULT_EXPORT_DIR, help="Write the files and the progress file here")
+    parser.add_argument("--base-url", default=os.environ.get("OLX_BASE_URL", DEFAULT_BASE_URL))
+    parser.add_argument("--no-api", action="store_true", help="Skip the JSON search API, start with the HTML pages")
+    parser.add_argument("--parser", default=os.environ.get("OLX_PARSER", "auto"),
+                        help="HTML parser backend: selectolax, lxml, html.parser or auto")
+    parser.add_argument("--store", help="Keep the listings in this SQLite store; exports then hold all of the query's")
+    parser.add_argument("--incremental", action="store_true",
+                        help="With --store, stop a query at its first page with nothing new")
+    parser.add_argument("--enrich", action="store_true", help="Add the detail-page fields of every listing")
+    parser.add_argument("--http-cache", help="Cache raw responses in this directory")
+    parser.add_argument("--rate", type=float, default=1.0, help="Requests per second per host")
+    parser.add_argument("--concurrency", type=int, default=3, help="Requests in flight per host")
+    parser.add_argument("--workers", type=int, default=4, help="Scheduler threads fetching pages")
+    parser.add_argument("--retries", type=int, default=3, help="Retries of a page on connection errors, 429 and 5xx")
+    parser.add_argument("--log-level", default="INFO", help="DEBUG, INFO, WARNING or ERROR")
+    parser.add_argument("--log-file", default="scraper.log", help="Also log to this file")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    queries = [BatchQuery(query, args.priority) for query in args.queries]
+    if args.file:
+        queries.extend(read_queries(args.file, args.priority))
+    if not queries:
+        parser.error("no queries given")
+    if args.pages < 1:
+        parser.error("--pages must be at least 1")
+    try:
+        check_available(args.format, args.compression)
+    except ValueError as e:
+        parser.error(str(e))
+
+    configure_logging(args.log_file, getattr(logging, args.log_level.upper(), logging.INFO))
+
+    fetcher = PageFetcher(
+        max_concurrency=args.concurrency,
+        rate=args.rate,
+        breaker=CircuitBreaker(),
+        http_cache=HttpCache(args.http_cache) if args.http_cache else None
+    )
+    scheduler = FetchScheduler(fetcher, workers=args.workers, max_retries=args.retries)
+    store = ListingStore(args.store) if args.store else None
+    # Batches never fall back to Playwright, so no browser pool
+    scraper = OLXScraper(
+        fetcher=fetcher,
+        parser=LazyParserBackend(args.parser),
+        use_api=not args.no_api,
+        store=store,
+        incremental=args.incremental,
+        base_url=args.base_url,
+        enricher=DetailEnricher(fetcher, store=store) if args.enrich else None,
+        export_dir=args.output_dir
+    )
+
+    try:
+        batch = Batch(queries, args.pages, args.format, args.compression, progress_dir=args.output_dir)
+        batch.start(scraper, scheduler)
+        batch.wait()
+    finally:
+        scheduler.close()
+        if store is not None:
+            store.close()
+        fetcher.close()
+
+    for batch_query in batch.queries:
+        files = ", ".join(os.path.join(args.output_dir, f["path"]) for f in batch_query.files) or "-"
+        print(f"{batch_query.status:<9} {batch_query.total_listings:>5} listings  {batch_query.query}  {files}")
+    throughput = batch.throughput()
+    print(f"{throughput['pages']} pages, {throughput['listings']} listings in {throughput['elapsed']}s: "
+          f"{throughput['pages_per_sec']} pages/s, {throughput['listings_per_sec']} listings/s")
+    print(f"Progress file: {batch.progress_path}")
+    return 0 if all(batch_query.status == DONE for batch_query in batch.queries) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
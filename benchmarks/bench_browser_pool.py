@@ -0,0 +1,57 @@
+"""
+Measure Playwright startup and per-search cost, one-off browser vs BrowserPool.
+
+Needs the Firefox build for Playwright (`playwright install firefox`). Run from the
+repository root:
+    python benchmarks/bench_browser_pool.py --searches 5 --pages 1
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper import OLXScraper, USER_AGENTS  # noqa: E402
+from browser_pool import BrowserPool  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+
+def run_searches(server, searches, pages, pool=None):
+    timings = []
+    for _ in range(searches):
+        scraper = OLXScraper(browser_pool=pool)
+        scraper.base_url = server.base_url
+        start = time.perf_counter()
+        listings = sum(len(items) for items in scraper._scrape_with_playwright(
+            f"{server.base_url}/items/q-car-cover", pages))
+        timings.append(time.perf_counter() - start)
+    return timings, listings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--searches", type=int, default=5)
+    parser.add_argument("--pages", type=int, default=1)
+    args = parser.parse_args()
+
+    with StubServer() as server:
+        one_off, listings = run_searches(server, args.searches, args.pages)
+
+        pool = BrowserPool(base_url=server.base_url, user_agents=USER_AGENTS)
+        try:
+            pooled, _ = run_searches(server, args.searches, args.pages, pool=pool)
+            stats = pool.stats()
+        finally:
+            pool.close()
+
+    print(f"{listings} listings per search, {args.searches} searches of {args.pages} page(s)")
+    print(f"one-off  first {one_off[0]:.2f}s  mean {sum(one_off) / len(one_off):.2f}s")
+    print(f"pooled   first {pooled[0]:.2f}s  mean of warm searches "
+          f"{sum(pooled[1:]) / max(len(pooled) - 1, 1):.2f}s")
+    print(f"pool     launches {stats['launches']} ({stats['launch_seconds']:.2f}s), "
+          f"contexts {stats['contexts_created']} ({stats['warmup_seconds']:.2f}s warmup)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compare the listing data sources on the saved fixtures: search API JSON, embedded state, DOM.
+
+Checks the JSON sources agree with DOM parsing of the same page on every card field
+they share and carry the typed fields, then reports time per page of each source.
+Run from the repository root:
+    python benchmarks/bench_data_sources.py --repeat 50
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_sources import normalize_ad, parse_api_listings, parse_state_listings  # noqa: E402
+from parsers import get_parser_backend  # noqa: E402
+from records import TYPED_FIELDS, normalize_card  # noqa: E402
+from stub_server import load_fixture  # noqa: E402
+
+BASE_URL = "https://www.olx.in"
+# URLs are compared through their ad id, the slug before it is not derivable from the title
+SHARED_FIELDS = ["title", "price", "location", "image", "ad_id", "price_value"]
+
+
+def from_api(body):
+    return [normalize_ad(ad, BASE_URL) for ad in parse_api_listings(json.loads(body))]
+
+
+def from_state(html):
+    return [normalize_ad(ad, BASE_URL) for ad in parse_state_listings(html)]
+
+
+def from_dom(backend, html):
+    document = backend.parse(html)
+    _, listings = backend.find_listings(document)
+    return [normalize_card(backend.extract(listing, BASE_URL)) for listing in listings]
+
+
+def check(name, listings, reference):
+    if len(listings) != len(reference):
+        sys.exit(f"{name}: {len(listings)} listings, DOM found {len(reference)}")
+    for item, expected in zip(listings, reference):
+        for field in SHARED_FIELDS:
+            if item[field] != expected[field]:
+                sys.exit(f"{name}: {field} {item[field]!r} != DOM {expected[field]!r}")
+        missing = [field for field in TYPED_FIELDS if item[field] is None]
+        if missing:
+            sys.exit(f"{name}: typed fields missing on {item['url']}: {missing}")
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    html = load_fixture("search_page_state.html").decode("utf-8")
+    api_body = load_fixture("search_api_page.json").decode("utf-8")
+    backend = get_parser_backend()
+
+    # Without the state blob the page must fall through to DOM parsing
+    if parse_state_listings(load_fixture("search_page.html").decode("utf-8")) is not None:
+        sys.exit("state parser found listings on a page without embedded state")
+
+    reference = from_dom(backend, html)
+    if any(item["ad_id"] is None for item in reference):
+        sys.exit("DOM listings without an ad id in their URL")
+    check("search API", from_api(api_body), reference)
+    check("embedded state", from_state(html), reference)
+
+    results = [
+        ("search API", timed(lambda: from_api(api_body), args.repeat)),
+        ("embedded state", timed(lambda: from_state(html), args.repeat)),
+        (f"DOM ({backend.name})", timed(lambda: from_dom(backend, html), args.repeat))
+    ]
+    print(f"{len(reference)} listings per page, all sources agree")
+    for name, per_page in results:
+        print(f"{name:<22} {per_page * 1000:7.2f} ms/page")
+
+
+if __name__ == "__main__":
+    main()
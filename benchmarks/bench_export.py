@@ -0,0 +1,87 @@
+"""
+Compare the streaming export writers with building the whole result set in memory.
+
+Writes N synthetic listings from a generator through every available format and
+reports time and Python heap peak (measured in separate runs); the in-memory baseline materializes the list and
+json.dumps it like the old export did. Run from the repository root:
+    python benchmarks/bench_export.py --listings 100000 --compression gzip
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exporters import EXPORT_FORMATS, ExportSession  # noqa: E402
+
+
+def synthetic_listings(count):
+    for i in range(count):
+        yield {
+            "title": f"Car cover waterproof model {i}",
+            "price": f"₹ {(i % 900 + 100) * 100:,}",
+            "location": "Koramangala, Bengaluru",
+            "date": "Today",
+            "seller": "N/A",
+            "url": f"https://www.olx.in/item/car-cover-waterproof-iid-{1700000000 + i}",
+            "image": f"https://apollo.olx.in/v1/files/{1700000000 + i}-IN/image;s=300x600",
+            "ad_id": str(1700000000 + i),
+            "price_value": (i % 900 + 100) * 100,
+            "posted_at": "2024-03-01T10:00:00+05:30",
+            "locality": "Koramangala",
+            "city": "Bengaluru",
+            "latitude": 12.9,
+            "longitude": 77.6
+        }
+
+
+def measure(fn):
+    """Time one untraced run, then take the heap peak of a second, traced run"""
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--listings", type=int, default=100000)
+    parser.add_argument("--compression", choices=["gzip", "zstd"])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        def in_memory():
+            rows = list(synthetic_listings(args.listings))
+            with open(os.path.join(directory, "baseline.json"), "w", encoding="utf-8") as f:
+                json.dump(rows, f, indent=2, ensure_ascii=False)
+            return len(rows)
+
+        _, elapsed, peak = measure(in_memory)
+        print(f"{'in-memory json':<16} {elapsed:6.2f}s  heap peak {peak / 2**20:7.1f} MiB")
+
+        for name in EXPORT_FORMATS:
+            def streaming():
+                session = ExportSession(os.path.join(directory, f"export_{name}"), name, args.compression)
+                session.write_rows(synthetic_listings(args.listings))
+                return session.close()
+
+            try:
+                files, elapsed, peak = measure(streaming)
+            except (ValueError, ImportError) as e:
+                print(f"{name:<16} skipped: {str(e)}")
+                continue
+            size = os.path.getsize(os.path.join(directory, files[0]["path"]))
+            print(f"{name:<16} {elapsed:6.2f}s  heap peak {peak / 2**20:7.1f} MiB  "
+                  f"{args.listings / elapsed:9.0f} listings/s  {size / 2**20:7.1f} MiB on disk")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Microbenchmark of listing extraction over the saved HTML fixtures.
+
+Compares the original per-field selector cascade (one select_one per selector per
+field) with the compiled single-pass ListingExtractor, checks both produce the same
+listings (on a fresh extractor per fixture, and on one shared across all of them and
+a page whose only card needs a fallback selector), and reports listings/sec. Run from the repository root:
+    python benchmarks/bench_extraction.py --repeat 20
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import FIELD_SELECTORS, IMAGE_SELECTORS, LISTING_SELECTORS, ListingExtractor  # noqa: E402
+from stub_server import FIXTURES_DIR  # noqa: E402
+
+BASE_URL = "https://www.olx.in"
+
+# A card without itemTitle, whose title only the h2 fallback finds, then a page of normal
+# cards that also carry an h2 badge: the badge must not become their title
+ODD_CARD_PAGE = """<ul><li data-aut-id="itemBox"><a href="/item/odd-iid-1"><h2>Odd title</h2>
+<span data-aut-id="itemPrice">₹ 1,000</span></a></li></ul>"""
+BADGED_CARDS_PAGE = "<ul>" + "".join(
+    f"""<li data-aut-id="itemBox"><a href="/item/real-iid-{i}"><h2>Featured</h2>
+<span data-aut-id="itemTitle">Real title {i}</span><span data-aut-id="itemPrice">₹ {i},000</span></a></li>"""
+    for i in range(3)
+) + "</ul>"
+
+
+def extract_with_selectors(element, selectors):
+    for selector in selectors:
+        found = element.select_one(selector)
+        if found:
+            return found.get_text().strip()
+    return None
+
+
+def legacy_extract(soup):
+    """The extraction loop as it was before the compiled extractor"""
+    results = []
+    for selector in LISTING_SELECTORS:
+        listings = soup.select(selector)
+        if not listings:
+            continue
+        for listing in listings:
+            item_data = {}
+            for field, selectors in FIELD_SELECTORS.items():
+                value = extract_with_selectors(listing, selectors)
+                item_data[field] = value if value else "N/A"
+            url_elem = listing.select_one('a')
+            if url_elem and 'href' in url_elem.attrs:
+                href = url_elem['href']
+                item_data["url"] = BASE_URL + href if href.startswith('/') else href
+            else:
+                item_data["url"] = "N/A"
+            img_elem = None
+            for img_selector in IMAGE_SELECTORS:
+                img_elem = listing.select_one(img_selector)
+                if img_elem and 'src' in img_elem.attrs:
+                    break
+            item_data["image"] = img_elem['src'] if img_elem and 'src' in img_elem.attrs else "N/A"
+            results.append(item_data)
+        break
+    return results
+
+
+def compiled_extract(extractor, soup):
+    _, listings = extractor.find_listings(soup)
+    return [extractor.extract(listing, BASE_URL) for listing in listings]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    soups = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "search_page*.html"))):
+        with open(path, encoding="utf-8") as f:
+            soups.append(BeautifulSoup(f.read(), "html.parser"))
+
+    # Each fixture on a fresh extractor, then all of them in turn on one shared extractor,
+    # the way the app uses it, so selectors promoted on one layout cannot leak into another
+    expected = [legacy_extract(soup) for soup in soups]
+    for soup, listings in zip(soups, expected):
+        assert listings, "Fixture has no listings"
+        if compiled_extract(ListingExtractor(), soup) != listings:
+            sys.exit("Compiled extractor output differs from the legacy extractor")
+    extractor = ListingExtractor()
+    for _ in range(2):
+        for soup, listings in zip(soups, expected):
+            if compiled_extract(extractor, soup) != listings:
+                sys.exit("Shared extractor output differs from the legacy extractor after other layouts")
+    for html in (ODD_CARD_PAGE, BADGED_CARDS_PAGE):
+        soup = BeautifulSoup(html, "html.parser")
+        if compiled_extract(extractor, soup) != legacy_extract(soup):
+            sys.exit("Shared extractor output differs from the legacy extractor after a fallback won")
+
+    for name, run in (
+        ("legacy", legacy_extract),
+        ("compiled", lambda soup: compiled_extract(extractor, soup)),
+    ):
+        listings = 0
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for soup in soups:
+                listings += len(run(soup))
+        elapsed = time.perf_counter() - start
+        print(f"{name:<9} {listings} listings in {elapsed:.2f}s ({listings / elapsed:,.0f} listings/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Compare the old one-connection-per-page sequential loop with PageFetcher.
+
+Run from the repository root:
+    python benchmarks/bench_fetcher.py --pages 10 --latency 0.2
+"""
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fetcher import PageFetcher  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+
+def sequential(urls):
+    for url in urls:
+        requests.get(url, timeout=30).text
+
+
+def pooled(urls, concurrency, rate):
+    fetcher = PageFetcher(max_concurrency=concurrency, rate=rate, burst=concurrency)
+    try:
+        for _, response, error in fetcher.fetch_ordered(urls):
+            if error is not None:
+                raise error
+    finally:
+        fetcher.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub server latency in seconds")
+    parser.add_argument("--concurrency", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=0, help="requests/sec per host, 0 disables the limit")
+    args = parser.parse_args()
+
+    with StubServer(latency=args.latency) as server:
+        urls = [f"{server.base_url}/items/q-car-cover?page={n}" for n in range(1, args.pages + 1)]
+        for name, run in (
+            ("sequential", lambda: sequential(urls)),
+            ("pooled", lambda: pooled(urls, args.concurrency, args.rate)),
+        ):
+            start = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - start
+            print(f"{name:<12} {args.pages} pages in {elapsed:.2f}s ({args.pages / elapsed:.1f} pages/s)")
+
+
+if __name__ == "__main__":
+    main()
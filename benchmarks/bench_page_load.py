@@ -0,0 +1,75 @@
+"""
+Compare Playwright page loads with and without resource blocking.
+
+Reports bytes loaded per search (the difference is the bytes saved by blocking) and
+the per-page load time. Needs the Firefox build for Playwright. Defaults to the local
+stub server; pass --base-url https://www.olx.in to measure the live site.
+    python benchmarks/bench_page_load.py --pages 3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scraper import OLXScraper, USER_AGENTS  # noqa: E402
+from browser_pool import BrowserPool  # noqa: E402
+from fetcher import PageFetcher  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+
+def measure(base_url, pages, block_resources):
+    pool = BrowserPool(base_url=base_url, user_agents=USER_AGENTS,
+                       block_resources=block_resources, measure_bytes=True)
+    scraper = OLXScraper(fetcher=PageFetcher(rate=0), browser_pool=pool)
+    scraper.base_url = base_url
+    page_times = []
+    try:
+        # The first search warms the context up, the second one is measured
+        for _ in scraper._scrape_with_playwright(f"{base_url}/items/q-car-cover", 1):
+            pass
+        warm = pool.stats()
+        start = time.perf_counter()
+        for _ in scraper._scrape_with_playwright(f"{base_url}/items/q-car-cover", pages):
+            page_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+        stats = pool.stats()
+    finally:
+        pool.close()
+    return {
+        "bytes": stats["loaded_bytes"] - warm["loaded_bytes"],
+        "requests": stats["loaded_requests"] - warm["loaded_requests"],
+        "blocked": stats["blocked_requests"] - warm["blocked_requests"],
+        "page_times": page_times
+    }
+
+
+def report(name, result):
+    times = result["page_times"]
+    mean = sum(times) / len(times) if times else 0.0
+    print(f"{name:<10} {result['bytes'] / 1024:8.1f} KiB in {result['requests']} requests, "
+          f"{result['blocked']} blocked, {mean:.2f}s per page over {len(times)} pages")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--base-url", default=None)
+    args = parser.parse_args()
+
+    if args.base_url:
+        before = measure(args.base_url, args.pages, block_resources=False)
+        after = measure(args.base_url, args.pages, block_resources=True)
+    else:
+        with StubServer() as server:
+            before = measure(server.base_url, args.pages, block_resources=False)
+            after = measure(server.base_url, args.pages, block_resources=True)
+
+    report("unblocked", before)
+    report("blocked", after)
+    print(f"saved      {(before['bytes'] - after['bytes']) / 1024:8.1f} KiB per search")
+
+
+if __name__ == "__main__":
+    main()
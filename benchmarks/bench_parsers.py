@@ -0,0 +1,95 @@
+"""
+Compare the HTML parser backends on the saved fixture corpus.
+
+Checks every available backend produces exactly the same listings as html.parser,
+then reports parse+extract time and peak memory per page. Memory is measured in a
+fresh subprocess per backend: the RSS growth covers C-level allocations (lexbor,
+libxml2) that tracemalloc cannot see. Run from the repository root:
+    python benchmarks/bench_parsers.py --repeat 20
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsers import BACKEND_PREFERENCE, get_parser_backend  # noqa: E402
+from stub_server import FIXTURES_DIR  # noqa: E402
+
+BASE_URL = "https://www.olx.in"
+
+
+def load_pages():
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "search_page*.html"))):
+        with open(path, encoding="utf-8") as f:
+            pages.append(f.read())
+    return pages
+
+
+def parse_and_extract(backend, html):
+    document = backend.parse(html)
+    _, listings = backend.find_listings(document)
+    return [backend.extract(listing, BASE_URL) for listing in listings], backend.has_next_page(document)
+
+
+def measure_memory(name):
+    """Child process mode: print peak memory of parsing the largest page once"""
+    backend = get_parser_backend(name)
+    html = max(load_pages(), key=len)
+    # Warm up on a small document so one-time imports and caches are not counted
+    parse_and_extract(backend, "<ul><li>warm up</li></ul>")
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    result = parse_and_extract(backend, html)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline
+    print(json.dumps({"rss_kib": rss_growth, "traced_kib": traced_peak // 1024, "listings": len(result[0])}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--memory-child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.memory_child:
+        measure_memory(args.memory_child)
+        return
+
+    pages = load_pages()
+    reference_backend = get_parser_backend("html.parser")
+    reference = [parse_and_extract(reference_backend, html) for html in pages]
+
+    for name in reversed(BACKEND_PREFERENCE):
+        backend = get_parser_backend(name)
+        if backend.name != name:
+            print(f"{name:<12} not installed")
+            continue
+        if [parse_and_extract(backend, html) for html in pages] != reference:
+            sys.exit(f"{name} output differs from html.parser")
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for html in pages:
+                parse_and_extract(backend, html)
+        per_page = (time.perf_counter() - start) / (args.repeat * len(pages))
+
+        child = subprocess.run(
+            [sys.executable, __file__, "--memory-child", name],
+            capture_output=True, text=True, check=True
+        )
+        memory = json.loads(child.stdout.strip().splitlines()[-1])
+        print(f"{name:<12} {per_page * 1000:7.2f} ms/page  peak RSS +{memory['rss_kib']} KiB  "
+              f"Python heap peak {memory['traced_kib']} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Count browser round trips and wall time per page for Playwright extraction.
+
+Compares the original per-field ElementHandle calls (query_selector, inner_text,
+get_attribute for every field of every listing) with the single in-page evaluate
+of extract_in_page. Needs the Firefox build for Playwright. Serves the saved
+fixture through the local stub server. Run from the repository root:
+    python benchmarks/bench_playwright_extraction.py --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+
+from playwright.sync_api import sync_playwright
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraction import (  # noqa: E402
+    AdaptiveSchema, FIELD_SELECTORS, IMAGE_SELECTORS, LISTING_SELECTORS, extract_in_page
+)
+from stub_server import StubServer  # noqa: E402
+
+BASE_URL = "https://www.olx.in"
+
+
+class Counter:
+    """Wraps a Page or ElementHandle and counts every call that crosses into the browser"""
+
+    def __init__(self, target, counts):
+        self._target = target
+        self._counts = counts
+
+    def _call(self, name, *args):
+        self._counts["round_trips"] += 1
+        result = getattr(self._target, name)(*args)
+        if isinstance(result, list):
+            return [Counter(r, self._counts) for r in result]
+        if result is not None and hasattr(result, "query_selector"):
+            return Counter(result, self._counts)
+        return result
+
+    def query_selector_all(self, selector):
+        return self._call("query_selector_all", selector)
+
+    def query_selector(self, selector):
+        return self._call("query_selector", selector)
+
+    def inner_text(self):
+        return self._call("inner_text")
+
+    def get_attribute(self, name):
+        return self._call("get_attribute", name)
+
+    def evaluate(self, expression, arg=None):
+        return self._call("evaluate", expression, arg)
+
+
+def text_with_selectors(element, selectors):
+    for selector in selectors:
+        found = element.query_selector(selector)
+        if found:
+            return found.inner_text().strip()
+    return None
+
+
+def legacy_extract(page):
+    """The per-element extraction loop as it was before extract_in_page"""
+    listings = []
+    for selector in LISTING_SELECTORS:
+        listings = page.query_selector_all(selector)
+        if listings:
+            break
+    results = []
+    for listing in listings:
+        item_data = {}
+        for field, selectors in FIELD_SELECTORS.items():
+            value = text_with_selectors(listing, selectors)
+            item_data[field] = value if value else "N/A"
+        url_elem = listing.query_selector('a')
+        if url_elem:
+            href = url_elem.get_attribute('href')
+            item_data["url"] = BASE_URL + href if href and href.startswith('/') else href
+        else:
+            item_data["url"] = "N/A"
+        img_url = None
+        for selector in IMAGE_SELECTORS:
+            img_elem = listing.query_selector(selector)
+            if img_elem:
+                img_url = img_elem.get_attribute('src')
+                if img_url:
+                    break
+        item_data["image"] = img_url if img_url else "N/A"
+        results.append(item_data)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with StubServer() as server, sync_playwright() as playwright:
+        browser = playwright.firefox.launch(headless=True)
+        page = browser.new_page()
+        page.goto(f"{server.base_url}/items/q-car-cover", wait_until="domcontentloaded")
+
+        expected = legacy_extract(page)
+        _, batched = extract_in_page(page, AdaptiveSchema(), BASE_URL)
+        if batched != expected:
+            sys.exit("Batched extraction differs from the per-element extraction")
+
+        for name, run in (
+            ("per-element", lambda counted: legacy_extract(counted)),
+            ("batched", lambda counted: extract_in_page(counted, AdaptiveSchema(), BASE_URL)),
+        ):
+            counts = {"round_trips": 0}
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                run(Counter(page, counts))
+            elapsed = (time.perf_counter() - start) / args.repeat
+            print(f"{name:<12} {counts['round_trips'] // args.repeat:5d} round trips/page  "
+                  f"{elapsed * 1000:8.1f} ms/page  ({len(expected)} listings)")
+
+        browser.close()
+
+
+if __name__ == "__main__":
+    main()
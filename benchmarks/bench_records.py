@@ -0,0 +1,97 @@
+"""
+Measure listing records against plain dicts on a large synthetic batch.
+
+Normalizes N raw result cards (display strings like "₹ 1,500", "Today") into Listing
+records, then reports the Python heap held by N listings as dicts, as Listing records
+and as one ListingBatch, and the CSV/JSON write speed of rows against batches.
+Run from the repository root:
+    python benchmarks/bench_records.py --listings 100000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exporters import EXPORT_FIELDS, ExportSession  # noqa: E402
+from records import ListingBatch, normalize_card  # noqa: E402
+
+PRICES = ["₹ {:,}", "₹ {:,}", "₹ {:,}", "₹ 1.5 Lakh", "N/A"]
+DATES = ["Today", "Yesterday", "3 days ago", "2 weeks ago", "Mar 01", "N/A"]
+LOCATIONS = ["Koramangala, Bengaluru", "Andheri West, Mumbai", "Salt Lake, Kolkata", "Bengaluru", "N/A"]
+NOW = datetime(2024, 3, 20, 12, 0, tzinfo=timezone.utc)
+
+
+def synthetic_cards(count):
+    """Result cards as the extractors return them: display strings only"""
+    for i in range(count):
+        yield {
+            "title": f"Car cover waterproof model {i}",
+            "price": PRICES[i % len(PRICES)].format((i % 900 + 100) * 100),
+            "location": LOCATIONS[i % len(LOCATIONS)],
+            "date": DATES[i % len(DATES)],
+            "seller": "N/A",
+            "url": f"https://www.olx.in/item/car-cover-waterproof-iid-{1700000000 + i}",
+            "image": f"https://apollo.olx.in/v1/files/{1700000000 + i}-IN/image;s=300x600"
+        }
+
+
+def retained(build):
+    """(result, MiB of Python heap still held by the result once it is built)"""
+    tracemalloc.start()
+    result = build()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, round(current / 2**20, 1)
+
+
+def run(count):
+    results = {"listings": count}
+    cards = list(synthetic_cards(count))
+
+    start = time.perf_counter()
+    listings = [normalize_card(card, NOW) for card in cards]
+    results["normalize_per_sec"] = round(count / (time.perf_counter() - start))
+    del cards
+
+    # Each shape is built from fresh cards, so its strings count towards it
+    _, results["dicts_mib"] = retained(lambda: [normalize_card(card, NOW).to_dict() for card in synthetic_cards(count)])
+    _, results["records_mib"] = retained(lambda: [normalize_card(card, NOW) for card in synthetic_cards(count)])
+    _, results["batch_mib"] = retained(lambda: ListingBatch.from_listings(
+        (normalize_card(card, NOW) for card in synthetic_cards(count)), EXPORT_FIELDS))
+    start = time.perf_counter()
+    batch = ListingBatch.from_listings(listings, EXPORT_FIELDS)
+    results["batch_build_per_sec"] = round(count / (time.perf_counter() - start))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name in ("csv", "json"):
+            for shape, write in (("rows", lambda session: session.write_rows(listings)),
+                                 ("batch", lambda session: session.write_batch(batch))):
+                session = ExportSession(os.path.join(directory, f"{name}_{shape}"), name)
+                start = time.perf_counter()
+                write(session)
+                session.close()
+                results[f"{name}_{shape}_per_sec"] = round(count / (time.perf_counter() - start))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--listings", type=int, default=100000)
+    args = parser.parse_args()
+
+    results = run(args.listings)
+    print(f"{args.listings} listings, normalized at {results['normalize_per_sec']:,} cards/s")
+    for name in ("dicts", "records", "batch"):
+        print(f"{name:<8} {results[f'{name}_mib']:7.1f} MiB held")
+    for name in ("csv", "json"):
+        print(f"{name:<5} rows {results[f'{name}_rows_per_sec']:9,} listings/s  "
+              f"batch {results[f'{name}_batch_per_sec']:9,} listings/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Measure cold start: how long a fresh process takes to import the app or the scraper, and its RSS.
+
+Each entry point is imported in new interpreters, several times, reporting the median
+wall time of the whole process (interpreter start included), the median time spent in
+the import itself and the peak RSS. With gunicorn installed, the app is also served by
+two gthread workers with and without preload_app, reporting the time until the first
+response and each worker's RSS and PSS (its share of pages held with other processes).
+Point --root at another checkout (e.g. a `git worktree` of an older commit) to measure
+it the same way; entry points it lacks are skipped. Run from the repository root:
+    python benchmarks/bench_startup.py --runs 7
+    python benchmarks/bench_startup.py --root /tmp/olx-before
+"""
+import argparse
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What each case imports, and the modules reported as loaded or not once it has
+TARGETS = {"app": "app", "scraper": "scraper", "cli": "cli"}
+HEAVY_MODULES = ["flask", "playwright.sync_api", "bs4", "lxml", "selectolax", "soupsieve", "requests"]
+
+# Peak RSS is read from /proc/self/status: getrusage's ru_maxrss survives fork and exec, so a
+# child of a large parent (run_benchmarks.py) would report the parent's peak instead of its own
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+with open("/proc/self/status", encoding="ascii") as f:
+    status = dict(line.split(":", 1) for line in f if ":" in line)
+print(elapsed, int(status["VmHWM"].split()[0]), ",".join(loaded))
+"""
+
+
+def isolated_env(root):
+    """Environment in which importing the app touches none of the checkout's data files"""
+    env = dict(os.environ)
+    env.update({
+        "PYTHONPATH": root,
+        "OLX_STORE_PATH": "",
+        "OLX_HTTP_CACHE_DIR": "",
+        "OLX_WATCHES_PATH": "",
+        "OLX_WATCH_EVENT_LOG": ""
+    })
+    return env
+
+
+def import_once(root, module, cwd):
+    """(seconds of process wall time, seconds in the import, peak RSS in MiB, heavy modules loaded)"""
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+                            cwd=cwd, env=isolated_env(root), capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - start
+    elapsed, maxrss, loaded = (output.stdout.strip().splitlines()[-1].split(" ") + [""])[:3]
+    return wall, float(elapsed), int(maxrss) / 1024, [name for name in loaded.split(",") if name]
+
+
+def bench_imports(root, runs):
+    results = {}
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, module in TARGETS.items():
+            if not os.path.exists(os.path.join(root, f"{module}.py")):
+                continue
+            samples = [import_once(root, module, cwd) for _ in range(runs)]
+            results[f"{name}_process_ms"] = round(statistics.median(s[0] for s in samples) * 1000, 1)
+            results[f"{name}_import_ms"] = round(statistics.median(s[1] for s in samples) * 1000, 1)
+            results[f"{name}_rss_mib"] = round(statistics.median(s[2] for s in samples), 1)
+            results[f"{name}_loads"] = samples[-1][3]
+    return results
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def memory_kib(pid):
+    """(RSS, PSS) of a process in KiB, from /proc"""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+        for line in f:
+            key, _, rest = line.partition(":")
+            if key in ("Rss", "Pss"):
+                values[key] = int(rest.split()[0])
+    return values.get("Rss", 0), values.get("Pss", 0)
+
+
+def worker_pids(master_pid):
+    with open(f"/proc/{master_pid}/task/{master_pid}/children", encoding="ascii") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def bench_gunicorn(root, workers, preload):
+    """Serve the app with gunicorn; time to the first response, then each worker's memory"""
+    port = free_port()
+    env = isolated_env(root)
+    env.update({"OLX_PRELOAD": "1" if preload else "0", "WEB_CONCURRENCY": str(workers),
+                "OLX_BIND": f"127.0.0.1:{port}"})
+    config = os.path.join(root, "gunicorn.conf.py")
+    command = [sys.executable, "-m", "gunicorn", "--chdir", root, "app:app"]
+    if os.path.exists(config):
+        command[3:3] = ["-c", config]
+    else:
+        command[3:3] = ["--workers", str(workers), "--bind", f"127.0.0.1:{port}"] + (["--preload"] if preload else [])
+    with tempfile.TemporaryDirectory() as cwd:
+        start = time.perf_counter()
+        master = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                if master.poll() is not None:
+                    raise RuntimeError("gunicorn exited before serving")
+                try:
+                    requests.get(f"http://127.0.0.1:{port}/metrics", timeout=1).raise_for_status()
+                    break
+                except requests.RequestException:
+                    time.sleep(0.02)
+            first_response = time.perf_counter() - start
+            # Let every worker finish booting before reading their memory
+            deadline = time.monotonic() + 30
+            while len(worker_pids(master.pid)) < workers and time.monotonic() < deadline:
+                time.sleep(0.1)
+            time.sleep(1)
+            memory = [memory_kib(pid) for pid in worker_pids(master.pid)]
+        finally:
+            master.terminate()
+            master.wait(timeout=30)
+    prefix = "preload" if preload else "no_preload"
+    return {
+        f"{prefix}_first_response_ms": round(first_response * 1000, 1),
+        f"{prefix}_worker_rss_mib": round(statistics.mean(rss for rss, _ in memory) / 1024, 1),
+        f"{prefix}_worker_pss_mib": round(statistics.mean(pss for _, pss in memory) / 1024, 1)
+    }
+
+
+def run(runs=5, root=ROOT, workers=2):
+    results = bench_imports(root, runs)
+    if importlib.util.find_spec("gunicorn") is not None:
+        for preload in (False, True):
+            results.update(bench_gunicorn(root, workers, preload))
+    else:
+        results["gunicorn"] = "not installed"
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per entry point")
+    parser.add_argument("--root", default=ROOT, help="checkout to measure")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    args = parser.parse_args()
+
+    results = run(args.runs, os.path.abspath(args.root), args.workers)
+    for name in TARGETS:
+        if f"{name}_process_ms" in results:
+            print(f"{name:<8} process {results[f'{name}_process_ms']:7.1f} ms  import {results[f'{name}_import_ms']:7.1f} ms  "
+                  f"RSS {results[f'{name}_rss_mib']:6.1f} MiB  loads {', '.join(results[f'{name}_loads']) or '-'}")
+    if results.get("gunicorn") == "not installed":
+        print("gunicorn is not installed, worker boot and memory not measured")
+        return
+    for prefix in ("no_preload", "preload"):
+        print(f"{prefix:<10} first response {results[f'{prefix}_first_response_ms']:7.1f} ms  "
+              f"worker RSS {results[f'{prefix}_worker_rss_mib']:6.1f} MiB  PSS {results[f'{prefix}_worker_pss_mib']:6.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
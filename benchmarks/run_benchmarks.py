@@ -0,0 +1,453 @@
+"""
+Run the offline benchmark suite and write the results to a JSON file.
+
+Every case runs against the saved fixtures and the local stub server, never olx.in:
+extractors alone, the data sources, `_scrape_with_requests` end to end (with optional
+latency, error rate and CAPTCHA rate), detail-page enrichment, the HTTP response cache,
+the identity pool behind local stub proxies, export writing, listing records against
+dicts and columnar batches, cold start of each entry point, and the Flask endpoints under
+concurrent clients. Results go to benchmarks/results/<commit>.json by default; pass
+--compare with an earlier results file to see what changed. Run from the repository root:
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --cases requests,endpoints --latency 0.05 --error-rate 0.1
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/abc1234.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_data_sources import from_api, from_dom, from_state  # noqa: E402
+from bench_export import synthetic_listings  # noqa: E402
+from bench_parsers import load_pages, parse_and_extract  # noqa: E402
+from bench_records import run as run_records  # noqa: E402
+from bench_startup import run as run_startup  # noqa: E402
+from stub_server import StubProxy, StubServer, load_fixture  # noqa: E402
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+SEARCH_PATH = "/items/q-car-cover"
+
+
+def per_sec(count, elapsed):
+    return round(count / elapsed, 2) if elapsed else 0.0
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def bench_extractors(args):
+    """Parse and extract the saved search pages with every installed parser backend"""
+    from parsers import BACKEND_PREFERENCE, get_parser_backend
+
+    pages = load_pages()
+    results = {}
+    for name in BACKEND_PREFERENCE:
+        backend = get_parser_backend(name)
+        if backend.name != name:
+            continue
+        listings = 0
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for html in pages:
+                listings += len(parse_and_extract(backend, html)[0])
+        elapsed = time.perf_counter() - start
+        results[f"{name}_ms_per_page"] = round(elapsed * 1000 / (args.repeat * len(pages)), 3)
+        results[f"{name}_listings_per_sec"] = per_sec(listings, elapsed)
+    return results
+
+
+def bench_data_sources(args):
+    """Time per page of the search API JSON, the embedded state and the DOM"""
+    from parsers import get_parser_backend
+
+    html = load_fixture("search_page_state.html").decode("utf-8")
+    api_body = load_fixture("search_api_page.json").decode("utf-8")
+    backend = get_parser_backend()
+    results = {}
+    for name, run in (
+        ("api", lambda: from_api(api_body)),
+        ("state", lambda: from_state(html)),
+        ("dom", lambda: from_dom(backend, html)),
+    ):
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            run()
+        results[f"{name}_ms_per_page"] = round((time.perf_counter() - start) * 1000 / args.repeat, 3)
+    return results
+
+
+def bench_requests(args):
+    """OLXScraper._scrape_with_requests end to end against the stub server"""
+    from scraper import OLXScraper
+    from fetcher import PageFetcher
+    from parsers import get_parser_backend
+
+    with StubServer(latency=args.latency, error_rate=args.error_rate, captcha_rate=args.captcha_rate,
+                    seed=args.seed) as server:
+        fetcher = PageFetcher(max_concurrency=args.concurrency, rate=0, burst=args.concurrency)
+        scraper = OLXScraper(fetcher=fetcher, parser=get_parser_backend(), use_api=False,
+                             base_url=server.base_url)
+        pages = listings = incomplete = 0
+        start = time.perf_counter()
+        try:
+            for _ in range(args.searches):
+                search_pages = 0
+                for page_items in scraper._scrape_with_requests(f"{server.base_url}{SEARCH_PATH}", args.pages):
+                    search_pages += 1
+                    listings += len(page_items)
+                pages += search_pages
+                incomplete += search_pages < args.pages
+        finally:
+            fetcher.close()
+        elapsed = time.perf_counter() - start
+        return {
+            "searches": args.searches,
+            "pages": pages,
+            "listings": listings,
+            "incomplete_searches": incomplete,
+            "requests": server.requests,
+            "stub_errors": server.errors,
+            "stub_captchas": server.captchas,
+            "seconds": round(elapsed, 3),
+            "pages_per_sec": per_sec(pages, elapsed),
+            "listings_per_sec": per_sec(listings, elapsed)
+        }
+
+
+def bench_enrichment(args):
+    """
+    Searches without enrichment, then enriching each page only once the next has been
+    fetched (lookahead 0) and while it is (lookahead 1), then again with every detail known
+    """
+    from scraper import OLXScraper
+    from enrichment import DetailEnricher
+    from fetcher import PageFetcher
+    from parsers import get_parser_backend
+
+    results = {}
+    with StubServer(latency=args.latency) as server:
+        fetcher = PageFetcher(max_concurrency=args.concurrency, rate=0, burst=args.concurrency)
+        try:
+            # Every search finds the same ads again, so only the last run may reuse details
+            for name, enricher in (("plain", None), ("lookahead_0", DetailEnricher(fetcher, max_age=0, lookahead=0)),
+                                   ("lookahead_1", DetailEnricher(fetcher, max_age=0, lookahead=1)),
+                                   ("reused", DetailEnricher(fetcher))):
+                scraper = OLXScraper(fetcher=fetcher, parser=get_parser_backend(), use_api=False,
+                                     base_url=server.base_url, enricher=enricher)
+                if name == "reused":
+                    scraper.fetch("car cover", 1)
+                details_before = server.detail_requests
+                listings = 0
+                start = time.perf_counter()
+                for _ in range(args.searches):
+                    listings += len(scraper.fetch("car cover", args.pages))
+                elapsed = time.perf_counter() - start
+                results[f"{name}_seconds"] = round(elapsed, 3)
+                results[f"{name}_listings_per_sec"] = per_sec(listings, elapsed)
+                results[f"{name}_detail_requests"] = server.detail_requests - details_before
+        finally:
+            fetcher.close()
+    return results
+
+
+def bench_http_cache(args):
+    """
+    The same search pages fetched cold, then revalidated by ETag, then fresh under a
+    max-age override, then replayed offline
+    """
+    from fetcher import PageFetcher
+    from http_cache import HttpCache
+
+    results = {}
+    with StubServer(latency=args.latency, etag=True) as server, tempfile.TemporaryDirectory() as directory:
+        urls = [f"{server.base_url}{SEARCH_PATH}?page={n}" for n in range(1, args.pages * args.searches + 1)]
+        for name, max_age, offline in (("cold", 0, False), ("revalidated", 0, False), ("fresh", 3600, False),
+                                       ("offline", 0, True)):
+            cache = HttpCache(directory, max_age=max_age, offline=offline)
+            fetcher = PageFetcher(max_concurrency=args.concurrency, rate=0, http_cache=cache)
+            requests_before = server.requests
+            start = time.perf_counter()
+            try:
+                for _, response, error in fetcher.fetch_ordered(urls):
+                    if error is not None:
+                        raise error
+            finally:
+                fetcher.close()
+            elapsed = time.perf_counter() - start
+            stats = cache.stats()
+            results[f"{name}_pages_per_sec"] = per_sec(len(urls), elapsed)
+            results[f"{name}_requests"] = server.requests - requests_before
+            results[f"{name}_bytes_saved"] = stats["bytes_saved"]
+        results["disk_bytes"] = stats["size_bytes"]
+        results["body_bytes"] = len(server.body) * len(urls)
+    return results
+
+
+def bench_identities(args):
+    """
+    Pages per second through one stub proxy and through --identities of them, each
+    rate-limited to --identity-rate, then with a broken proxy and a blocked one added
+    """
+    from fetcher import PageFetcher
+    from identities import IdentityPool
+
+    results = {}
+    for name, healthy, faulty in (("one", 1, False), ("pool", args.identities, False),
+                                  ("faulty", args.identities, True)):
+        proxies = [StubProxy(f"proxy-{i}", latency=args.latency) for i in range(healthy)]
+        if faulty:
+            proxies += [StubProxy("broken", broken=True), StubProxy("blocked")]
+        with StubServer(blocked_via=("blocked",)) as server:
+            for proxy in proxies:
+                proxy.__enter__()
+            pool = IdentityPool.from_proxies([proxy.url for proxy in proxies])
+            fetcher = PageFetcher(max_concurrency=args.concurrency, rate=args.identity_rate, burst=1, identities=pool)
+            urls = [f"{server.base_url}{SEARCH_PATH}?page={n}" for n in range(1, args.pages * args.searches * 4 + 1)]
+            ok = 0
+            start = time.perf_counter()
+            try:
+                for _, response, error in fetcher.fetch_ordered(urls, window=args.concurrency * len(proxies)):
+                    ok += error is None and response.status_code == 200
+            finally:
+                fetcher.close()
+                for proxy in proxies:
+                    proxy.__exit__()
+            elapsed = time.perf_counter() - start
+            results[f"{name}_pages_per_sec"] = per_sec(len(urls), elapsed)
+            results[f"{name}_ok_pages"] = ok
+            if faulty:
+                stats = pool.stats()
+                results["faulty_ejected"] = sum(identity["state"] == "ejected" for identity in stats.values())
+                results["faulty_requests"] = server.requests
+    results["pages"] = len(urls)
+    return results
+
+
+def bench_export(args):
+    """Stream synthetic listings through every export writer that is installed"""
+    from exporters import EXPORT_FORMATS, ExportSession
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name in EXPORT_FORMATS:
+            start = time.perf_counter()
+            try:
+                session = ExportSession(os.path.join(directory, f"export_{name}"), name, args.compression)
+            except (ValueError, ImportError):
+                continue
+            session.write_rows(synthetic_listings(args.listings))
+            files = session.close()
+            elapsed = time.perf_counter() - start
+            results[f"{name}_listings_per_sec"] = per_sec(args.listings, elapsed)
+            results[f"{name}_mib"] = round(os.path.getsize(os.path.join(directory, files[0]["path"])) / 2**20, 2)
+    return results
+
+
+def bench_records(args):
+    """Normalize synthetic cards, then the heap held as dicts, records and a columnar batch, and write speeds"""
+    return run_records(args.records)
+
+
+def bench_startup(args):
+    """Cold import time and RSS of each entry point, and gunicorn worker boot and memory when installed"""
+    return run_startup(args.startup_runs)
+
+
+def bench_endpoints(args):
+    """
+    The Flask app in a child process, searched through `/` by concurrent clients.
+
+    Every query is distinct, so the first round scrapes the stub server; the second
+    round repeats them and is served from the result cache.
+    """
+    with StubServer(latency=args.latency, api_body=load_fixture("search_api_page.json"),
+                    error_rate=args.error_rate, captcha_rate=args.captcha_rate, seed=args.seed) as server, \
+            tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ, OLX_BASE_URL=server.base_url, OLX_STORE_PATH=os.path.join(directory, "listings.db"),
+                   OLX_HTTP_CACHE_DIR=os.path.join(directory, "http_cache"),
+                   OLX_FETCH_RATE="0", OLX_FETCH_CONCURRENCY=str(args.concurrency),
+                   OLX_CACHE_MAX_ENTRIES=str(args.requests))
+        child = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve-app"],
+                                 cwd=ROOT, env=env, stdout=subprocess.PIPE, text=True)
+        try:
+            app_url = child.stdout.readline().strip()
+            if not app_url:
+                raise RuntimeError("The app did not start")
+            session = requests.Session()
+            session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.clients))
+
+            def search(i):
+                start = time.perf_counter()
+                response = session.post(f"{app_url}/", json={"query": f"car cover {i}", "pages": args.pages},
+                                        timeout=120)
+                return time.perf_counter() - start, response.status_code
+
+            results = {}
+            for round_name in ("scrape", "cached"):
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=args.clients) as pool:
+                    outcomes = list(pool.map(search, range(args.requests)))
+                elapsed = time.perf_counter() - start
+                latencies = [latency for latency, _ in outcomes]
+                results[f"{round_name}_requests_per_sec"] = per_sec(len(outcomes), elapsed)
+                results[f"{round_name}_p50_ms"] = round(statistics.median(latencies) * 1000, 2)
+                results[f"{round_name}_p95_ms"] = round(percentile(latencies, 0.95) * 1000, 2)
+                results[f"{round_name}_failures"] = sum(1 for _, status in outcomes if status != 200)
+
+            start = time.perf_counter()
+            session.get(f"{app_url}/metrics", timeout=30).raise_for_status()
+            results["metrics_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            results["clients"] = args.clients
+            return results
+        finally:
+            child.terminate()
+            child.wait(timeout=30)
+
+
+def serve_app():
+    """Child process mode: serve the app on a free port and print its URL"""
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.disable(logging.INFO)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    print(f"http://127.0.0.1:{server.server_port}", flush=True)
+    server.serve_forever()
+
+
+CASES = {
+    "extractors": bench_extractors,
+    "data_sources": bench_data_sources,
+    "requests": bench_requests,
+    "enrichment": bench_enrichment,
+    "http_cache": bench_http_cache,
+    "identities": bench_identities,
+    "export": bench_export,
+    "records": bench_records,
+    "startup": bench_startup,
+    "endpoints": bench_endpoints
+}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline_path, threshold):
+    """
+    Print every metric next to its baseline value.
+
+    Metrics ending in _per_sec should go up, _ms and seconds should go down; moves the
+    wrong way by more than `threshold` are flagged. Returns the number of regressions.
+    """
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline['commit']} ({baseline['timestamp']}):")
+    changed = sorted(key for key, value in results["settings"].items()
+                     if key != "cases" and baseline["settings"].get(key) != value)
+    if changed:
+        print(f"  Settings differ ({', '.join(changed)}), the numbers are not like for like")
+    regressions = 0
+    for case, metrics in results["cases"].items():
+        previous = baseline["cases"].get(case, {})
+        for metric, value in metrics.items():
+            old = previous.get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            if metric.endswith("_per_sec"):
+                worse = change < -threshold
+            elif metric.endswith("_ms") or metric.endswith("_ms_per_page") or metric == "seconds":
+                worse = change > threshold
+            else:
+                worse = False
+            regressions += worse
+            print(f"  {case + '.' + metric:<40} {old:>12} -> {value:<12} {change:+7.1%}{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", default=",".join(CASES), help="comma-separated cases: " + ", ".join(CASES))
+    parser.add_argument("--repeat", type=int, default=20, help="repetitions of the parsing cases")
+    parser.add_argument("--searches", type=int, default=5, help="searches of the requests case")
+    parser.add_argument("--pages", type=int, default=3, help="pages per search")
+    parser.add_argument("--latency", type=float, default=0.02, help="stub server latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub responses that are 503s")
+    parser.add_argument("--captcha-rate", type=float, default=0.0, help="share of stub responses that are CAPTCHAs")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the stub server's faults")
+    parser.add_argument("--concurrency", type=int, default=3, help="fetcher concurrency per host")
+    parser.add_argument("--identities", type=int, default=4, help="healthy stub proxies of the identities case")
+    parser.add_argument("--identity-rate", type=float, default=10.0, help="requests per second per identity")
+    parser.add_argument("--listings", type=int, default=20000, help="listings of the export case")
+    parser.add_argument("--compression", choices=["gzip", "zstd"])
+    parser.add_argument("--records", type=int, default=100000, help="listings of the records case")
+    parser.add_argument("--startup-runs", type=int, default=5, help="fresh interpreters per entry point of the startup case")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients of the endpoints case")
+    parser.add_argument("--requests", type=int, default=40, help="searches per round of the endpoints case")
+    parser.add_argument("--output", help="results file, default benchmarks/results/<commit>.json")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change flagged as a regression")
+    parser.add_argument("--serve-app", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve_app:
+        serve_app()
+        return 0
+
+    # Per-page INFO logging would dominate the timings, and importing the app must not
+    # open the repository's own listing store or HTTP cache
+    logging.disable(logging.INFO)
+    os.environ["OLX_STORE_PATH"] = ""
+    os.environ["OLX_HTTP_CACHE_DIR"] = ""
+    names = [name.strip() for name in args.cases.split(",") if name.strip()]
+    unknown = [name for name in names if name not in CASES]
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(unknown)}")
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("output", "compare", "serve_app", "threshold")},
+        "cases": {}
+    }
+    for name in names:
+        start = time.perf_counter()
+        results["cases"][name] = CASES[name](args)
+        print(f"{name:<13} {time.perf_counter() - start:6.2f}s  {json.dumps(results['cases'][name])}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        return 1 if compare(results, args.compare, args.threshold) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,214 @@
+"""Local stub of the OLX search pages, and of proxies in front of it, for offline benchmarks"""
+import hashlib
+import http.client
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+# Every ad id in the saved search pages starts with this
+AD_ID_PREFIX = b"1700000"
+
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), "rb") as f:
+        return f.read()
+
+
+def page_body(body, path):
+    """
+    `body` as the result page `path` asks for: ads of later pages get ids of their own, so
+    a scrape de-duplicating by ad id finds a full page of new listings on every page.
+    The first page (?page=1, or 0 for the search API) is served as saved.
+    """
+    page = int(parse_qs(urlsplit(path).query).get("page", ["0"])[0] or 0)
+    offset = page if path.startswith("/api/") else page - 1
+    if offset <= 0:
+        return body
+    return body.replace(AD_ID_PREFIX, b"17" + str(offset).zfill(len(AD_ID_PREFIX) - 2).encode())
+
+
+class StubServer:
+    """
+    Serves the saved search page for every URL after an artificial latency, with ad ids
+    of their own on every result page after the first.
+
+    With `api_body` set, /api/ URLs get that JSON instead, like the search API; /item/
+    URLs get the saved detail page, or `detail_body`.
+    A share of requests can fail: `error_rate` of them get `error_status`, and
+    `captcha_rate` get the saved CAPTCHA page with a 200, the way OLX blocks bots.
+    With `etag` set, pages carry an ETag and conditional requests for them get a 304.
+    Requests that came through a StubProxy named in `blocked_via` always get a 429;
+    `by_via` counts the requests that came through each proxy.
+    """
+
+    def __init__(self, latency=0.0, body=None, api_body=None, error_rate=0.0, error_status=503,
+                 captcha_rate=0.0, seed=None, etag=False, blocked_via=(), detail_body=None):
+        self.latency = latency
+        self.body = body if body is not None else load_fixture("search_page.html")
+        self.api_body = api_body
+        self.detail_body = detail_body if detail_body is not None else load_fixture("detail_page.html")
+        self.detail_requests = 0
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.captcha_rate = captcha_rate
+        self.etag = etag
+        self.blocked_via = set(blocked_via)
+        self.by_via = {}
+        self.not_modified = 0
+        self.captcha_body = load_fixture("captcha_page.html")
+        self.requests = 0
+        self.errors = 0
+        self.captchas = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                via = self.headers.get("Via", "").rpartition(" ")[2] or None
+                with stub._lock:
+                    stub.requests += 1
+                    stub.by_via[via] = stub.by_via.get(via, 0) + 1
+                    roll = stub._random.random()
+                    fault = None
+                    if via in stub.blocked_via:
+                        fault = "blocked"
+                    elif roll < stub.error_rate:
+                        fault = "error"
+                        stub.errors += 1
+                    elif roll < stub.error_rate + stub.captcha_rate:
+                        fault = "captcha"
+                        stub.captchas += 1
+                time.sleep(stub.latency)
+                status = 200
+                if fault == "blocked":
+                    status, body, content_type = 429, b"Too Many Requests", "text/plain"
+                elif fault == "error":
+                    status, body, content_type = stub.error_status, b"Service Unavailable", "text/plain"
+                elif fault == "captcha":
+                    body, content_type = stub.captcha_body, "text/html; charset=utf-8"
+                elif self.path.startswith("/item/"):
+                    with stub._lock:
+                        stub.detail_requests += 1
+                    body, content_type = stub.detail_body, "text/html; charset=utf-8"
+                elif stub.api_body is not None and self.path.startswith("/api/"):
+                    body, content_type = stub.api_body, "application/json"
+                else:
+                    body, content_type = stub.body, "text/html; charset=utf-8"
+                if fault is None and not self.path.startswith("/item/"):
+                    body = page_body(body, self.path)
+                etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"' if stub.etag and status == 200 else None
+                if etag is not None and self.headers.get("If-None-Match") == etag:
+                    with stub._lock:
+                        stub.not_modified += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                if etag is not None:
+                    self.send_header("ETag", etag)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class StubProxy:
+    """
+    Forward proxy for plain http:// URLs, the way requests sends them through a proxy.
+
+    Requests are passed on with a Via header naming the proxy, so a StubServer can block
+    some proxies and not others. A `broken` proxy drops every connection unanswered.
+    """
+
+    def __init__(self, name, latency=0.0, broken=False):
+        self.name = name
+        self.latency = latency
+        self.broken = broken
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def _make_handler(self):
+        proxy = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                with proxy._lock:
+                    proxy.requests += 1
+                if proxy.broken:
+                    self.close_connection = True
+                    return
+                time.sleep(proxy.latency)
+                target = urlsplit(self.path)
+                headers = {name: value for name, value in self.headers.items()
+                           if not name.lower().startswith("proxy-") and name.lower() not in ("connection", "host")}
+                headers["Via"] = f"1.1 {proxy.name}"
+                connection = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+                try:
+                    connection.request("GET", target.path + (f"?{target.query}" if target.query else ""),
+                                       headers=headers)
+                    upstream = connection.getresponse()
+                    body = upstream.read()
+                finally:
+                    connection.close()
+                self.send_response(upstream.status)
+                for name in ("Content-Type", "ETag", "Retry-After"):
+                    if upstream.getheader(name):
+                        self.send_header(name, upstream.getheader(name))
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
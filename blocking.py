@@ -0,0 +1,166 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from metrics import count
+
+logger = logging.getLogger(__name__)
+
+# What a fetched results page turned out to be
+OK = "ok"
+EMPTY = "empty"
+RATE_LIMITED = "rate_limited"
+FORBIDDEN = "forbidden"
+CAPTCHA = "captcha"
+SERVER_ERROR = "server_error"
+ERROR = "error"
+
+# Outcomes that mean the host is refusing us, as opposed to failing or having nothing
+BLOCK_KINDS = (RATE_LIMITED, FORBIDDEN, CAPTCHA)
+BLOCK_STATUSES = {429: RATE_LIMITED, 403: FORBIDDEN}
+
+# Markers of the bot challenge pages OLX and its CDN serve with a 200 instead of results
+CAPTCHA_MARKERS = (
+    "captcha",
+    "verify you are a human",
+    "are you a robot",
+    "unusual traffic",
+    "access denied",
+    "cf-challenge",
+    "blocked because we believe you are using automation"
+)
+
+
+def classify_response(status_code, text=None, items=None):
+    """
+    Classify a fetched results page.
+
+    `items` are the listings parsed from it; the body is only searched for challenge
+    markers when a 200 page yielded none, so normal pages cost nothing extra.
+    """
+    if status_code in BLOCK_STATUSES:
+        return BLOCK_STATUSES[status_code]
+    if status_code >= 500:
+        return SERVER_ERROR
+    if status_code != 200:
+        return ERROR
+    if items:
+        return OK
+    if text:
+        lowered = text.lower()
+        if any(marker in lowered for marker in CAPTCHA_MARKERS):
+            return CAPTCHA
+    return EMPTY
+
+
+def retry_after_seconds(response):
+    """Seconds from a numeric Retry-After header, or None"""
+    value = getattr(response, "headers", {}).get("Retry-After")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class HostBlocked(requests.RequestException):
+    """Raised instead of fetching while the host's circuit breaker is open"""
+
+    def __init__(self, host, kind, retry_in):
+        super().__init__(f"{host} is blocking requests ({kind}), retry in {retry_in:.0f}s")
+        self.host = host
+        self.kind = kind
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Per-host circuit breaker for bot blocks.
+
+    A block (429, 403 or a CAPTCHA page) opens the host's breaker for a cooldown that
+    doubles with every consecutive block, with jitter and never shorter than the
+    host's Retry-After. While it is open, requests to the host fail fast with
+    HostBlocked. Once the cooldown has passed a single probe request is let through
+    (half-open): a real page closes the breaker, another block reopens it. A probe
+    that reports neither within `probe_timeout` seconds makes way for another.
+    """
+
+    def __init__(self, cooldown=30.0, max_cooldown=900.0, probe_timeout=60.0):
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_timeout = probe_timeout
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def check(self, url):
+        """Raise HostBlocked if requests to the URL's host should not be made now"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state["state"] == "closed":
+                return
+            now = time.monotonic()
+            retry_in = state["open_until"] - now
+            if retry_in > 0:
+                raise HostBlocked(host, state["kind"], retry_in)
+            # Let this one request probe whether the block has lifted, the rest keep failing fast
+            state["state"] = "half_open"
+            state["open_until"] = now + self.probe_timeout
+        logger.info(f"Circuit breaker for {host} half-open, probing")
+
+    def blocked(self, url):
+        """The HostBlocked the URL's host would raise right now, or None, without probing"""
+        host = urlsplit(url).netloc
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None or state["state"] == "closed":
+                return None
+            retry_in = state["open_until"] - time.monotonic()
+            return HostBlocked(host, state["kind"], retry_in) if retry_in > 0 else None
+
+    def record_block(self, url, kind, retry_after=None):
+        host = urlsplit(url).netloc
+        with self._lock:
+            state = self._hosts.setdefault(host, {"state": "closed", "blocks": 0, "opened": 0, "kind": None,
+                                                  "open_until": 0.0})
+            state["blocks"] += 1
+            state["kind"] = kind
+            if state["state"] == "open" and state["open_until"] > time.monotonic():
+                # Requests already in flight when it opened, not a new block
+                return
+            cooldown = min(self.max_cooldown, self.cooldown * 2 ** state["opened"]) * random.uniform(0.75, 1.25)
+            if retry_after is not None:
+                cooldown = max(cooldown, retry_after)
+            state["state"] = "open"
+            state["opened"] += 1
+            state["open_until"] = time.monotonic() + cooldown
+        count("olx_blocks_total", kind=kind)
+        logger.warning(f"{host} is blocking requests ({kind}), circuit breaker open for {cooldown:.0f}s")
+
+    def record_success(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            state = self._hosts.get(host)
+            # Pages fetched before the breaker opened do not close it, only the probe's does
+            if state is None or state["state"] != "half_open":
+                return
+            state["state"] = "closed"
+            state["opened"] = 0
+        logger.info(f"Circuit breaker for {host} closed")
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                host: {
+                    "state": state["state"],
+                    "kind": state["kind"],
+                    "blocks": state["blocks"],
+                    "consecutive_opens": state["opened"],
+                    "retry_in": round(max(0.0, state["open_until"] - now), 1) if state["state"] != "closed" else 0.0
+                }
+                for host, state in self._hosts.items()
+            }
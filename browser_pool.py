@@ -0,0 +1,412 @@
+import logging
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from urllib.parse import unquote, urlsplit
+
+from metrics import timed
+
+logger = logging.getLogger(__name__)
+
+LAUNCH_ARGS = [
+    '--disable-blink-features=AutomationControlled',
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-accelerated-2d-canvas',
+    '--no-first-run',
+    '--no-zygote',
+    '--disable-gpu',
+    '--hide-scrollbars',
+    '--mute-audio'
+]
+
+# Spoof webdriver
+STEALTH_SCRIPT = """
+    Object.defineProperty(navigator, 'webdriver', {
+        get: () => false
+    });
+
+    // Override the `navigator.plugins` getter
+    Object.defineProperty(navigator, 'plugins', {
+        get: () => [1, 2, 3, 4, 5],
+    });
+
+    // Override the `navigator.languages` getter
+    Object.defineProperty(navigator, 'languages', {
+        get: () => ['en-US', 'en', 'hi'],
+    });
+"""
+
+
+# Requests aborted in every context: listings only need the HTML and its scripts
+BLOCKED_RESOURCE_TYPES = {"image", "media", "font"}
+BLOCKED_URL_PATTERNS = [
+    r"google-analytics\.com",
+    r"googletagmanager\.com",
+    r"googlesyndication\.com",
+    r"doubleclick\.net",
+    r"facebook\.(net|com)/tr",
+    r"connect\.facebook\.net",
+    r"hotjar\.com",
+    r"clarity\.ms",
+    r"newrelic\.com|nr-data\.net",
+    r"branch\.io",
+    r"\.(png|jpe?g|gif|webp|avif|svg|woff2?|ttf|mp4)(\?|$)"
+]
+
+
+def browser_proxy(proxy_url):
+    """Playwright's proxy settings for a proxy URL, which take the credentials separately"""
+    parts = urlsplit(proxy_url)
+    server = f"{parts.scheme}://{parts.hostname}" + (f":{parts.port}" if parts.port else "")
+    settings = {"server": server}
+    if parts.username:
+        settings["username"] = unquote(parts.username)
+        settings["password"] = unquote(parts.password or "")
+    return settings
+
+
+class _Task:
+    def __init__(self, fn, identity=None):
+        self.fn = fn
+        self.identity = identity
+        self.out = queue.Queue()
+        self.stop = threading.Event()
+
+
+class BrowserPool:
+    """
+    Long-lived pool of headless Firefox browsers with warmed, reusable contexts.
+
+    Playwright's sync API is bound to the thread that started it, so every browser
+    lives on its own worker thread and searches are dispatched to it. Each browser
+    keeps up to `contexts` warmed contexts (cookies survive across searches) and
+    recycles a context after `max_uses` searches or when a search crashes.
+    Browsers are launched lazily on the first search.
+
+    A search run as an identity from the fetcher's IdentityPool gets a context of that
+    identity: its proxy, user agent and headers, seeded with its cookie jar, which gets
+    the context's cookies back after every search. The pool then holds up to `contexts`
+    contexts across all identities, recycling the least used one for a new identity.
+
+    With `block_resources` on, every context aborts images, fonts, media and known
+    trackers. `measure_bytes` additionally sums response body sizes, which costs a
+    round trip per request and is meant for benchmarks.
+
+    If Playwright cannot start or the first browser cannot be launched (no browser
+    installed, say), the pool is unusable: the waiting searches and every later one
+    fail with that error instead of waiting for a worker that is gone.
+    """
+
+    def __init__(self, base_url="https://www.olx.in", user_agents=None, browsers=1, contexts=1, max_uses=50,
+                 block_resources=True, blocked_resource_types=None, blocked_url_patterns=None,
+                 measure_bytes=False):
+        self.base_url = base_url
+        self.user_agents = user_agents or []
+        self.browsers = browsers
+        self.contexts = contexts
+        self.max_uses = max_uses
+        self.block_resources = block_resources
+        self.blocked_resource_types = set(blocked_resource_types or BLOCKED_RESOURCE_TYPES)
+        self._blocked_url = re.compile("|".join(blocked_url_patterns or BLOCKED_URL_PATTERNS))
+        self.measure_bytes = measure_bytes
+        self._tasks = queue.Queue()
+        self._threads = []
+        self._sync_playwright = None
+        self._broken = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "in_use": 0,
+            "idle": 0,
+            "launches": 0,
+            "contexts_created": 0,
+            "contexts_recycled": 0,
+            "searches": 0,
+            "launch_seconds": 0.0,
+            "warmup_seconds": 0.0,
+            "blocked_requests": 0,
+            "loaded_requests": 0,
+            "loaded_bytes": 0
+        }
+        self._blocked_by_type = {}
+
+    def run(self, fn, identity=None):
+        """
+        Run `fn(context)` on a pooled browser and yield whatever it yields.
+
+        `fn` must be a generator function; it executes on the browser's thread, and
+        exceptions it raises are re-raised here. With an `identity`, the context is one of
+        that identity's.
+        """
+        task = _Task(fn, identity)
+        self._submit(task)
+        try:
+            while True:
+                kind, value = task.out.get()
+                if kind == "item":
+                    yield value
+                elif kind == "error":
+                    raise value
+                else:
+                    return
+        finally:
+            task.stop.set()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["blocked_by_type"] = dict(self._blocked_by_type)
+        stats["browsers"] = self.browsers
+        stats["max_contexts_per_browser"] = self.contexts
+        stats["max_uses"] = self.max_uses
+        return stats
+
+    def close(self):
+        """Stop the worker threads, closing their contexts and browsers"""
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self._tasks.put(None)
+        for thread in threads:
+            thread.join(timeout=30)
+
+    def _submit(self, task):
+        """Queue a task, starting the workers first if need be; raises once the pool is unusable"""
+        with self._lock:
+            if self._broken is not None:
+                raise RuntimeError(f"Browser pool is unusable: {str(self._broken)}") from self._broken
+            if not self._threads:
+                # Playwright is imported by the first search that falls back to it, and an
+                # ImportError reaches that search rather than killing a worker thread
+                from playwright.sync_api import sync_playwright
+                self._sync_playwright = sync_playwright
+                for i in range(self.browsers):
+                    thread = threading.Thread(target=self._worker, name=f"browser-pool-{i}", daemon=True)
+                    thread.start()
+                    self._threads.append(thread)
+            # Queued under the lock so no task can slip in after _fail() has drained the queue
+            self._tasks.put(task)
+
+    def _fail(self, error):
+        """Mark the pool unusable and fail every queued task with `error`"""
+        logger.error(f"Browser pool is unusable: {str(error)}")
+        with self._lock:
+            self._broken = error
+            stops = 0
+            while True:
+                try:
+                    task = self._tasks.get_nowait()
+                except queue.Empty:
+                    break
+                if task is None:
+                    stops += 1
+                else:
+                    task.out.put(("error", error))
+            # close() sentinels belong to the other workers
+            for _ in range(stops):
+                self._tasks.put(None)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _worker(self):
+        try:
+            with self._sync_playwright() as playwright:
+                self._serve(playwright)
+        except Exception as e:
+            self._fail(e)
+
+    def _serve(self, playwright):
+        browser = None
+        slots = []
+        launched = False
+
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                break
+
+            try:
+                if browser is None or not browser.is_connected():
+                    browser = self._launch(playwright)
+                    launched = True
+                    self._count("idle", -len(slots))
+                    slots = []
+                slot = self._acquire_slot(browser, slots, task.identity)
+            except Exception as e:
+                logger.error(f"Could not prepare a browser context: {str(e)}")
+                task.out.put(("error", e))
+                if not launched:
+                    # The first launch failing will not get better on the next search
+                    raise
+                continue
+
+            self._count("searches")
+            self._count("in_use")
+            self._count("idle", -1)
+            crashed = self._run_task(task, slot)
+            if task.identity is not None:
+                self._save_cookies(slot, task.identity)
+            self._count("in_use", -1)
+            self._count("idle")
+
+            slot["uses"] += 1
+            if crashed or slot["uses"] >= self.max_uses:
+                self._recycle(slot, slots)
+
+        for slot in slots:
+            self._close_quietly(slot["context"])
+        if browser is not None:
+            self._close_quietly(browser)
+
+    def _run_task(self, task, slot):
+        """Feed the task's items back to the caller; returns True if the search crashed"""
+        generator = task.fn(slot["context"])
+        try:
+            for item in generator:
+                if task.stop.is_set():
+                    break
+                task.out.put(("item", item))
+            task.out.put(("done", None))
+            return False
+        except Exception as e:
+            task.out.put(("error", e))
+            return self._is_crash(e)
+        finally:
+            generator.close()
+
+    def _is_crash(self, error):
+        # Cancellation and similar control-flow exceptions come from our own code, not the browser
+        return type(error).__module__.startswith("playwright")
+
+    def _launch(self, playwright):
+        logger.info("Launching pooled Firefox browser")
+        start = time.perf_counter()
+        # Firefox-specific preferences
+        prefs = {
+            "dom.webdriver.enabled": False,
+            "privacy.trackingprotection.enabled": False
+        }
+        if self.user_agents:
+            prefs["general.useragent.override"] = random.choice(self.user_agents)
+        with timed("browser_launch"):
+            browser = playwright.firefox.launch(  # Try Firefox instead of Chromium
+                headless=True,
+                firefox_user_prefs=prefs,
+                args=LAUNCH_ARGS
+            )
+        self._count("launches")
+        self._count("launch_seconds", time.perf_counter() - start)
+        return browser
+
+    def _acquire_slot(self, browser, slots, identity=None):
+        """
+        Return a new context while below the limit, otherwise the least used one; for an
+        identity, its own context, recycling the least used other one when at the limit
+        """
+        name = identity.name if identity is not None else None
+        matching = [slot for slot in slots if slot["identity"] == name]
+        if identity is not None and matching:
+            return matching[0]
+        if len(slots) >= self.contexts:
+            if identity is None:
+                return min(slots, key=lambda s: s["uses"])
+            self._recycle(min(slots, key=lambda s: s["uses"]), slots)
+        slot = {"context": self._new_context(browser, identity), "uses": 0, "identity": name}
+        slots.append(slot)
+        self._count("idle")
+        return slot
+
+    def _new_context(self, browser, identity=None):
+        start = time.perf_counter()
+        options = {}
+        if identity is not None:
+            options["user_agent"] = identity.user_agent
+            options["extra_http_headers"] = {
+                name: value for name, value in identity.headers.items() if value is not None and name != 'User-Agent'
+            }
+            if identity.proxy:
+                options["proxy"] = browser_proxy(identity.proxy)
+        context = browser.new_context(
+            viewport={'width': 1366, 'height': 768},
+            locale='en-IN',
+            timezone_id='Asia/Kolkata',
+            geolocation={'latitude': 20.5937, 'longitude': 78.9629},
+            permissions=['geolocation'],
+            **options
+        )
+        context.add_init_script(STEALTH_SCRIPT)
+        if self.block_resources:
+            context.route("**/*", self._route)
+        if self.measure_bytes:
+            context.on("requestfinished", self._record_loaded)
+
+        # Add cookies to look more authentic
+        context.add_cookies([{
+            'name': 'session_id',
+            'value': uuid.uuid4().hex,
+            'domain': '.olx.in',
+            'path': '/'
+        }])
+        if identity is not None and identity.browser_cookies():
+            context.add_cookies(identity.browser_cookies())
+
+        # Visit the homepage once per context so its cookies are set for every later search
+        page = context.new_page()
+        try:
+            logger.info("Visiting OLX homepage first")
+            with timed("homepage_warmup"):
+                page.goto(self.base_url, wait_until="domcontentloaded", timeout=30000)
+            with timed("deliberate_sleep"):
+                time.sleep(random.uniform(3, 5))
+        except Exception as e:
+            logger.error(f"Error visiting homepage: {str(e)}")
+        finally:
+            page.close()
+
+        self._count("contexts_created")
+        self._count("warmup_seconds", time.perf_counter() - start)
+        return context
+
+    def _route(self, route):
+        """Abort requests for blocked resource types and tracker URLs, let everything else through"""
+        request = route.request
+        if request.resource_type in self.blocked_resource_types or self._blocked_url.search(request.url):
+            with self._lock:
+                self._stats["blocked_requests"] += 1
+                self._blocked_by_type[request.resource_type] = self._blocked_by_type.get(request.resource_type, 0) + 1
+            route.abort()
+        else:
+            route.continue_()
+
+    def _record_loaded(self, request):
+        try:
+            size = request.sizes()["responseBodySize"]
+        except Exception:
+            return
+        self._count("loaded_requests")
+        self._count("loaded_bytes", max(size, 0))
+
+    def _save_cookies(self, slot, identity):
+        try:
+            identity.update_cookies(slot["context"].cookies())
+        except Exception as e:
+            logger.warning(f"Could not read the cookies of {identity.name}'s context: {str(e)}")
+
+    def _recycle(self, slot, slots):
+        logger.info(f"Recycling browser context after {slot['uses']} searches")
+        slots.remove(slot)
+        self._count("idle", -1)
+        self._count("contexts_recycled")
+        self._close_quietly(slot["context"])
+
+    def _close_quietly(self, target):
+        try:
+            target.close()
+        except Exception as e:
+            logger.warning(f"Error closing browser resource: {str(e)}")
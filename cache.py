@@ -0,0 +1,161 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from records import Listing, json_default
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_query(query):
+    """Lowercase the query and collapse its whitespace so equivalent queries compare equal"""
+    return " ".join(str(query).lower().split())
+
+
+def normalize_key(query, pages):
+    """Build the cache key for a search so equivalent queries share an entry"""
+    return f"{normalize_query(query)}|{int(pages)}"
+
+
+class ResultCache:
+    """
+    In-memory LRU cache of scrape results with a TTL and an optional on-disk backend.
+
+    Entries are keyed on the normalized (query, pages) pair. When a disk directory is
+    given, entries are also written there as JSON so they survive a restart.
+    """
+
+    def __init__(self, ttl=600, max_entries=128, disk_dir=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        if self.disk_dir:
+            if not os.path.exists(self.disk_dir):
+                os.makedirs(self.disk_dir)
+            self._prune_disk()
+
+    def get(self, query, pages):
+        """Return cached results for the search or None if missing or expired"""
+        key = normalize_key(query, pages)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self.disk_dir:
+                entry = self._load_from_disk(key)
+                if entry is not None:
+                    self._entries[key] = entry
+                    self._evict()
+
+            if entry is not None and now - entry["stored_at"] > self.ttl:
+                self._discard(key)
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["results"]
+
+    def set(self, query, pages, results):
+        """Store results for the search, evicting the least recently used entries"""
+        key = normalize_key(query, pages)
+        entry = {"stored_at": time.time(), "results": results}
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if self.disk_dir:
+                self._save_to_disk(key, entry)
+            self._evict()
+
+    def clear(self):
+        """Drop every entry from memory and disk"""
+        with self._lock:
+            for key in list(self._entries):
+                self._discard(key)
+            if self.disk_dir:
+                for name in os.listdir(self.disk_dir):
+                    if name.endswith(".json"):
+                        os.remove(os.path.join(self.disk_dir, name))
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "disk": bool(self.disk_dir)
+            }
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            self._remove_from_disk(key)
+            logger.info(f"Evicted cached results for: {key}")
+
+    def _discard(self, key):
+        self._entries.pop(key, None)
+        self._remove_from_disk(key)
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, f"{digest}.json")
+
+    def _load_from_disk(self, key):
+        path = self._disk_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            entry["results"] = [Listing.from_dict(item) for item in entry["results"]]
+            return entry
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Discarding unreadable cache file {path}: {str(e)}")
+            self._remove_from_disk(key)
+            return None
+
+    def _save_to_disk(self, key, entry):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False, default=json_default)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache file {path}: {str(e)}")
+
+    def _prune_disk(self):
+        """Keep only the most recently written files left over from a previous run"""
+        paths = [
+            os.path.join(self.disk_dir, name)
+            for name in os.listdir(self.disk_dir)
+            if name.endswith(".json")
+        ]
+        paths.sort(key=os.path.getmtime, reverse=True)
+        for path in paths[self.max_entries:]:
+            os.remove(path)
+
+    def _remove_from_disk(self, key):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        if os.path.exists(path):
+            os.remove(path)
@@ -0,0 +1,126 @@
+"""
+Scrape one OLX search from the command line, without the Flask app.
+
+NDJSON is streamed to stdout, one listing per line as each results page is parsed,
+unless --output-dir is given; other formats are written as files to --output-dir
+(static/downloads by default) and their paths printed. Logs go to stderr.
+    ./olx-scrape "car cover" --pages 2 --format ndjson > listings.ndjson
+    python cli.py "car cover" --format csv,parquet --output-dir exports
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from blocking import CircuitBreaker
+from browser_pool import BrowserPool
+from enrichment import DetailEnricher
+from exporters import check_available
+from fetcher import PageFetcher
+from http_cache import HttpCache
+from parsers import LazyParserBackend
+from records import json_default
+from scraper import DEFAULT_BASE_URL, DEFAULT_EXPORT_DIR, USER_AGENTS, OLXScraper, configure_logging
+from store import ListingStore
+
+logger = logging.getLogger(__name__)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="olx-scrape", description=__doc__.splitlines()[1])
+    parser.add_argument("query", help="Search query")
+    parser.add_argument("--pages", type=int, default=3, help="Maximum number of result pages")
+    parser.add_argument("--format", default="ndjson",
+                        help="json, csv, ndjson, parquet, both (JSON and CSV) or a comma-separated list")
+    parser.add_argument("--compression", choices=["gzip", "zstd"], help="Compress the exported files")
+    parser.add_argument("--output-dir", help="Write files here; without it NDJSON goes to stdout")
+    parser.add_argument("--base-url", default=os.environ.get("OLX_BASE_URL", DEFAULT_BASE_URL))
+    parser.add_argument("--no-api", action="store_true", help="Skip the JSON search API, start with the HTML pages")
+    parser.add_argument("--no-browser", action="store_true", help="Never fall back to Playwright")
+    parser.add_argument("--parser", default=os.environ.get("OLX_PARSER", "auto"),
+                        help="HTML parser backend: selectolax, lxml, html.parser or auto")
+    parser.add_argument("--store", help="Keep the listings in this SQLite store; exports then hold all of the query's")
+    parser.add_argument("--incremental", action="store_true",
+                        help="With --store, stop at the first page with nothing new for the query")
+    parser.add_argument("--enrich", action="store_true", help="Add the detail-page fields of every listing")
+    parser.add_argument("--http-cache", help="Cache raw responses in this directory")
+    parser.add_argument("--rate", type=float, default=1.0, help="Requests per second per host")
+    parser.add_argument("--concurrency", type=int, default=3, help="Requests in flight per host")
+    parser.add_argument("--log-level", default="INFO", help="DEBUG, INFO, WARNING or ERROR")
+    parser.add_argument("--log-file", help="Also log to this file")
+    return parser
+
+
+def write_ndjson(scraper, query, pages, out):
+    """Stream the search to `out` page by page; returns the number of listings written"""
+    written = 0
+    for page_items in scraper.iter_search(query, pages):
+        for item in page_items:
+            out.write(json.dumps(item, ensure_ascii=False, default=json_default) + "\n")
+        out.flush()
+        written += len(page_items)
+    return written
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.pages < 1:
+        parser.error("--pages must be at least 1")
+    try:
+        formats = check_available(args.format, args.compression)
+    except ValueError as e:
+        parser.error(str(e))
+    to_stdout = args.output_dir is None and formats == ["ndjson"] and args.compression is None
+
+    configure_logging(args.log_file, getattr(logging, args.log_level.upper(), logging.INFO))
+
+    fetcher = PageFetcher(
+        max_concurrency=args.concurrency,
+        rate=args.rate,
+        breaker=CircuitBreaker(),
+        http_cache=HttpCache(args.http_cache) if args.http_cache else None
+    )
+    # Launched by the first search that falls back to Playwright, if any
+    browser_pool = None if args.no_browser else BrowserPool(base_url=args.base_url, user_agents=USER_AGENTS)
+    store = ListingStore(args.store) if args.store else None
+    scraper = OLXScraper(
+        fetcher=fetcher,
+        browser_pool=browser_pool,
+        parser=LazyParserBackend(args.parser),
+        use_api=not args.no_api,
+        use_browser=not args.no_browser,
+        store=store,
+        incremental=args.incremental,
+        base_url=args.base_url,
+        enricher=DetailEnricher(fetcher, store=store) if args.enrich else None,
+        export_dir=args.output_dir or DEFAULT_EXPORT_DIR
+    )
+
+    try:
+        if to_stdout:
+            try:
+                total = write_ndjson(scraper, args.query, args.pages, sys.stdout)
+            except BrokenPipeError:
+                # The reader went away (e.g. `| head`); stop quietly like other filters do
+                sys.stdout = open(os.devnull, "w")
+                return 0
+        else:
+            results, files, total = scraper.search(args.query, args.pages, args.format, args.compression)
+            for file_info in files:
+                print(os.path.join(scraper.export_dir, file_info["path"]))
+    finally:
+        if browser_pool is not None:
+            browser_pool.close()
+        if store is not None:
+            store.close()
+        fetcher.close()
+
+    logger.info(f"Found {total} listings for {args.query!r}")
+    # Blocked or failed with nothing to show; the scraper has logged why
+    return 1 if scraper.degraded is not None and not total else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
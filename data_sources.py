@@ -0,0 +1,184 @@
+import json
+import logging
+import re
+from datetime import datetime, timezone
+
+from records import Listing, parse_timestamp
+
+logger = logging.getLogger(__name__)
+
+# The search API pages are 0-based, unlike the ?page= of the HTML result pages
+API_SEARCH_PATH = "/api/relevance/v4/search"
+API_FIRST_PAGE = 0
+
+_STATE_RE = re.compile(r'window\.__APP\s*=\s*(\{.*?\})\s*;?\s*</script>', re.DOTALL)
+_SLUG_RE = re.compile(r'[^a-z0-9]+')
+_JSON_LD_RE = re.compile(r'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.DOTALL)
+_PROFILE_RE = re.compile(r'href=["\'][^"\']*/profile/(\d+)')
+
+
+def api_search_url(base_url, encoded_query, page_num):
+    """URL of the JSON search endpoint for 1-based result page `page_num`"""
+    return f"{base_url}{API_SEARCH_PATH}?query={encoded_query}&page={page_num - 1 + API_FIRST_PAGE}"
+
+
+def parse_state_listings(html):
+    """
+    Pull the ads out of the `window.__APP` state blob embedded in a result page.
+
+    Returns:
+        list or None: Raw ad dicts, [] if the state has no ads, None if the page has no usable state
+    """
+    match = _STATE_RE.search(html)
+    if not match:
+        return None
+    try:
+        state = json.loads(match.group(1))
+    except ValueError as e:
+        logger.warning(f"Could not decode embedded state: {str(e)}")
+        return None
+
+    items = state.get("states", {}).get("items", {})
+    elements = items.get("elements") if isinstance(items, dict) else None
+    if elements is None:
+        return None
+    if isinstance(elements, dict):
+        elements = list(elements.values())
+    return [ad for ad in elements if isinstance(ad, dict) and ad.get("id")]
+
+
+def parse_api_listings(payload):
+    """
+    Pull the ads out of a search API response.
+
+    Returns:
+        list or None: Raw ad dicts, or None if the payload is not a search response
+    """
+    if not isinstance(payload, dict) or not isinstance(payload.get("data"), list):
+        return None
+    return [ad for ad in payload["data"] if isinstance(ad, dict) and ad.get("id")]
+
+
+def normalize_ad(ad, base_url, now=None):
+    """Turn a raw OLX ad into a Listing with the card fields plus typed fields"""
+    ad_id = str(ad.get("ad_id") or ad.get("id"))
+    title = (ad.get("title") or "").strip()
+
+    price = ad.get("price") or {}
+    price_info = price.get("value") or {} if isinstance(price, dict) else {}
+    price_value = price_info.get("raw")
+    price_display = price_info.get("display")
+
+    resolved = ad.get("locations_resolved") or {}
+    locality = resolved.get("SUBLOCALITY_LEVEL_1_name")
+    city = resolved.get("ADMIN_LEVEL_3_name") or resolved.get("ADMIN_LEVEL_1_name")
+    location = ", ".join(part for part in (locality, city) if part)
+
+    coordinates = (ad.get("locations") or [{}])[0]
+
+    posted = parse_timestamp(ad.get("display_date") or ad.get("created_at"))
+
+    images = ad.get("images") or []
+    image = None
+    if images:
+        image = images[0].get("url") or (images[0].get("big") or {}).get("url")
+
+    user = ad.get("user") or {}
+    slug = _SLUG_RE.sub("-", title.lower()).strip("-") or "item"
+
+    return Listing(
+        title=title or "N/A",
+        price=price_display or "N/A",
+        location=location or "N/A",
+        date=_display_date(posted, now) if posted else "N/A",
+        seller=user.get("name") or "N/A",
+        url=f"{base_url}/item/{slug}-iid-{ad_id}",
+        image=image or "N/A",
+        ad_id=ad_id,
+        price_value=int(price_value) if isinstance(price_value, (int, float)) else None,
+        posted_at=posted.isoformat() if posted else None,
+        locality=locality,
+        city=city,
+        latitude=coordinates.get("lat"),
+        longitude=coordinates.get("lon")
+    )
+
+
+def parse_detail(html, ad_id=None):
+    """
+    Pull the detail-page fields of one ad out of its page, from the embedded state or, failing that, its JSON-LD.
+
+    Returns:
+        dict or None: The fields the page has among description, images, seller_id, seller,
+        posted_at, location, locality, city, latitude and longitude; None if it has neither source
+    """
+    ads = parse_state_listings(html)
+    if ads:
+        ad = next((ad for ad in ads if str(ad.get("ad_id") or ad.get("id")) == str(ad_id)), None)
+        if ad is None and len(ads) == 1:
+            ad = ads[0]
+        if ad is not None:
+            return _state_details(ad)
+    return _json_ld_details(html)
+
+
+def _state_details(ad):
+    user = ad.get("user") or {}
+    resolved = ad.get("locations_resolved") or {}
+    coordinates = (ad.get("locations") or [{}])[0]
+    posted = parse_timestamp(ad.get("created_at") or ad.get("display_date"))
+    parts = []
+    for name in ("SUBLOCALITY_LEVEL_1_name", "ADMIN_LEVEL_3_name", "ADMIN_LEVEL_1_name"):
+        if resolved.get(name) and resolved[name] not in parts:
+            parts.append(resolved[name])
+
+    details = {
+        "description": (ad.get("description") or "").strip() or None,
+        "images": [url for url in (image.get("url") or (image.get("big") or {}).get("url")
+                                   for image in ad.get("images") or []) if url],
+        "seller_id": str(ad.get("user_id") or user.get("id") or "") or None,
+        "seller": user.get("name"),
+        "posted_at": posted.isoformat() if posted else None,
+        "location": ", ".join(parts) or None,
+        "locality": resolved.get("SUBLOCALITY_LEVEL_1_name"),
+        "city": resolved.get("ADMIN_LEVEL_3_name") or resolved.get("ADMIN_LEVEL_1_name"),
+        "latitude": coordinates.get("lat"),
+        "longitude": coordinates.get("lon")
+    }
+    return {field: value for field, value in details.items() if value not in (None, [])}
+
+
+def _json_ld_details(html):
+    for match in _JSON_LD_RE.finditer(html):
+        try:
+            blob = json.loads(match.group(1))
+        except ValueError:
+            continue
+        for entry in blob if isinstance(blob, list) else [blob]:
+            if not isinstance(entry, dict) or not (entry.get("description") or entry.get("image")):
+                continue
+            images = entry.get("image") or []
+            details = {
+                "description": (entry.get("description") or "").strip() or None,
+                "images": [images] if isinstance(images, str) else [url for url in images if isinstance(url, str)]
+            }
+            profile = _PROFILE_RE.search(html)
+            if profile:
+                details["seller_id"] = profile.group(1)
+            return {field: value for field, value in details.items() if value not in (None, [])}
+    return None
+
+
+def _display_date(posted, now=None):
+    """Render a timestamp the way OLX cards do: Today, Yesterday, N days ago, then the date"""
+    now = now or datetime.now(timezone.utc)
+    if posted.tzinfo is None:
+        posted = posted.replace(tzinfo=timezone.utc)
+    days = (now.astimezone(posted.tzinfo).date() - posted.date()).days
+    if days <= 0:
+        return "Today"
+    if days == 1:
+        return "Yesterday"
+    if days < 7:
+        return f"{days} days ago"
+    return posted.strftime("%b %d")
@@ -0,0 +1,215 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+import requests
+
+from blocking import BLOCK_KINDS, CAPTCHA, OK, HostBlocked, classify_response
+from data_sources import parse_detail
+from metrics import count, timed
+from records import DETAIL_FIELDS
+from store import listing_key
+
+logger = logging.getLogger(__name__)
+
+# Card fields a detail page knows better; only overwritten when the page has them
+REFINED_FIELDS = ["seller", "posted_at", "location", "locality", "city", "latitude", "longitude"]
+
+
+class _Run:
+    """State of one search's enrichment"""
+
+    def __init__(self, headers_factory, trace):
+        self.headers_factory = headers_factory
+        self.trace = trace
+        self.blocked = None
+
+
+class DetailEnricher:
+    """
+    Adds what only an ad's detail page has to search listings: the description, every
+    image, the seller id, and the exact posting time and location.
+
+    Detail pages are fetched through the shared PageFetcher, under the same per-host
+    rate limits (and identities) as the result pages. `enrich` works on a stream of
+    result pages: each page's detail fetches start as soon as it arrives, and it is
+    passed on once they are done while up to `lookahead` later pages are already being
+    fetched and enriched, so enrichment overlaps with paging through the results.
+
+    Listings enriched within `max_age` seconds get the details they already have, from
+    the listing store when there is one and from the last `max_entries` enriched in
+    this process otherwise. A failed detail fetch leaves its listing as it was. A page
+    blocked for one identity of a pool is fetched again as another; enrichment stops
+    for the rest of the search once no identity is left or the host's breaker opens.
+    """
+
+    def __init__(self, fetcher, store=None, max_age=86400, lookahead=1, max_entries=10000):
+        self.fetcher = fetcher
+        self.store = store
+        self.max_age = max_age
+        self.lookahead = lookahead
+        self.max_entries = max_entries
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "fetched": 0,
+            "reused": 0,
+            "failed": 0,
+            "skipped": 0
+        }
+
+    def enrich(self, pages, headers_factory=None, trace=None):
+        """Yield the pages of `pages` with the detail fields merged into their listings"""
+        run = _Run(headers_factory, trace)
+        pending = deque()
+        try:
+            for page_items in pages:
+                pending.append((page_items, self._start(page_items, run)))
+                while len(pending) > self.lookahead:
+                    yield self._finish(*pending.popleft(), run)
+            while pending:
+                yield self._finish(*pending.popleft(), run)
+        finally:
+            for _, started in pending:
+                for _, _, _, future in started:
+                    future.cancel()
+            if hasattr(pages, "close"):
+                pages.close()
+
+    def enrich_page(self, page_items, headers_factory=None, trace=None):
+        """Enrich a single page of listings, waiting for its detail fetches"""
+        run = _Run(headers_factory, trace)
+        return self._finish(page_items, self._start(page_items, run), run)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["remembered"] = len(self._recent)
+        stats["max_age"] = self.max_age
+        return stats
+
+    def _start(self, page_items, run):
+        """Merge the details known recently and start fetching the rest; returns the started fetches"""
+        keyed = [(item, listing_key(item)) for item in page_items]
+        known = self._known([key for _, key in keyed if key is not None])
+        started = []
+        for item, key in keyed:
+            url = item.get("url")
+            if key in known:
+                merge_details(item, known[key])
+                self._count("reused", run)
+            elif run.blocked is not None or not url or url == "N/A":
+                self._count("skipped", run)
+            else:
+                headers = run.headers_factory() if run.headers_factory else None
+                started.append((item, key, url, self.fetcher.submit(url, headers, run.trace)))
+        return started
+
+    def _finish(self, page_items, started, run):
+        with timed("enrich_wait", run.trace):
+            for item, key, url, future in started:
+                if run.blocked is not None:
+                    future.cancel()
+                    self._count("skipped", run)
+                    continue
+                try:
+                    response = future.result()
+                except HostBlocked as e:
+                    self._stop(run, e)
+                    self._count("skipped", run)
+                    continue
+                except requests.RequestException as e:
+                    logger.warning(f"Could not fetch the detail page {url}: {str(e)}")
+                    self._count("failed", run)
+                    continue
+                details = self._read(url, item, response, run)
+                if details is None:
+                    self._count("failed", run)
+                    continue
+                details["enriched_at"] = time.time()
+                merge_details(item, details)
+                self._remember(key, details)
+                self._count("fetched", run)
+        return page_items
+
+    def _read(self, url, item, response, run, retries=None):
+        """The details of a fetched detail page, or None, reporting blocks like a results page"""
+        identity = getattr(response, "identity", None)
+        if response.status_code != 200:
+            if classify_response(response.status_code) in BLOCK_KINDS:
+                # 429 and 403 were already recorded by the fetcher
+                return self._retry(url, item, identity, run, retries)
+            return None
+        with timed("parse_detail", run.trace):
+            details = parse_detail(response.text, item.get("ad_id"))
+        kind = classify_response(200, response.text, [details] if details else None)
+        if kind == OK:
+            self.fetcher.breaker.record_success(url)
+        elif kind == CAPTCHA:
+            self.fetcher.record_block(url, kind, identity=identity)
+            self.fetcher.forget(url)
+            return self._retry(url, item, identity, run, retries)
+        return details
+
+    def _retry(self, url, item, identity, run, retries):
+        """Fetch a blocked detail page again as another identity, or stop enrichment if none is left"""
+        blocked = self.fetcher.breaker.blocked(url)
+        if identity is None or blocked is not None:
+            self._stop(run, blocked)
+            return None
+        if retries is None:
+            retries = len(self.fetcher.identities)
+        if retries <= 0:
+            return None
+        count("olx_identity_retries_total", trace=run.trace, trace_key="identity_retries")
+        headers = run.headers_factory() if run.headers_factory else None
+        try:
+            response = self.fetcher.fetch(url, headers, run.trace)
+        except HostBlocked as e:
+            self._stop(run, e)
+            return None
+        except requests.RequestException as e:
+            logger.warning(f"Could not fetch the detail page {url}: {str(e)}")
+            return None
+        return self._read(url, item, response, run, retries - 1)
+
+    def _stop(self, run, blocked):
+        if run.blocked is None:
+            logger.warning(f"Stopping detail page enrichment: {str(blocked) if blocked else 'blocked'}")
+        run.blocked = blocked or True
+
+    def _known(self, keys):
+        """Details of the listings among `keys` enriched within max_age"""
+        since = time.time() - self.max_age
+        if self.store is not None:
+            return self.store.details(keys, since)
+        with self._lock:
+            return {key: self._recent[key] for key in keys
+                    if key in self._recent and self._recent[key]["enriched_at"] >= since}
+
+    def _remember(self, key, details):
+        if key is None or self.store is not None:
+            # The store keeps them once the page is upserted
+            return
+        with self._lock:
+            self._recent[key] = details
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.max_entries:
+                self._recent.popitem(last=False)
+
+    def _count(self, result, run):
+        with self._lock:
+            self._stats[result] += 1
+        count("olx_details_total", trace=run.trace, trace_key=f"details_{result}", result=result)
+
+
+def merge_details(item, details):
+    """Merge detail-page fields into a listing, keeping its card values where the page has none"""
+    for field in DETAIL_FIELDS:
+        if details.get(field) is not None:
+            item[field] = details[field]
+    for field in REFINED_FIELDS:
+        if details.get(field) not in (None, "N/A"):
+            item[field] = details[field]
+    return item
@@ -0,0 +1,292 @@
+import csv
+import gzip
+import importlib.util
+import io
+import json
+import logging
+import os
+
+from records import DETAIL_FIELDS, FLOAT_FIELDS, INTEGER_FIELDS, LIST_FIELDS, LISTING_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Every export has exactly these columns, whatever the source of the listings; the
+# detail-page ones are empty for listings that were not enriched
+EXPORT_FIELDS = LISTING_FIELDS + DETAIL_FIELDS + ["first_seen", "last_seen"]
+
+EXPORT_FORMATS = ["json", "csv", "ndjson", "parquet"]
+COMPRESSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+# Rows are written to disk in chunks of this many, and make up one Parquet row group
+DEFAULT_CHUNK_ROWS = 1000
+WRITE_BUFFER_BYTES = 1 << 16
+
+
+def parse_formats(output_format):
+    """Turn "both", a single format or a comma-separated list of formats into a list of formats"""
+    if output_format == "both":
+        return ["json", "csv"]
+    formats = [name.strip().lower() for name in str(output_format).split(",") if name.strip()]
+    unknown = [name for name in formats if name not in EXPORT_FORMATS]
+    if unknown or not formats:
+        raise ValueError(f"Unknown export format: {output_format}")
+    return formats
+
+
+def check_available(output_format, compression=None):
+    """Raise ValueError for unknown formats or ones whose optional library is not installed"""
+    formats = parse_formats(output_format)
+    if compression is not None and compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression: {compression}")
+    if "parquet" in formats and importlib.util.find_spec("pyarrow") is None:
+        raise ValueError("Parquet export needs pyarrow, install it with: pip install pyarrow")
+    if compression == "zstd" and importlib.util.find_spec("zstandard") is None:
+        raise ValueError("zstd compression needs zstandard, install it with: pip install zstandard")
+    return formats
+
+
+def to_row(item):
+    """Project a listing onto the fixed export schema"""
+    return {field: item.get(field) for field in EXPORT_FIELDS}
+
+
+def _open_binary(path, compression):
+    if compression is None:
+        return open(path, "wb", buffering=WRITE_BUFFER_BYTES)
+    if compression == "gzip":
+        return gzip.open(path, "wb", compresslevel=6)
+    if compression == "zstd":
+        import zstandard
+        raw = open(path, "wb", buffering=WRITE_BUFFER_BYTES)
+        return zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def _open_text(path, compression):
+    return io.TextIOWrapper(_open_binary(path, compression), encoding="utf-8", newline="",
+                            write_through=False)
+
+
+class _ChunkedWriter:
+    """Collects rows and hands them to `_flush` a chunk at a time"""
+
+    extension = None
+    label = None
+
+    def __init__(self, path, compression=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        self.path = path
+        self.compression = compression
+        self.chunk_rows = chunk_rows
+        self.rows_written = 0
+        self._chunk = []
+
+    def write(self, row):
+        self._chunk.append(row)
+        if len(self._chunk) >= self.chunk_rows:
+            self._flush(self._chunk)
+            self._chunk = []
+
+    def write_batch(self, batch):
+        """Write a ListingBatch straight from its columns, after the rows written so far"""
+        if self._chunk:
+            self._flush(self._chunk)
+            self._chunk = []
+        if len(batch):
+            self._flush_batch(batch)
+
+    def close(self):
+        if self._chunk:
+            self._flush(self._chunk)
+            self._chunk = []
+        self._close()
+
+    def _flush(self, rows):
+        self.rows_written += len(rows)
+
+    def _flush_batch(self, batch):
+        self._flush([dict(zip(EXPORT_FIELDS, values)) for values in batch.iter_tuples(EXPORT_FIELDS)])
+
+
+class JsonWriter(_ChunkedWriter):
+    """A pretty-printed JSON array, written a chunk of elements at a time"""
+
+    extension = ".json"
+    label = "JSON"
+
+    def __init__(self, path, compression=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        super().__init__(path, compression, chunk_rows)
+        self._file = _open_text(path, compression)
+        self._file.write("[")
+
+    def _flush(self, rows):
+        # Each chunk is dumped as an array and spliced in without its brackets, so the
+        # file has exactly the layout of json.dump(all_rows, indent=2)
+        body = json.dumps(rows, indent=2, ensure_ascii=False)[1:-2]
+        self._file.write(("," if self.rows_written else "") + body)
+        super()._flush(rows)
+
+    def _close(self):
+        self._file.write("\n]" if self.rows_written else "]")
+        self._file.close()
+
+
+class NdjsonWriter(_ChunkedWriter):
+    """One compact JSON object per line"""
+
+    extension = ".ndjson"
+    label = "NDJSON"
+
+    def __init__(self, path, compression=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        super().__init__(path, compression, chunk_rows)
+        self._file = _open_text(path, compression)
+
+    def _flush(self, rows):
+        self._file.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+        super()._flush(rows)
+
+    def _close(self):
+        self._file.close()
+
+
+class CsvWriter(_ChunkedWriter):
+    extension = ".csv"
+    label = "CSV"
+
+    def __init__(self, path, compression=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        super().__init__(path, compression, chunk_rows)
+        self._file = _open_text(path, compression)
+        self._writer = csv.DictWriter(self._file, fieldnames=EXPORT_FIELDS)
+        self._writer.writeheader()
+        self._row_writer = csv.writer(self._file)
+        self._list_columns = [EXPORT_FIELDS.index(field) for field in LIST_FIELDS]
+
+    def _flush(self, rows):
+        # A cell holds one value, so lists become space-separated (image URLs have no spaces)
+        self._writer.writerows(
+            {**row, **{field: " ".join(row[field]) for field in LIST_FIELDS if row[field] is not None}}
+            for row in rows
+        )
+        super()._flush(rows)
+
+    def _flush_batch(self, batch):
+        # Rows go to csv.writer as tuples of the columns, only list columns are touched
+        columns = [batch.column(field) for field in EXPORT_FIELDS]
+        for index in self._list_columns:
+            columns[index] = [" ".join(value) if value is not None else None for value in columns[index]]
+        self._row_writer.writerows(zip(*columns))
+        self.rows_written += len(batch)
+
+    def _close(self):
+        self._file.close()
+
+
+class ParquetWriter(_ChunkedWriter):
+    """Columnar export for analytics, one row group per chunk; needs pyarrow"""
+
+    extension = ".parquet"
+    label = "Parquet"
+
+    def __init__(self, path, compression=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet export needs pyarrow, install it with: pip install pyarrow")
+        super().__init__(path, compression, chunk_rows)
+        self._pa = pa
+        self.schema = pa.schema([
+            (field, pa.int64() if field in INTEGER_FIELDS else pa.float64() if field in FLOAT_FIELDS
+             else pa.list_(pa.string()) if field in LIST_FIELDS else pa.string())
+            for field in EXPORT_FIELDS
+        ])
+        # Parquet compresses inside the file, so gzip/zstd become the column codec
+        self._writer = pq.ParquetWriter(path, self.schema, compression=compression or "snappy")
+
+    def _flush(self, rows):
+        columns = {field: [row[field] for row in rows] for field in EXPORT_FIELDS}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self.schema))
+        super()._flush(rows)
+
+    def _flush_batch(self, batch):
+        columns = {field: batch.column(field) for field in EXPORT_FIELDS}
+        self._writer.write_table(self._pa.Table.from_pydict(columns, schema=self.schema))
+        self.rows_written += len(batch)
+
+    def _close(self):
+        self._writer.close()
+
+
+WRITERS = {
+    "json": JsonWriter,
+    "csv": CsvWriter,
+    "ndjson": NdjsonWriter,
+    "parquet": ParquetWriter
+}
+
+
+class ExportSession:
+    """
+    Writes listings to every requested format in a single pass, as they are produced.
+
+    Rows are projected onto EXPORT_FIELDS and written in chunks, so memory stays flat
+    however many listings go through; ListingBatch columns are written as they are.
+    gzip/zstd compress the text formats as they are written (Parquet uses them as its
+    column codec instead).
+    """
+
+    def __init__(self, filename_base, output_format="both", compression=None, chunk_rows=DEFAULT_CHUNK_ROWS):
+        if compression is not None and compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.writers = []
+        directory = os.path.dirname(filename_base)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        try:
+            for name in parse_formats(output_format):
+                writer_class = WRITERS[name]
+                path = f"{filename_base}{writer_class.extension}"
+                if compression is not None and name != "parquet":
+                    path += COMPRESSIONS[compression]
+                self.writers.append(writer_class(path, compression, chunk_rows))
+        except Exception:
+            self.abort()
+            raise
+
+    def write_rows(self, items):
+        for item in items:
+            row = to_row(item)
+            for writer in self.writers:
+                writer.write(row)
+
+    def write_batch(self, batch):
+        """Write a ListingBatch; each format serializes its columns without a dict per listing"""
+        for writer in self.writers:
+            writer.write_batch(batch)
+
+    def close(self):
+        """
+        Finish every file.
+
+        Returns:
+            list: File info dicts with "path", "type" and "rows"
+        """
+        files_info = []
+        for writer in self.writers:
+            writer.close()
+            files_info.append({
+                "path": os.path.basename(writer.path),
+                "type": writer.label,
+                "rows": writer.rows_written
+            })
+        return files_info
+
+    def abort(self):
+        """Close and delete whatever was opened, e.g. after a failed scrape"""
+        for writer in self.writers:
+            try:
+                writer._close()
+            except Exception as e:
+                logger.warning(f"Error closing export {writer.path}: {str(e)}")
+            if os.path.exists(writer.path):
+                os.remove(writer.path)
+        self.writers = []
@@ -0,0 +1,329 @@
+import logging
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Listing card selectors, most stable first
+LISTING_SELECTORS = [
+    'li[data-aut-id="itemBox"]',
+    'li.EIR5N',
+    'li._1DNjI',
+    'li[data-testid="listing-card"]',
+    'div.IKo3_',
+    'div._2tW1I'
+]
+LISTING_WAIT_SELECTOR = ', '.join(LISTING_SELECTORS)
+
+# Text fields of a listing card, each with its selectors in priority order
+FIELD_SELECTORS = {
+    "title": ['[data-aut-id="itemTitle"]', 'span.fTZT3', '.IKo3_', 'h2'],
+    "price": ['[data-aut-id="itemPrice"]', 'span.rui-1ZsCJ', '.mNKEw', 'span._2Vp0i'],
+    "location": ['[data-aut-id="item-location"]', 'span.tjgMj', '._1KOFM', 'span._2VQu4'],
+    "date": ['[data-aut-id="item-date"]', 'span._2Vp0i', '._2DGqt', 'span._3XHzl'],
+    "seller": ['[data-aut-id="seller-name"]', 'span._3KMlK', '._3eNLO', 'span._1KQyH']
+}
+URL_SELECTOR = 'a'
+IMAGE_SELECTORS = ['img[data-aut-id="itemImage"]', 'img', '[data-aut-id="slider"] img']
+
+_COMPOUND_RE = re.compile(r'^(?P<tag>[a-zA-Z][\w-]*)?(?P<rest>(?:\.[\w-]+|\[[\w-]+(?:="[^"]*")?\])*)$')
+_PART_RE = re.compile(r'\.(?P<cls>[\w-]+)|\[(?P<attr>[\w-]+)(?:="(?P<value>[^"]*)")?\]')
+
+
+class _Compound:
+    """One `tag.class[attr="value"]` step of a selector"""
+
+    def __init__(self, tag, classes, attrs):
+        self.tag = tag
+        self.classes = classes
+        self.attrs = attrs
+
+    def matches(self, element):
+        if self.tag is not None and element.name != self.tag:
+            return False
+        if self.classes:
+            element_classes = element.get('class') or ()
+            for cls in self.classes:
+                if cls not in element_classes:
+                    return False
+        for name, value in self.attrs:
+            actual = element.get(name)
+            if actual is None or (value is not None and actual != value):
+                return False
+        return True
+
+
+class _Selector:
+    """A selector made of compounds joined by descendant combinators, matched right to left"""
+
+    def __init__(self, compounds):
+        self.compounds = compounds
+
+    def matches(self, element):
+        if not self.compounds[-1].matches(element):
+            return False
+        ancestor = element.parent
+        for compound in reversed(self.compounds[:-1]):
+            while ancestor is not None and not compound.matches(ancestor):
+                ancestor = ancestor.parent
+            if ancestor is None:
+                return False
+            ancestor = ancestor.parent
+        return True
+
+
+def compile_selector(selector):
+    """Compile a simple CSS selector for single-pass matching, or return None if it is not simple"""
+    compounds = []
+    for step in selector.split():
+        match = _COMPOUND_RE.match(step)
+        if not match:
+            return None
+        classes = []
+        attrs = []
+        for part in _PART_RE.finditer(match.group('rest')):
+            if part.group('cls'):
+                classes.append(part.group('cls'))
+            else:
+                attrs.append((part.group('attr'), part.group('value')))
+        compounds.append(_Compound(match.group('tag'), classes, attrs))
+    return _Selector(compounds) if compounds else None
+
+
+# Runs inside the browser: finds the cards and extracts every field of every card in one call.
+# Mirrors the per-element Playwright calls it replaces (querySelector, innerText, getAttribute).
+EXTRACT_LISTINGS_JS = """
+(schema) => {
+    let listingSelector = null;
+    let cards = [];
+    for (const selector of schema.listing) {
+        const found = document.querySelectorAll(selector);
+        if (found.length) {
+            listingSelector = selector;
+            cards = Array.from(found);
+            break;
+        }
+    }
+
+    const items = cards.map((card) => {
+        const item = {fields: {}, wins: {}};
+        for (const [field, selectors] of Object.entries(schema.fields)) {
+            item.fields[field] = null;
+            for (const selector of selectors) {
+                const el = card.querySelector(selector);
+                if (el) {
+                    item.fields[field] = el.innerText.trim();
+                    item.wins[field] = selector;
+                    break;
+                }
+            }
+        }
+
+        const link = card.querySelector(schema.url);
+        item.hasLink = !!link;
+        item.href = link ? link.getAttribute('href') : null;
+
+        item.image = null;
+        for (const selector of schema.image) {
+            const img = card.querySelector(selector);
+            if (img) {
+                item.image = img.getAttribute('src');
+                if (item.image) {
+                    break;
+                }
+            }
+        }
+        return item;
+    });
+
+    return {selector: listingSelector, items: items};
+}
+"""
+
+
+def extract_in_page(page, schema, base_url):
+    """
+    Extract all listings of a Playwright page with a single evaluate round trip.
+
+    Uses the same adaptive selector schema as the requests path and records the
+    winning selectors back into it.
+
+    Returns:
+        tuple: (winning listing selector or None, list of listings)
+    """
+    payload = page.evaluate(EXTRACT_LISTINGS_JS, {
+        "listing": schema.listing_selectors,
+        "fields": schema.field_selectors,
+        "url": URL_SELECTOR,
+        "image": schema.image_selectors
+    })
+    if payload["selector"]:
+        schema.record_win("listing", payload["selector"])
+
+    results = []
+    for item in payload["items"]:
+        item_data = {}
+        for field, value in item["fields"].items():
+            item_data[field] = value if value else "N/A"
+        for field, selector in item["wins"].items():
+            schema.record_win(field, selector)
+
+        href = item["href"]
+        if item["hasLink"]:
+            item_data["url"] = base_url + href if href and href.startswith('/') else href
+        else:
+            item_data["url"] = "N/A"
+
+        item_data["image"] = item["image"] if item["image"] else "N/A"
+        results.append(item_data)
+    return payload["selector"], results
+
+
+class AdaptiveSchema:
+    """
+    The listing/field selector schema plus the record of which selector won.
+
+    Selectors are always tried in their declared priority order; the win counts only
+    feed stats() and the logs. The extractor is shared by every search of the process,
+    so moving a fallback to the front after one odd card would make it outrank the
+    stable selector on every later page (an `h2` badge read as the title).
+    """
+
+    def __init__(self, listing_selectors=None, field_selectors=None, image_selectors=None):
+        self.listing_selectors = list(listing_selectors or LISTING_SELECTORS)
+        self.field_selectors = {
+            field: list(selectors) for field, selectors in (field_selectors or FIELD_SELECTORS).items()
+        }
+        self.image_selectors = list(image_selectors or IMAGE_SELECTORS)
+        self.wins = {field: {} for field in list(self.field_selectors) + ["listing"]}
+        self._lock = threading.Lock()
+
+    def stats(self):
+        """Return how often each selector won, per field"""
+        with self._lock:
+            return {field: dict(wins) for field, wins in self.wins.items()}
+
+    def record_win(self, field, selector):
+        """Count a win for the selector, logging the first win of any but the field's preferred one"""
+        with self._lock:
+            wins = self.wins[field]
+            wins[selector] = wins.get(selector, 0) + 1
+            first = wins[selector] == 1
+        selectors = self.listing_selectors if field == "listing" else self.field_selectors[field]
+        if first and selector != selectors[0]:
+            logger.info(f"Falling back to selector {selector} for {field}")
+
+
+class ListingExtractor(AdaptiveSchema):
+    """
+    Extracts listing cards from a BeautifulSoup tree using the schema compiled once.
+
+    Every field of a card is extracted in a single traversal of the card's subtree,
+    which stops as soon as every field has its preferred match.
+    """
+
+    def __init__(self, listing_selectors=None, field_selectors=None, image_selectors=None):
+        super().__init__(listing_selectors, field_selectors, image_selectors)
+        # Only the BeautifulSoup backends need it
+        import soupsieve
+
+        self._listing_patterns = {selector: soupsieve.compile(selector) for selector in self.listing_selectors}
+
+        # Every distinct selector is compiled once; anything too complex falls back to soupsieve
+        self._compiled = {}
+        self._fallback = {}
+        for selector in self._all_selectors():
+            compiled = compile_selector(selector)
+            if compiled is not None:
+                self._compiled[selector] = compiled
+            else:
+                self._fallback[selector] = soupsieve.compile(selector)
+
+    def _all_selectors(self):
+        seen = []
+        for selectors in list(self.field_selectors.values()) + [self.image_selectors, [URL_SELECTOR]]:
+            for selector in selectors:
+                if selector not in seen:
+                    seen.append(selector)
+        return seen
+
+    def find_listings(self, soup):
+        """
+        Return (selector, listings) for the first listing selector that matches anything.
+
+        Returns:
+            tuple: (winning selector or None, list of listing elements)
+        """
+        for selector in self.listing_selectors:
+            listings = self._listing_patterns[selector].select(soup)
+            if listings:
+                self.record_win("listing", selector)
+                return selector, listings
+        return None, []
+
+    def extract(self, listing, base_url):
+        """Extract every field of one listing card in a single pass over its descendants"""
+        first_match = self._first_matches(listing)
+
+        item_data = {}
+        for field, selectors in self.field_selectors.items():
+            value = None
+            for selector in selectors:
+                found = first_match.get(selector)
+                if found is not None:
+                    self.record_win(field, selector)
+                    value = found.get_text().strip()
+                    break
+            item_data[field] = value if value else "N/A"
+
+        url_elem = first_match.get(URL_SELECTOR)
+        if url_elem is not None and 'href' in url_elem.attrs:
+            href = url_elem['href']
+            item_data["url"] = base_url + href if href.startswith('/') else href
+        else:
+            item_data["url"] = "N/A"
+
+        img_elem = None
+        for selector in self.image_selectors:
+            img_elem = first_match.get(selector)
+            if img_elem is not None and 'src' in img_elem.attrs:
+                break
+        item_data["image"] = img_elem['src'] if img_elem is not None and 'src' in img_elem.attrs else "N/A"
+
+        return item_data
+
+    def _first_matches(self, listing):
+        """Map each selector to its first matching descendant, in document order like select_one"""
+        compiled = self._compiled
+        pending = list(compiled.items())
+        first_match = {}
+
+        # Once the preferred selector of every field has matched, nothing later can win
+        preferred = {selectors[0] for selectors in self.field_selectors.values()}
+        preferred.update((self.image_selectors[0], URL_SELECTOR))
+        can_stop = preferred <= set(compiled)
+
+        for element in listing.descendants:
+            if element.name is None:
+                continue
+            matched = False
+            for selector, pattern in pending:
+                if pattern.matches(element):
+                    first_match[selector] = element
+                    preferred.discard(selector)
+                    matched = True
+            if matched:
+                pending = [(selector, pattern) for selector, pattern in pending if selector not in first_match]
+                if not pending or (can_stop and not preferred and self._image_settled(first_match)):
+                    break
+
+        for selector, pattern in self._fallback.items():
+            found = pattern.select_one(listing)
+            if found is not None:
+                first_match[selector] = found
+        return first_match
+
+    def _image_settled(self, first_match):
+        # The image falls through to later selectors when the first match has no src
+        found = first_match.get(self.image_selectors[0])
+        return found is not None and 'src' in found.attrs
@@ -0,0 +1,291 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from blocking import BLOCK_STATUSES, CircuitBreaker, HostBlocked, retry_after_seconds
+from http_cache import CachingTransport
+from metrics import count, timed
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Blocking token bucket, refilled at `rate` tokens per second up to `capacity`"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Take one token, sleeping until one is available"""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class RequestsTransport:
+    """Default transport: one pooled requests.Session with keep-alive connections, optionally through a proxy"""
+
+    def __init__(self, pool_size=10, verify=False, proxy=None, cookies=None):
+        self.session = requests.Session()
+        self.session.verify = verify
+        if proxy:
+            self.session.proxies = {"http": proxy, "https": proxy}
+        if cookies is not None:
+            self.session.cookies = cookies
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url, headers=None, timeout=30):
+        return self.session.get(url, headers=headers, timeout=timeout)
+
+    def close(self):
+        self.session.close()
+
+
+class PageFetcher:
+    """
+    Fetches pages concurrently under a per-host concurrency cap and a per-host token-bucket rate limit.
+
+    Every host also has a circuit breaker: 429 and 403 responses open it, and while it is
+    open requests fail fast with HostBlocked instead of going out. Callers that parse the
+    pages report CAPTCHA pages and successful pages to `breaker` themselves.
+
+    With an `http_cache`, fresh cached responses are returned before any of that, without
+    waiting for a rate token, and stale ones are revalidated with conditional requests.
+
+    With an `identities` pool, every request goes out as one of its identities, through
+    the identity's proxy with its own headers and cookie jar, and the concurrency cap and
+    rate limit apply per host and identity, so throughput grows with the number of healthy
+    identities. A 429 or 403 then only ejects the identity that got it and the request is
+    retried with another one; the host's breaker opens once no identity is left. Requests
+    that fail without a response are retried with another identity as well.
+
+    The transport is anything with a `get(url, headers=None, timeout=30)` method returning an
+    object with `status_code` and `text`, so a stub can be swapped in for benchmarks. Identities
+    always get a RequestsTransport of their own.
+    """
+
+    def __init__(self, transport=None, pool_size=10, max_concurrency=3, rate=1.0, burst=2, timeout=30, breaker=None,
+                 http_cache=None, identities=None):
+        self.transport = transport or RequestsTransport(pool_size=pool_size)
+        if http_cache is not None:
+            self.transport = CachingTransport(self.transport, http_cache)
+        self.http_cache = http_cache
+        self.identities = identities
+        self.pool_size = pool_size
+        self._identity_transports = {}
+        self.breaker = breaker or CircuitBreaker()
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max(pool_size, max_concurrency))
+        self._host_limits = {}
+        self._lock = threading.Lock()
+
+    def _limits_for(self, url, identity=None):
+        key = (urlsplit(url).netloc, identity.name if identity is not None else None)
+        with self._lock:
+            if key not in self._host_limits:
+                rate = identity.rate if identity is not None and identity.rate is not None else self.rate
+                self._host_limits[key] = (
+                    threading.BoundedSemaphore(self.max_concurrency),
+                    TokenBucket(rate, self.burst)
+                )
+            return self._host_limits[key]
+
+    def _transport_for(self, identity):
+        if identity is None:
+            return self.transport
+        with self._lock:
+            transport = self._identity_transports.get(identity.name)
+            if transport is None:
+                transport = RequestsTransport(pool_size=self.pool_size, proxy=identity.proxy,
+                                              cookies=identity.cookies)
+                if self.http_cache is not None:
+                    transport = CachingTransport(transport, self.http_cache)
+                self._identity_transports[identity.name] = transport
+            return transport
+
+    def fetch(self, url, headers=None, trace=None):
+        """
+        Fetch a single URL, waiting for a concurrency slot and a rate token for its host.
+
+        With an identity pool the response carries the `identity` it was fetched as, for
+        callers that report CAPTCHA pages with record_block().
+        """
+        if self.http_cache is not None:
+            cached = self.http_cache.fresh(url)
+            if cached is not None:
+                if trace is not None:
+                    trace.count("http_cache_hits")
+                return cached
+        self.breaker.check(url)
+        if self.identities is None:
+            return self._fetch_as(url, headers, None, trace)
+
+        tried = []
+        response = error = None
+        while True:
+            try:
+                identity = self.identities.acquire(url, exclude=tried)
+            except HostBlocked:
+                if not tried:
+                    raise
+                # Every identity has had a go, hand back what the last one got
+                if error is not None:
+                    raise error
+                return response
+            tried.append(identity)
+            response = error = None
+            try:
+                response = self._fetch_as(url, headers, identity, trace)
+            except requests.RequestException as e:
+                error = e
+                self.identities.record_failure(identity, type(e).__name__)
+            finally:
+                self.identities.release(identity)
+
+            if error is None:
+                response.identity = identity
+                if response.status_code not in BLOCK_STATUSES:
+                    # A server error says nothing about the identity either way
+                    if response.status_code < 500:
+                        self.identities.record_success(identity)
+                    return response
+                if self.breaker.blocked(url) is not None:
+                    return response
+            count("olx_identity_retries_total", trace=trace, trace_key="identity_retries")
+
+    def _fetch_as(self, url, headers, identity, trace):
+        semaphore, bucket = self._limits_for(url, identity)
+        if identity is not None:
+            headers = identity.apply(headers)
+        with timed("rate_limit_wait", trace):
+            semaphore.acquire()
+            bucket.acquire()
+        try:
+            logger.info(f"Requesting: {url}" + (f" as {identity.name}" if identity is not None else ""))
+            try:
+                with timed("network", trace):
+                    response = self._transport_for(identity).get(url, headers=headers, timeout=self.timeout)
+            except requests.RequestException:
+                count("olx_request_errors_total", trace=trace, trace_key="request_errors")
+                raise
+        finally:
+            semaphore.release()
+
+        if response.status_code in BLOCK_STATUSES:
+            self.record_block(url, BLOCK_STATUSES[response.status_code], retry_after_seconds(response), identity)
+        count("olx_requests_total", trace=trace, trace_key="requests", status=response.status_code)
+        if trace is not None:
+            trace.count(f"status_{response.status_code}")
+        # A revalidated entry's body came from disk, the 304 carried none
+        if not getattr(response, "from_cache", False):
+            body = getattr(response, "content", None)
+            size = len(body) if body is not None else len(response.text.encode("utf-8"))
+            count("olx_response_bytes_total", size, trace=trace, trace_key="response_bytes")
+        return response
+
+    @property
+    def offline(self):
+        """Whether every fetch is replayed from the HTTP cache"""
+        return self.http_cache is not None and self.http_cache.offline
+
+    def forget(self, url):
+        """Drop the URL from the HTTP cache, e.g. after it turned out to be a CAPTCHA page"""
+        if self.http_cache is not None:
+            self.http_cache.invalidate(url)
+
+    def record_block(self, url, kind, retry_after=None, identity=None):
+        """
+        Report a block of the URL's host, as seen by `identity` if it was fetched as one.
+
+        Without an identity the host's circuit breaker opens. With one only the identity is
+        ejected, until it was the last one available: then the breaker opens until the
+        first identity is back.
+        """
+        if identity is not None and self.identities is not None:
+            self.identities.record_block(identity, kind, retry_after)
+            if self.identities.available():
+                return
+            retry_after = max(retry_after or 0.0, self.identities.next_available_in())
+        self.breaker.record_block(url, kind, retry_after)
+
+    def throttle(self, url, trace=None, identity=None):
+        """
+        Wait for a rate token for the URL's host without fetching it, for callers that fetch elsewhere,
+        such as a browser sending requests as `identity`
+        """
+        self.breaker.check(url)
+        _, bucket = self._limits_for(url, identity)
+        with timed("rate_limit_wait", trace):
+            bucket.acquire()
+
+    def submit(self, url, headers=None, trace=None):
+        """Start fetching a URL on the fetcher's pool, returning a Future of the response"""
+        return self._executor.submit(self.fetch, url, headers, trace)
+
+    def fetch_ordered(self, urls, headers_factory=None, window=None, trace=None):
+        """
+        Fetch URLs concurrently and yield them back in input order.
+
+        At most `window` requests (default `max_concurrency`) are kept ahead of the
+        consumer, so stopping early (e.g. on the last results page) wastes few fetches.
+
+        Yields:
+            tuple: (url, response, error) where exactly one of response/error is None
+        """
+        pending = deque()
+        url_iter = iter(urls)
+
+        def submit_next():
+            url = next(url_iter, None)
+            if url is None:
+                return False
+            headers = headers_factory() if headers_factory else None
+            pending.append((url, self.submit(url, headers, trace)))
+            return True
+
+        for _ in range(window or self.max_concurrency):
+            if not submit_next():
+                break
+
+        try:
+            while pending:
+                url, future = pending.popleft()
+                try:
+                    response, error = future.result(), None
+                except requests.RequestException as e:
+                    response, error = None, e
+                submit_next()
+                yield url, response, error
+        finally:
+            for _, future in pending:
+                future.cancel()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for transport in [self.transport, *self._identity_transports.values()]:
+            if hasattr(transport, "close"):
+                transport.close()
@@ -0,0 +1,39 @@
+"""
+Gunicorn settings for serving the app: gunicorn app:app (this file is picked up from
+the working directory; or pass -c gunicorn.conf.py).
+
+The app is imported once in the master and forked into the workers (preload_app), so
+workers boot without re-importing Flask and the scraper modules and share those pages
+copy-on-write. Nothing that cannot cross a fork is created on import: the listing store
+opens its connection in the process that first uses it, browsers and fetch threads are
+started by the first search, and the watch scheduler is started in post_worker_init.
+
+Jobs, batches and watches live in a worker's memory, so job polling and watches need a
+single worker unless requests are routed to the same one; scale with threads first.
+"""
+import os
+
+# Read by app.py on import: threads are started per worker, below, not in the master
+os.environ.setdefault("OLX_DEFER_BACKGROUND", "1")
+
+bind = os.environ.get("OLX_BIND", "0.0.0.0:5001")
+workers = int(os.environ.get("WEB_CONCURRENCY", 1))
+threads = int(os.environ.get("OLX_THREADS", 8))
+worker_class = "gthread"
+preload_app = os.environ.get("OLX_PRELOAD", "1") != "0"
+# Scrapes answered synchronously by / and /scrape can take a while
+timeout = int(os.environ.get("OLX_WORKER_TIMEOUT", 300))
+# Recycling a worker only forks the preloaded master again
+max_requests = int(os.environ.get("OLX_MAX_REQUESTS", 0))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+
+def on_starting(server):
+    from scraper import configure_logging
+    configure_logging("scraper.log")
+
+
+def post_worker_init(worker):
+    import app
+    app.start_background()
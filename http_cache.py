@@ -0,0 +1,252 @@
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Search pages are the ones worth a max-age of our own; OLX serves them uncacheable
+SEARCH_PATHS = ("/items/", "/api/relevance/")
+
+MAX_AGE_PATTERN = re.compile(r"max-age=(\d+)")
+
+
+class CachedResponse:
+    """The parts of a requests.Response the scrapers use, rebuilt from a cache entry"""
+
+    def __init__(self, url, status_code, content, headers, encoding):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.headers = requests.structures.CaseInsensitiveDict(headers)
+        self.encoding = encoding
+        self.from_cache = True
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding or "utf-8", errors="replace")
+
+
+class HttpCache:
+    """
+    On-disk cache of HTTP responses, gzip-compressed, capped at `max_bytes` with LRU eviction.
+
+    Entries are kept by URL, one file each, holding a JSON header line and the raw body.
+    A stored response is reused without a request while it is fresh: for up to
+    `max_age` seconds on SEARCH_PATHS, else for the response's own Cache-Control
+    max-age. Stale entries with an ETag or Last-Modified are revalidated with a
+    conditional GET. In `offline` mode every entry is served whatever its age and a
+    miss fails instead of going to the network, so runs replay exactly.
+    """
+
+    def __init__(self, directory, max_bytes=200 * 2**20, max_age=0, offline=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.offline = offline
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "revalidated": 0,
+            "misses": 0,
+            "stored": 0,
+            "evictions": 0,
+            "bytes_saved": 0
+        }
+        self._load_index()
+
+    def lookup(self, url):
+        """Return (cached response or None, whether it is fresh enough to use without a request)"""
+        path = self._path(url)
+        with self._lock:
+            if path not in self._entries:
+                return None, False
+        try:
+            with gzip.open(path, "rb") as f:
+                meta = json.loads(f.readline())
+                content = f.read()
+        except (OSError, ValueError, EOFError) as e:
+            logger.warning(f"Discarding unreadable HTTP cache entry {path}: {str(e)}")
+            self._remove(path)
+            return None, False
+
+        response = CachedResponse(url, meta["status"], content, meta["headers"], meta["encoding"])
+        fresh = self.offline or time.time() - meta["stored_at"] < self._max_age(url, response.headers)
+        return response, fresh
+
+    def fresh(self, url):
+        """The cached response if it can be used without any request, counted as a hit"""
+        cached, fresh = self.lookup(url)
+        if cached is None or not fresh:
+            return None
+        self.record("hits", len(cached.content))
+        self.touch(url)
+        return cached
+
+    def conditional_headers(self, cached):
+        """Validators to send with the request for a stale entry"""
+        headers = {}
+        if cached.headers.get("ETag"):
+            headers["If-None-Match"] = cached.headers["ETag"]
+        if cached.headers.get("Last-Modified"):
+            headers["If-Modified-Since"] = cached.headers["Last-Modified"]
+        return headers
+
+    def store(self, url, response):
+        """Keep a 200 response unless it forbids storing"""
+        if response.status_code != 200 or "no-store" in response.headers.get("Cache-Control", ""):
+            return
+        headers = {
+            name: response.headers[name]
+            for name in ("Content-Type", "ETag", "Last-Modified", "Cache-Control")
+            if response.headers.get(name)
+        }
+        meta = {"url": url, "status": 200, "headers": headers, "encoding": response.encoding,
+                "stored_at": time.time()}
+        path = self._path(url)
+        tmp_path = f"{path}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+                f.write(json.dumps(meta).encode("utf-8") + b"\n")
+                f.write(response.content)
+            os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        except OSError as e:
+            logger.warning(f"Could not write HTTP cache entry for {url}: {str(e)}")
+            return
+        with self._lock:
+            self._size += size - self._entries.pop(path, 0)
+            self._entries[path] = size
+            self._stats["stored"] += 1
+            self._evict()
+
+    def touch(self, url):
+        """Mark an entry recently used, keeping the LRU order across restarts"""
+        path = self._path(url)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+
+    def refresh(self, url, cached):
+        """Restart an entry's max-age after the server confirmed it with a 304"""
+        self.store(url, cached)
+
+    def invalidate(self, url):
+        """Forget the URL, e.g. when what came back was a CAPTCHA page rather than results"""
+        self._remove(self._path(url))
+
+    def record(self, result, saved_bytes=0):
+        with self._lock:
+            self._stats[result] += 1
+            self._stats["bytes_saved"] += saved_bytes
+
+    def clear(self):
+        with self._lock:
+            paths = list(self._entries)
+        for path in paths:
+            self._remove(path)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats["hits"] + stats["revalidated"] + stats["misses"]
+            stats["hit_rate"] = round((stats["hits"] + stats["revalidated"]) / lookups, 3) if lookups else 0.0
+            stats["entries"] = len(self._entries)
+            stats["size_bytes"] = self._size
+            stats["max_bytes"] = self.max_bytes
+            stats["offline"] = self.offline
+        return stats
+
+    def _max_age(self, url, headers):
+        if urlsplit(url).path.startswith(SEARCH_PATHS):
+            return self.max_age
+        cache_control = headers.get("Cache-Control", "")
+        if "no-cache" in cache_control:
+            return 0
+        match = MAX_AGE_PATTERN.search(cache_control)
+        return int(match.group(1)) if match else 0
+
+    def _path(self, url):
+        return os.path.join(self.directory, f"{hashlib.sha1(url.encode('utf-8')).hexdigest()}.gz")
+
+    def _load_index(self):
+        """Rebuild the LRU order from the files' modification times"""
+        if not os.path.isdir(self.directory):
+            return
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".gz"):
+                stat = entry.stat()
+                found.append((stat.st_mtime, entry.path, stat.st_size))
+        for _, path, size in sorted(found):
+            self._entries[path] = size
+            self._size += size
+        with self._lock:
+            self._evict()
+
+    def _evict(self):
+        while self._size > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._size -= size
+            self._stats["evictions"] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _remove(self, path):
+        with self._lock:
+            self._size -= self._entries.pop(path, 0)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class CachingTransport:
+    """Fetcher transport that answers from an HttpCache where it can and fills it otherwise"""
+
+    def __init__(self, transport, cache):
+        self.transport = transport
+        self.cache = cache
+
+    def get(self, url, headers=None, timeout=30):
+        cached, fresh = self.cache.lookup(url)
+        if cached is not None and fresh:
+            self.cache.record("hits", len(cached.content))
+            self.cache.touch(url)
+            return cached
+        if self.cache.offline:
+            self.cache.record("misses")
+            raise requests.ConnectionError(f"{url} is not in the offline HTTP cache")
+
+        if cached is not None:
+            headers = {**(headers or {}), **self.cache.conditional_headers(cached)}
+        response = self.transport.get(url, headers=headers, timeout=timeout)
+
+        if cached is not None and response.status_code == 304:
+            self.cache.record("revalidated", len(cached.content))
+            self.cache.refresh(url, cached)
+            return cached
+        self.cache.record("misses")
+        self.cache.store(url, response)
+        return response
+
+    def close(self):
+        if hasattr(self.transport, "close"):
+            self.transport.close()
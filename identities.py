@@ -0,0 +1,240 @@
+import logging
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from requests.cookies import RequestsCookieJar
+
+from blocking import HostBlocked
+from metrics import count
+
+logger = logging.getLogger(__name__)
+
+# Browser profiles an identity keeps for its whole life: the client hints have to agree with
+# the user agent, and Firefox and Safari send none at all (None removes the header)
+PROFILES = [
+    {
+        "user_agent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115.0.0.0 Safari/537.36',
+        "headers": {
+            'Sec-Ch-Ua': '"Chromium";v="115", "Not/A)Brand";v="99"',
+            'Sec-Ch-Ua-Mobile': '?0',
+            'Sec-Ch-Ua-Platform': '"Windows"'
+        }
+    },
+    {
+        "user_agent": 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.5 Safari/605.1.15',
+        "headers": {'Sec-Ch-Ua': None, 'Sec-Ch-Ua-Mobile': None, 'Sec-Ch-Ua-Platform': None}
+    },
+    {
+        "user_agent": 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:109.0) Gecko/20100101 Firefox/113.0',
+        "headers": {'Sec-Ch-Ua': None, 'Sec-Ch-Ua-Mobile': None, 'Sec-Ch-Ua-Platform': None}
+    },
+    {
+        "user_agent": 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36',
+        "headers": {
+            'Sec-Ch-Ua': '"Chromium";v="114", "Not/A)Brand";v="99"',
+            'Sec-Ch-Ua-Mobile': '?0',
+            'Sec-Ch-Ua-Platform': '"Linux"'
+        }
+    }
+]
+
+# Proxy list entry for requests leaving from this machine's own address
+DIRECT = "direct"
+
+# Health moves this far towards 1 on a success and is multiplied by ERROR_FACTOR on a failure
+RECOVERY = 0.2
+ERROR_FACTOR = 0.7
+
+
+class Identity:
+    """
+    A proxy (or none) with the user agent, header set and cookie jar that always go with it.
+
+    `rate` overrides the fetcher's per-host rate for this identity, e.g. for a slower proxy.
+    """
+
+    def __init__(self, name, proxy=None, profile=None, rate=None):
+        profile = profile or PROFILES[0]
+        self.name = name
+        self.proxy = proxy
+        self.user_agent = profile["user_agent"]
+        self.headers = {'User-Agent': self.user_agent, **profile["headers"]}
+        self.cookies = RequestsCookieJar()
+        self.rate = rate
+        self.health = 1.0
+        self.state = "active"
+        self.available_at = 0.0
+        self.ejections = 0
+        self.in_flight = 0
+        self.last_used = 0.0
+        self.last_failure = None
+        self.stats = {"requests": 0, "successes": 0, "failures": 0, "blocks": 0}
+
+    def apply(self, headers=None):
+        """The request headers with this identity's own in place of whatever was rotated in"""
+        merged = dict(headers or {})
+        for name, value in self.headers.items():
+            if value is None:
+                merged.pop(name, None)
+            else:
+                merged[name] = value
+        return merged
+
+    def browser_cookies(self):
+        """The cookie jar in the shape Playwright's add_cookies takes"""
+        return [
+            {"name": cookie.name, "value": cookie.value, "domain": cookie.domain, "path": cookie.path or "/"}
+            for cookie in self.cookies
+            if cookie.domain
+        ]
+
+    def update_cookies(self, cookies):
+        """Take back the cookies a browser context collected, so the requests path sends them too"""
+        for cookie in cookies:
+            self.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"])
+
+
+class IdentityPool:
+    """
+    Identities requests are spread over, with a health score and ejection per identity.
+
+    `acquire` hands out the active identity with the fewest requests in flight, the
+    healthiest first among equals. Successes raise its health and failures (connection
+    errors, proxy errors, timeouts) lower it; below `min_health` it is ejected. A block
+    (429, 403 or a CAPTCHA page) ejects it at once. Ejected identities come back after a
+    cooldown that doubles with each consecutive ejection, never shorter than the block's
+    Retry-After, on probation at `min_health` plus a margin so one more failure ejects
+    them again. When every identity is out, `acquire` raises HostBlocked until the
+    first one is back.
+    """
+
+    def __init__(self, identities, cooldown=60.0, max_cooldown=1800.0, min_health=0.3):
+        if not identities:
+            raise ValueError("An identity pool needs at least one identity")
+        self.identities = list(identities)
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.min_health = min_health
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_proxies(cls, proxies, rate=None, **kwargs):
+        """
+        One identity per proxy URL, each with the next browser profile in turn.
+
+        "direct" stands for requests from this machine's own address.
+        """
+        identities = []
+        for i, proxy in enumerate(proxies):
+            proxy = proxy.strip()
+            if proxy == DIRECT:
+                name, proxy = f"{i}-direct", None
+            else:
+                parts = urlsplit(proxy)
+                # Credentials stay out of the name, it ends up in logs and metrics
+                name = f"{i}-{parts.hostname}:{parts.port}" if parts.port else f"{i}-{parts.hostname}"
+            identities.append(Identity(name, proxy, PROFILES[i % len(PROFILES)], rate))
+        return cls(identities, **kwargs)
+
+    def __len__(self):
+        return len(self.identities)
+
+    def acquire(self, url, exclude=()):
+        """
+        Take the identity to send the next request to the URL's host from.
+
+        Identities in `exclude` (e.g. those a request already failed with) are skipped.
+        Raises HostBlocked when none is available. Pair every acquire with release().
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._readmit(now)
+            active = [i for i in self.identities if i.state == "active" and i not in exclude]
+            if not active:
+                waiting = [i.available_at - now for i in self.identities if i.state == "ejected"]
+                retry_in = max(0.0, min(waiting)) if waiting else 0.0
+                raise HostBlocked(urlsplit(url).netloc, "no_identity", retry_in)
+            identity = min(active, key=lambda i: (i.in_flight, -i.health, i.last_used))
+            identity.in_flight += 1
+            identity.last_used = now
+            identity.stats["requests"] += 1
+        return identity
+
+    def release(self, identity):
+        with self._lock:
+            identity.in_flight -= 1
+
+    def record_success(self, identity):
+        with self._lock:
+            identity.health += (1.0 - identity.health) * RECOVERY
+            identity.ejections = 0
+            identity.stats["successes"] += 1
+
+    def record_failure(self, identity, reason):
+        """A request that failed without a usable response; ejects the identity once its health runs out"""
+        with self._lock:
+            identity.health *= ERROR_FACTOR
+            identity.last_failure = reason
+            identity.stats["failures"] += 1
+            if identity.state == "active" and identity.health < self.min_health:
+                self._eject(identity, reason)
+
+    def record_block(self, identity, kind, retry_after=None):
+        with self._lock:
+            identity.last_failure = kind
+            identity.stats["blocks"] += 1
+            if identity.state == "active":
+                self._eject(identity, kind, retry_after)
+
+    def available(self):
+        """Whether any identity can take requests right now"""
+        now = time.monotonic()
+        with self._lock:
+            self._readmit(now)
+            return any(i.state == "active" for i in self.identities)
+
+    def next_available_in(self):
+        """Seconds until the first ejected identity is back, 0 if one is active now"""
+        now = time.monotonic()
+        with self._lock:
+            self._readmit(now)
+            if any(i.state == "active" for i in self.identities):
+                return 0.0
+            return max(0.0, min(i.available_at for i in self.identities) - now)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            self._readmit(now)
+            return {
+                identity.name: {
+                    "state": identity.state,
+                    "health": round(identity.health, 3),
+                    "user_agent": identity.user_agent,
+                    "in_flight": identity.in_flight,
+                    "ejections": identity.ejections,
+                    "last_failure": identity.last_failure,
+                    "retry_in": round(max(0.0, identity.available_at - now), 1) if identity.state == "ejected" else 0.0,
+                    **identity.stats
+                }
+                for identity in self.identities
+            }
+
+    def _eject(self, identity, reason, retry_after=None):
+        cooldown = min(self.max_cooldown, self.cooldown * 2 ** identity.ejections) * random.uniform(0.75, 1.25)
+        if retry_after is not None:
+            cooldown = max(cooldown, retry_after)
+        identity.state = "ejected"
+        identity.ejections += 1
+        identity.available_at = time.monotonic() + cooldown
+        count("olx_identity_ejections_total", reason=reason)
+        logger.warning(f"Identity {identity.name} ejected ({reason}) for {cooldown:.0f}s")
+
+    def _readmit(self, now):
+        for identity in self.identities:
+            if identity.state == "ejected" and identity.available_at <= now:
+                identity.state = "active"
+                identity.health = self.min_health + RECOVERY / 2
+                logger.info(f"Identity {identity.name} back in the pool on probation")
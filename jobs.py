@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cache import normalize_key
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+
+class QueueFullError(Exception):
+    """Raised when too many jobs are already waiting for a worker"""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running scrape once its job has been cancelled"""
+
+
+class Job:
+    def __init__(self, query, pages, output_format, compression=None):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.pages = pages
+        self.output_format = output_format
+        self.compression = compression
+        self.status = QUEUED
+        self.pages_done = 0
+        self.results = []
+        self.files = []
+        self.error = None
+        # Set by the runner when the search was blocked or its sources failed
+        self.degraded = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        # Notified whenever results, progress or status change, for streaming followers
+        self.changed = threading.Condition()
+
+    @property
+    def key(self):
+        return f"{normalize_key(self.query, self.pages)}|{self.output_format}|{self.compression}"
+
+    def page_done(self, page_num):
+        """Progress callback handed to the scraper"""
+        with self.changed:
+            self.pages_done = page_num
+            self.changed.notify_all()
+
+    def add_results(self, items):
+        """Append the listings of a freshly parsed page"""
+        with self.changed:
+            self.results.extend(items)
+            self.changed.notify_all()
+
+    def set_status(self, status):
+        with self.changed:
+            self.status = status
+            if status not in ACTIVE_STATES:
+                self.finished_at = time.time()
+            self.changed.notify_all()
+
+    def follow(self, timeout=15):
+        """
+        Yield ("listing", item), ("progress", pages_done) and finally ("status", status)
+        events as the job makes progress, starting from its first listing. A
+        ("keepalive", None) event is yielded when nothing happened for `timeout` seconds.
+        """
+        sent = 0
+        pages_sent = 0
+        while True:
+            with self.changed:
+                if (sent == len(self.results) and pages_sent == self.pages_done
+                        and self.status in ACTIVE_STATES):
+                    self.changed.wait(timeout)
+                new_items = self.results[sent:]
+                pages_done = self.pages_done
+                status = self.status
+
+            if not new_items and pages_done == pages_sent and status in ACTIVE_STATES:
+                # Lets the stream's reader (and any proxy in between) tell a slow page from a dead connection
+                yield "keepalive", None
+                continue
+            sent += len(new_items)
+            for item in new_items:
+                yield "listing", item
+            if pages_done != pages_sent:
+                pages_sent = pages_done
+                yield "progress", pages_done
+            if status not in ACTIVE_STATES:
+                yield "status", status
+                return
+
+    def to_dict(self, include_results=True):
+        data = {
+            "id": self.id,
+            "query": self.query,
+            "pages": self.pages,
+            "format": self.output_format,
+            "compression": self.compression,
+            "status": self.status,
+            "pages_done": self.pages_done,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if self.status == DONE:
+            data["total_listings"] = len(self.results)
+            data["files"] = self.files
+            if include_results:
+                data["results"] = self.results
+        if self.error:
+            data["error"] = self.error
+        if self.degraded:
+            data["degraded"] = self.degraded
+        return data
+
+
+class JobManager:
+    """
+    Runs scrape jobs on a bounded worker pool.
+
+    `runner(job)` does the actual work and returns (results, files), feeding each parsed
+    page to `job.add_results` as it goes. Identical in-flight jobs are deduplicated, the
+    number of queued jobs is capped, and finished jobs are kept for `retention` seconds
+    so clients can collect them.
+    """
+
+    def __init__(self, runner, max_workers=2, max_queue=20, retention=3600):
+        self.runner = runner
+        self.max_queue = max_queue
+        self.retention = retention
+        self._jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scrape-job")
+
+    def submit(self, query, pages, output_format="both", compression=None):
+        """Queue a job, or return the identical job already queued or running"""
+        job = Job(query, pages, output_format, compression)
+
+        with self._lock:
+            self._prune()
+            existing = self._active.get(job.key)
+            if existing is not None and existing.status in ACTIVE_STATES:
+                logger.info(f"Reusing in-flight job {existing.id} for: {query}")
+                return existing
+
+            queued = sum(1 for j in self._active.values() if j.status == QUEUED)
+            if queued >= self.max_queue:
+                raise QueueFullError(f"Too many queued jobs ({queued}), try again later")
+
+            self._jobs[job.id] = job
+            self._active[job.key] = job
+
+        logger.info(f"Queued job {job.id} for: {query}, Pages: {pages}")
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Request cancellation; queued jobs stop immediately, running ones after the current page"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in ACTIVE_STATES:
+                return job
+            job.cancel_event.set()
+            if job.status == QUEUED:
+                self._finish(job, CANCELLED)
+        logger.info(f"Cancellation requested for job {job_id}")
+        return job
+
+    def stats(self):
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+            return counts
+
+    def _run(self, job):
+        with self._lock:
+            if job.status != QUEUED:
+                return
+            job.started_at = time.time()
+            job.set_status(RUNNING)
+
+        try:
+            results, files = self.runner(job)
+        except JobCancelled:
+            logger.info(f"Job {job.id} cancelled")
+            with self._lock:
+                self._finish(job, CANCELLED)
+            return
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            with self._lock:
+                job.error = str(e)
+                self._finish(job, FAILED)
+            return
+
+        with self._lock:
+            job.results = results
+            job.files = files
+            self._finish(job, DONE)
+        logger.info(f"Job {job.id} finished with {len(results)} listings")
+
+    def _finish(self, job, status):
+        job.set_status(status)
+        if self._active.get(job.key) is job:
+            del self._active[job.key]
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
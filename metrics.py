@@ -0,0 +1,159 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage durations span sub-millisecond parses up to minute-long Playwright searches
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+METRICS = {
+    "olx_stage_seconds": ("histogram", "Time spent in each stage of a search"),
+    "olx_searches_total": ("counter", "Searches, by whether they were served from the result cache"),
+    "olx_requests_total": ("counter", "HTTP requests made by the fetcher, by status code"),
+    "olx_request_errors_total": ("counter", "HTTP requests that failed without a response"),
+    "olx_response_bytes_total": ("counter", "Bytes of response bodies received by the fetcher"),
+    "olx_listings_total": ("counter", "Listings extracted, by source"),
+    "olx_fallbacks_total": ("counter", "Searches that fell back to a slower source"),
+    "olx_browser_pages_total": ("counter", "Pages loaded in Playwright"),
+    "olx_blocks_total": ("counter", "Times a host's circuit breaker opened, by kind of block"),
+    "olx_degraded_searches_total": ("counter", "Searches that returned stale, partial or no results, by reason"),
+    "olx_identity_ejections_total": ("counter", "Times an identity was taken out of the pool, by reason"),
+    "olx_identity_retries_total": ("counter", "Requests retried as another identity after a block or a failure"),
+    "olx_details_total": ("counter", "Listings by what enrichment did with their detail page"),
+    "olx_watch_runs_total": ("counter", "Watch runs, by whether they produced a live result"),
+    "olx_watch_events_total": ("counter", "Watch events emitted, by type"),
+    "olx_webhook_requests_total": ("counter", "Webhook deliveries of watch events, by result")
+}
+
+
+class Trace:
+    """Stage timings and counters of a single search, returned with it when asked for"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add_time(self, stage, seconds):
+        with self._lock:
+            total, count = self.stages.get(stage, (0.0, 0))
+            self.stages[stage] = (total + seconds, count + 1)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def event(self, name):
+        with self._lock:
+            self.events.append({"event": name, "at": round(time.perf_counter() - self.started, 4)})
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "total_seconds": round(time.perf_counter() - self.started, 4),
+                "stages": {
+                    stage: {"seconds": round(total, 4), "count": count}
+                    for stage, (total, count) in sorted(self.stages.items(), key=lambda s: -s[1][0])
+                },
+                "counters": dict(self.counters),
+                "events": list(self.events)
+            }
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms, rendered in the Prometheus text format.
+
+    Collectors registered with `register_collector` are called at render time for
+    values that already live elsewhere (selector wins, browser pool counters).
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def register_collector(self, collector):
+        """`collector()` returns (name, type, help, [(labels dict, value), ...]) tuples"""
+        self._collectors.append(collector)
+
+    def render(self):
+        families = {}
+        with self._lock:
+            for (name, labels), value in self._counters.items():
+                families.setdefault(name, []).append(_sample(name, labels, value))
+            for (name, labels), histogram in self._histograms.items():
+                samples = families.setdefault(name, [])
+                for bound, cumulative in zip(self.buckets, histogram["buckets"]):
+                    samples.append(_sample(f"{name}_bucket", labels + (("le", repr(bound)),), cumulative))
+                samples.append(_sample(f"{name}_bucket", labels + (("le", "+Inf"),), histogram["count"]))
+                samples.append(_sample(f"{name}_sum", labels, histogram["sum"]))
+                samples.append(_sample(f"{name}_count", labels, histogram["count"]))
+
+        lines = []
+        for name in sorted(families):
+            kind, description = METRICS.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(families[name])
+        for collector in self._collectors:
+            for name, kind, description, samples in collector():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(_sample(name, tuple(sorted(labels.items())), value))
+        return "\n".join(lines) + "\n"
+
+
+def _sample(name, labels, value):
+    if labels:
+        rendered = ",".join(f'{key}="{_escape(str(val))}"' for key, val in labels)
+        return f"{name}{{{rendered}}} {value}"
+    return f"{name} {value}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+registry = MetricsRegistry()
+
+
+@contextmanager
+def timed(stage, trace=None):
+    """Time a block into the olx_stage_seconds histogram and the search's trace, if any"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe("olx_stage_seconds", elapsed, stage=stage)
+        if trace is not None:
+            trace.add_time(stage, elapsed)
+
+
+def count(name, amount=1, trace=None, trace_key=None, **labels):
+    """Increment a registry counter, and the trace counter `trace_key` when tracing"""
+    registry.inc(name, amount, **labels)
+    if trace is not None and trace_key is not None:
+        trace.count(trace_key, amount)
@@ -0,0 +1,174 @@
+import logging
+import threading
+
+from extraction import AdaptiveSchema, ListingExtractor
+
+logger = logging.getLogger(__name__)
+
+NEXT_PAGE_SELECTOR = 'a[data-aut-id="btnLoadMore"], button.rui-3sH3b, .rui-77FWl'
+
+# Tried in order when the backend is "auto"; html.parser is always available
+BACKEND_PREFERENCE = ["selectolax", "lxml", "html.parser"]
+
+
+class SoupBackend:
+    """BeautifulSoup tree with the compiled single-pass extractor, on html.parser or lxml"""
+
+    def __init__(self, builder="html.parser"):
+        from bs4 import BeautifulSoup
+        self.name = builder
+        self.builder = builder
+        self._soup = BeautifulSoup
+        self.extractor = ListingExtractor()
+
+    def parse(self, html):
+        return self._soup(html, self.builder)
+
+    def find_listings(self, document):
+        return self.extractor.find_listings(document)
+
+    def extract(self, listing, base_url):
+        return self.extractor.extract(listing, base_url)
+
+    def has_next_page(self, document):
+        return document.select_one(NEXT_PAGE_SELECTOR) is not None
+
+    def stats(self):
+        return self.extractor.stats()
+
+
+class SelectolaxExtractor(AdaptiveSchema):
+    """Same schema and output as ListingExtractor, matched by lexbor's C selector engine"""
+
+    def find_listings(self, tree):
+        for selector in self.listing_selectors:
+            listings = tree.css(selector)
+            if listings:
+                self.record_win("listing", selector)
+                return selector, listings
+        return None, []
+
+    def extract(self, listing, base_url):
+        item_data = {}
+        for field, selectors in self.field_selectors.items():
+            value = None
+            for selector in selectors:
+                found = self._select_one(listing, selector)
+                if found is not None:
+                    self.record_win(field, selector)
+                    value = found.text(deep=True).strip()
+                    break
+            item_data[field] = value if value else "N/A"
+
+        # Valueless attributes come back as None from lexbor but as "" from BeautifulSoup
+        url_elem = self._select_one(listing, 'a')
+        if url_elem is not None and 'href' in url_elem.attributes:
+            href = url_elem.attributes['href'] or ""
+            item_data["url"] = base_url + href if href.startswith('/') else href
+        else:
+            item_data["url"] = "N/A"
+
+        src = None
+        for selector in self.image_selectors:
+            img_elem = self._select_one(listing, selector)
+            if img_elem is not None and 'src' in img_elem.attributes:
+                src = img_elem.attributes['src'] or ""
+                break
+        item_data["image"] = src if src is not None else "N/A"
+
+        return item_data
+
+    def _select_one(self, node, selector):
+        # Unlike soupsieve's select_one, lexbor can match the node itself, which must be skipped
+        found = node.css_first(selector)
+        if found is not None and found == node:
+            matches = node.css(selector)
+            found = matches[1] if len(matches) > 1 else None
+        return found
+
+
+class SelectolaxBackend:
+    """selectolax (lexbor) parser, several times faster than building a soup"""
+
+    name = "selectolax"
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser = LexborHTMLParser
+        self.extractor = SelectolaxExtractor()
+
+    def parse(self, html):
+        return self._parser(html)
+
+    def find_listings(self, document):
+        return self.extractor.find_listings(document)
+
+    def extract(self, listing, base_url):
+        return self.extractor.extract(listing, base_url)
+
+    def has_next_page(self, document):
+        return document.css_first(NEXT_PAGE_SELECTOR) is not None
+
+    def stats(self):
+        return self.extractor.stats()
+
+
+def get_parser_backend(name="auto"):
+    """
+    Return a parser backend by name ("selectolax", "lxml", "html.parser" or "auto").
+
+    A backend whose library is not installed falls back to the next one in
+    BACKEND_PREFERENCE, ending with the pure-Python html.parser.
+    """
+    names = BACKEND_PREFERENCE if name == "auto" else [name] + BACKEND_PREFERENCE
+    for candidate in names:
+        try:
+            if candidate == "selectolax":
+                backend = SelectolaxBackend()
+            elif candidate == "lxml":
+                import lxml  # noqa: F401
+                backend = SoupBackend("lxml")
+            elif candidate == "html.parser":
+                backend = SoupBackend("html.parser")
+            else:
+                logger.warning(f"Unknown parser backend: {candidate}")
+                continue
+        except ImportError:
+            if candidate == name:
+                logger.warning(f"Parser backend {candidate} is not installed, falling back")
+            continue
+        logger.info(f"Using {backend.name} parser backend")
+        return backend
+
+
+class LazyParserBackend:
+    """
+    Stands in for get_parser_backend(name) until a page actually needs parsing.
+
+    Searches served by the search API or the embedded state, and processes that never
+    search at all, then never import a parser library.
+    """
+
+    def __init__(self, name="auto"):
+        self.requested = name
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = get_parser_backend(self.requested)
+        return self._backend
+
+    @property
+    def loaded(self):
+        return self._backend is not None
+
+    def stats(self):
+        # Nothing has been matched before the backend is loaded
+        return self._backend.stats() if self._backend is not None else {}
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
@@ -0,0 +1,295 @@
+import math
+import re
+import sys
+from array import array
+from datetime import datetime, timedelta, timezone
+
+# Display fields shown on the cards, then the typed fields added to every listing
+CARD_FIELDS = ["title", "price", "location", "date", "seller", "url", "image"]
+TYPED_FIELDS = ["ad_id", "price_value", "posted_at", "locality", "city", "latitude", "longitude"]
+LISTING_FIELDS = CARD_FIELDS + TYPED_FIELDS
+
+# Only on an ad's detail page; `images` is a list of URLs, `enriched_at` when the page was read
+DETAIL_FIELDS = ["description", "images", "seller_id", "enriched_at"]
+
+# Column types; everything else is a string
+INTEGER_FIELDS = {"price_value"}
+FLOAT_FIELDS = {"latitude", "longitude", "enriched_at", "first_seen", "last_seen"}
+LIST_FIELDS = {"images"}
+# String columns with few distinct values, interned so a batch holds each value once
+CATEGORY_FIELDS = {"location", "locality", "city", "date", "seller", "posted_at"}
+
+# OLX India shows card dates in Indian time
+IST = timezone(timedelta(hours=5, minutes=30))
+
+_DETAIL_SET = frozenset(DETAIL_FIELDS)
+_AD_ID_RE = re.compile(r'-iid-(\d+)')
+_PRICE_RE = re.compile(r'(\d[\d,]*(?:\.\d+)?)\s*(lakh|lac|l|crore|cr)?\b', re.IGNORECASE)
+_AGO_RE = re.compile(r'(\d+)\s*(minute|min|hour|hr|day|week|month)s?\s+ago', re.IGNORECASE)
+_MULTIPLIERS = {"lakh": 100000, "lac": 100000, "l": 100000, "crore": 10000000, "cr": 10000000}
+_UNITS = {"minute": timedelta(minutes=1), "min": timedelta(minutes=1), "hour": timedelta(hours=1),
+          "hr": timedelta(hours=1), "day": timedelta(days=1), "week": timedelta(weeks=1),
+          "month": timedelta(days=30)}
+
+
+class Listing:
+    """
+    One listing, with its display, typed and detail-page fields as slots.
+
+    Behaves like the dicts listings used to be (`item["price"]`, `item.get("ad_id")`,
+    `dict(item)`), so consumers and the JSON encoders need no changes; the detail-page
+    fields only appear in `keys()` once the listing has been enriched.
+    """
+
+    FIELDS = tuple(LISTING_FIELDS + DETAIL_FIELDS)
+    __slots__ = FIELDS
+
+    def __init__(self, **fields):
+        for field in self.FIELDS:
+            setattr(self, field, None)
+        for field, value in fields.items():
+            self[field] = value
+
+    @classmethod
+    def from_dict(cls, item):
+        """A Listing from a listing dict, e.g. one read back from JSON; unknown keys are dropped"""
+        listing = cls()
+        for field in cls.FIELDS:
+            if field in item:
+                setattr(listing, field, item[field])
+        return listing
+
+    @property
+    def posted(self):
+        """posted_at as an aware datetime, or None"""
+        return parse_timestamp(self.posted_at)
+
+    def keys(self):
+        return list(self.FIELDS) if self.enriched_at else list(LISTING_FIELDS)
+
+    def items(self):
+        return [(field, getattr(self, field)) for field in self.keys()]
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.keys()}
+
+    def get(self, field, default=None):
+        if field in self.__slots__:
+            return getattr(self, field)
+        return default
+
+    def __getitem__(self, field):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __setitem__(self, field, value):
+        if field not in self.__slots__:
+            raise KeyError(field)
+        setattr(self, field, value)
+
+    def __contains__(self, field):
+        return field in self.__slots__ and (field not in _DETAIL_SET or bool(self.enriched_at))
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Listing, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Listing(ad_id={self.ad_id!r}, title={self.title!r}, price_value={self.price_value!r})"
+
+
+def json_default(value):
+    """`default=` for json.dump(s): listings are written as their dicts"""
+    if isinstance(value, Listing):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def parse_price(text):
+    """
+    Rupees in a card's price text: "₹ 1,500" is 1500, "₹ 1.5 Lakh" is 150000.
+
+    Returns None for "N/A", free items and anything without a number.
+    """
+    if not text:
+        return None
+    match = _PRICE_RE.search(text)
+    if not match:
+        return None
+    number = float(match.group(1).replace(",", ""))
+    if match.group(2):
+        number *= _MULTIPLIERS[match.group(2).lower()]
+    return int(round(number))
+
+
+def parse_posted(text, now=None):
+    """
+    The posting time a card's relative date stands for, in Indian time.
+
+    "Today", "Yesterday" and "N days ago" give the start of that day, "N hours ago" the
+    hour, and "Mar 01" that date in the last year it was not in the future. Returns None
+    for anything else.
+    """
+    if not text or text == "N/A":
+        return None
+    now = (now or datetime.now(timezone.utc)).astimezone(IST)
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    value = " ".join(text.split()).lower()
+    if value in ("today", "just now"):
+        return today
+    if value == "yesterday":
+        return today - timedelta(days=1)
+    match = _AGO_RE.search(value)
+    if match:
+        unit = match.group(2).lower()
+        posted = now - int(match.group(1)) * _UNITS[unit]
+        if unit in ("minute", "min", "hour", "hr"):
+            return posted.replace(second=0, microsecond=0)
+        return posted.replace(hour=0, minute=0, second=0, microsecond=0)
+    for fmt in ("%b %d", "%d %b", "%b %d, %Y", "%d %b %Y"):
+        try:
+            parsed = datetime.strptime(value.title(), fmt)
+        except ValueError:
+            continue
+        if "%Y" in fmt:
+            return parsed.replace(tzinfo=IST)
+        posted = parsed.replace(year=now.year, tzinfo=IST)
+        return posted if posted <= now else posted.replace(year=now.year - 1)
+    return None
+
+
+def parse_timestamp(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+
+
+def split_location(text):
+    """(locality, city) of a card's "Locality, City" location; a single part is the city"""
+    if not text or text == "N/A":
+        return None, None
+    parts = [" ".join(part.split()) for part in text.split(",")]
+    parts = [part for part in parts if part]
+    if not parts:
+        return None, None
+    if len(parts) == 1:
+        return None, parts[0]
+    return parts[0], parts[1]
+
+
+def ad_id_from_url(url):
+    """The OLX ad id in an ad URL (the digits after -iid-), or None"""
+    match = _AD_ID_RE.search(url or "")
+    return match.group(1) if match else None
+
+
+def normalize_card(item, now=None):
+    """
+    Turn the display fields scraped from a result card into a Listing, parsed once.
+
+    Adds the typed fields the card allows: the ad id from the URL, the price in rupees,
+    the posting time from the relative date, and the locality and city.
+    """
+    listing = Listing()
+    for field in CARD_FIELDS:
+        value = item.get(field)
+        listing[field] = " ".join(value.split()) if isinstance(value, str) else value
+    listing.ad_id = ad_id_from_url(listing.url)
+    listing.price_value = parse_price(listing.price)
+    posted = parse_posted(listing.date, now)
+    listing.posted_at = posted.isoformat() if posted else None
+    listing.locality, listing.city = split_location(listing.location)
+    return listing
+
+
+class ListingBatch:
+    """
+    Listings stored column by column, for result sets too large to keep as records.
+
+    Integer columns are arrays of int64 with a validity mask, float columns arrays of
+    doubles with NaN for missing, and low-cardinality strings are interned, so a
+    batch costs a fraction of the records it holds. Writers read `column()` or
+    `iter_tuples()` directly instead of building a dict per row.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = list(fields or LISTING_FIELDS + DETAIL_FIELDS)
+        self._length = 0
+        self._columns = {}
+        self._valid = {}
+        for field in self.fields:
+            if field in INTEGER_FIELDS:
+                self._columns[field] = array("q")
+                self._valid[field] = bytearray()
+            elif field in FLOAT_FIELDS:
+                self._columns[field] = array("d")
+            else:
+                self._columns[field] = []
+
+    @classmethod
+    def from_listings(cls, items, fields=None):
+        batch = cls(fields)
+        batch.extend(items)
+        return batch
+
+    def append(self, item):
+        for field in self.fields:
+            self._append(field, item.get(field))
+        self._length += 1
+
+    def append_row(self, values):
+        """Append one row given as a sequence of values in `fields` order, e.g. a database row"""
+        for field, value in zip(self.fields, values):
+            self._append(field, value)
+        self._length += 1
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def _append(self, field, value):
+        column = self._columns[field]
+        if field in INTEGER_FIELDS:
+            column.append(0 if value is None else int(value))
+            self._valid[field].append(value is not None)
+        elif field in FLOAT_FIELDS:
+            column.append(math.nan if value is None else float(value))
+        elif field in CATEGORY_FIELDS and isinstance(value, str):
+            column.append(sys.intern(value))
+        else:
+            column.append(value)
+
+    def __len__(self):
+        return self._length
+
+    def column(self, field):
+        """The values of one column as a list, with None where a value is missing"""
+        if field not in self._columns:
+            return [None] * self._length
+        column = self._columns[field]
+        if field in INTEGER_FIELDS:
+            return [value if valid else None for value, valid in zip(column, self._valid[field])]
+        if field in FLOAT_FIELDS:
+            return [None if value != value else value for value in column]
+        return list(column)
+
+    def iter_tuples(self, fields=None):
+        """Yield each row as a tuple of the `fields` columns (all of them by default)"""
+        return zip(*(self.column(field) for field in fields or self.fields))
+
+    def iter_listings(self):
+        """Yield each row as a Listing; columns a Listing has no slot for are left out"""
+        fields = [field for field in self.fields if field in Listing.FIELDS]
+        for values in self.iter_tuples(fields):
+            yield Listing(**dict(zip(fields, values)))
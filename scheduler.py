@@ -0,0 +1,174 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+
+import requests
+
+from blocking import HostBlocked
+
+logger = logging.getLogger(__name__)
+
+# Statuses worth another attempt after a pause; anything else non-200 goes to the task's handler
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class FetchTask:
+    """
+    One page fetch queued on the scheduler.
+
+    `on_response(response)` handles the fetched page and returns follow-up tasks
+    (e.g. the next page), `on_error(error)` is called once retries are exhausted.
+    """
+
+    def __init__(self, url, on_response, on_error=None, headers_factory=None, priority=0, round=0):
+        self.url = url
+        self.on_response = on_response
+        self.on_error = on_error
+        self.headers_factory = headers_factory
+        self.priority = priority
+        self.round = round
+        self.attempts = 0
+
+
+class FetchScheduler:
+    """
+    One shared queue for the page fetches of many searches.
+
+    Tasks run in (priority, round, submission) order: lower priority values first and,
+    within a priority, every search's page N before any search's page N+1, so all
+    queries of a batch progress side by side. Fetches go through the PageFetcher, which
+    applies the per-host concurrency cap and rate limit. Connection errors and
+    RETRY_STATUSES are retried with exponential backoff and jitter; a host whose circuit
+    breaker is open is waited out when it reopens within `max_backoff`, otherwise the
+    task fails at once. Worker threads start on the first submit and live until close().
+    """
+
+    def __init__(self, fetcher, workers=4, max_retries=3, backoff=2.0, max_backoff=60.0):
+        self.fetcher = fetcher
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._ready = []
+        self._delayed = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._closed = False
+        self._stats = {
+            "submitted": 0,
+            "fetched": 0,
+            "retries": 0,
+            "failed": 0,
+            "running": 0
+        }
+
+    def submit(self, task):
+        with self._cond:
+            self._ensure_started()
+            heapq.heappush(self._ready, (task.priority, task.round, next(self._sequence), task))
+            self._stats["submitted"] += 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._ready)
+            stats["delayed"] = len(self._delayed)
+        stats["workers"] = self.workers
+        return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            threads, self._threads = self._threads, []
+            self._cond.notify_all()
+        for thread in threads:
+            thread.join(timeout=30)
+
+    def _ensure_started(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"fetch-scheduler-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _next_task(self):
+        """Block until a task is due, or return None once the scheduler is closed"""
+        with self._cond:
+            while not self._closed:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, task = heapq.heappop(self._delayed)
+                    heapq.heappush(self._ready, (task.priority, task.round, next(self._sequence), task))
+                if self._ready:
+                    self._stats["running"] += 1
+                    return heapq.heappop(self._ready)[-1]
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._cond.wait(timeout)
+            return None
+
+    def _worker(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            try:
+                self._run(task)
+            finally:
+                with self._cond:
+                    self._stats["running"] -= 1
+
+    def _run(self, task):
+        task.attempts += 1
+        headers = task.headers_factory() if task.headers_factory else None
+        try:
+            response = self.fetcher.fetch(task.url, headers)
+        except HostBlocked as e:
+            if e.retry_in > self.max_backoff or not self._retry(task, str(e), min_delay=e.retry_in):
+                self._fail(task, e)
+            return
+        except requests.RequestException as e:
+            if not self._retry(task, str(e)):
+                self._fail(task, e)
+            return
+
+        if response.status_code in RETRY_STATUSES and self._retry(task, f"status code {response.status_code}"):
+            return
+
+        with self._cond:
+            self._stats["fetched"] += 1
+        try:
+            follow_ups = task.on_response(response) or []
+        except Exception as e:
+            logger.error(f"Error handling {task.url}: {str(e)}")
+            self._fail(task, e)
+            return
+        for follow_up in follow_ups:
+            self.submit(follow_up)
+
+    def _retry(self, task, reason, min_delay=0.0):
+        """Park the task for an exponential, jittered backoff; False once it is out of attempts"""
+        if task.attempts > self.max_retries:
+            return False
+        delay = min(self.max_backoff, self.backoff * 2 ** (task.attempts - 1)) * random.uniform(0.5, 1.5)
+        delay = max(delay, min_delay)
+        logger.warning(f"Retrying {task.url} in {delay:.1f}s after {reason} (attempt {task.attempts})")
+        with self._cond:
+            heapq.heappush(self._delayed, (time.monotonic() + delay, next(self._sequence), task))
+            self._stats["retries"] += 1
+            self._cond.notify()
+        return True
+
+    def _fail(self, task, error):
+        with self._cond:
+            self._stats["failed"] += 1
+        if task.on_error is not None:
+            try:
+                task.on_error(error)
+            except Exception as e:
+                logger.error(f"Error handling failure of {task.url}: {str(e)}")
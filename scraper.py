@@ -0,0 +1,673 @@
+"""
+The scraper core: OLXScraper and what it needs, importable without Flask.
+
+The Flask app (app.py), the batch runner and the command line (cli.py) all build on it.
+Nothing here configures logging or touches the filesystem on import; Playwright and the
+HTML parser libraries are only imported once a search needs them.
+"""
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from datetime import datetime
+from urllib.parse import quote_plus, urlsplit
+
+from blocking import BLOCK_KINDS, CAPTCHA, EMPTY, ERROR, OK, SERVER_ERROR, HostBlocked, classify_response
+from browser_pool import BrowserPool
+from data_sources import api_search_url, normalize_ad, parse_api_listings, parse_state_listings
+from exporters import ExportSession
+from extraction import LISTING_WAIT_SELECTOR, extract_in_page
+from fetcher import PageFetcher
+from identities import PROFILES
+from jobs import JobCancelled
+from metrics import count, timed
+from parsers import LazyParserBackend
+from records import normalize_card
+from store import listing_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://www.olx.in"
+DEFAULT_EXPORT_DIR = os.path.join("static", "downloads")
+
+# Rotated per request when there is no identity pool
+USER_AGENTS = [profile["user_agent"] for profile in PROFILES]
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+
+def configure_logging(log_file=None, level=logging.INFO):
+    """Log to stderr and, when given, to `log_file`; called by the entry points, never on import"""
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    logging.basicConfig(level=level, format=LOG_FORMAT, handlers=handlers)
+
+
+class OLXScraper:
+    def __init__(self, cache=None, fetcher=None, browser_pool=None, parser=None, use_api=True,
+                 store=None, incremental=False, trace=None, progress_callback=None, cancel_event=None,
+                 base_url=DEFAULT_BASE_URL, enricher=None, export_dir=DEFAULT_EXPORT_DIR, use_browser=True):
+        self.cache = cache
+        self.fetcher = fetcher or PageFetcher()
+        self.browser_pool = browser_pool
+        self.parser = parser or LazyParserBackend()
+        self.use_api = use_api
+        # Without it a search that gets nothing over HTTP ends there, instead of in Playwright
+        self.use_browser = use_browser
+        self.store = store
+        self.incremental = incremental and store is not None
+        self.stopped_early = False
+        # Optional DetailEnricher merging detail-page fields into every page as it is scraped
+        self.enricher = enricher
+        # Set when the search was blocked or its sources failed, see iter_search()
+        self.degraded = None
+        self.block = None
+        self._failure = None
+        # Optional per-search Trace collecting stage timings and counters
+        self.trace = trace
+        # Optional hooks used by background jobs: called with each finished page number / checked between pages
+        self.progress_callback = progress_callback
+        self.cancel_event = cancel_event
+        self.base_url = base_url.rstrip('/')
+        self.export_dir = export_dir
+        self.user_agents = USER_AGENTS
+    
+    def search(self, query, max_pages=3, output_format="both", compression=None):
+        """
+        Searches OLX for the given query and extracts product information using both Playwright and requests as fallback.
+        
+        Args:
+            query (str): Search query
+            max_pages (int): Maximum number of pages to scrape
+            output_format (str): Output format, see export()
+            compression (str): None, "gzip" or "zstd"
+            
+        Returns:
+            tuple: (List of results, list of file paths, total listings)
+        """
+        with timed("search", self.trace):
+            all_results = self.fetch(query, max_pages)
+            files_info = self.export(query, all_results, output_format, compression)
+        return all_results, files_info, len(all_results)
+    
+    def fetch(self, query, max_pages=3):
+        """
+        Returns the listings for the query, served from the result cache when possible.
+        
+        Args:
+            query (str): Search query
+            max_pages (int): Maximum number of pages to scrape
+            
+        Returns:
+            list: Scraped listings
+        """
+        with timed("scrape", self.trace):
+            return [item for page_items in self.iter_search(query, max_pages) for item in page_items]
+    
+    def iter_search(self, query, max_pages=3):
+        """
+        Yields the listings for the query one results page at a time, as soon as each page is parsed.
+        
+        Sources are tried in order until one produces listings: the JSON search API, the
+        HTML result pages over requests (embedded JSON state first, DOM parsing second),
+        then Playwright. The full result set is cached once the search completes.
+        
+        Once OLX blocks us (429, 403 or a CAPTCHA page) no further source is tried: the
+        host's circuit breaker fails fast until it cools down, and the query's listings
+        from the store are served instead, if any. Such searches, and searches whose
+        sources all failed, set `degraded` to a dict with the "reason" (the kind of block,
+        "server_error" or "error"), "retry_in" seconds for blocks, and whether the
+        results are "partial" or "stale"; they are never cached.
+        
+        With a listing store, every page is upserted into it as it arrives; incremental
+        scrapes stop at the first page holding only listings the query already found.
+        With an enricher, each page gets its listings' detail-page fields first.
+        
+        Args:
+            query (str): Search query
+            max_pages (int): Maximum number of pages to scrape
+            
+        Yields:
+            list: Listings of one results page
+        """
+        if self.cache is not None:
+            cached = self.cache.get(query, max_pages)
+            if cached is not None:
+                logger.info(f"Serving cached results for: {query}, Pages: {max_pages}")
+                count("olx_searches_total", cached="true")
+                self._event("cache_hit")
+                self._page_done(max_pages)
+                yield cached
+                return
+        count("olx_searches_total", cached="false")
+        
+        encoded_query = quote_plus(query)
+        base_search_url = f"{self.base_url}/items/q-{encoded_query}"
+        
+        all_results = []
+        self.stopped_early = False
+        self.degraded = None
+        self.block = self.fetcher.breaker.blocked(self.base_url)
+        self._failure = None
+        seen_at = time.time()
+        if self.block is not None:
+            logger.warning(f"Not scraping {query}: {str(self.block)}")
+        
+        # The search API returns typed JSON, no HTML to download or parse
+        if self.use_api and self.block is None:
+            try:
+                logger.info(f"Trying search API first for: {query}")
+                for page_items in self._record_pages(query, self._enrich(self._scrape_with_api(encoded_query, max_pages)),
+                                                     seen_at):
+                    all_results.extend(page_items)
+                    self._count_listings("api", page_items)
+                    yield page_items
+                if all_results:
+                    logger.info(f"Successfully fetched {len(all_results)} listings from the search API")
+                elif self.block is None:
+                    logger.warning("Search API returned nothing, falling back to result pages")
+                    self._fallback("html")
+            except JobCancelled:
+                raise
+            except Exception as e:
+                logger.error(f"Search API failed with error: {str(e)}")
+                self._failure = ERROR
+                if not all_results and self.block is None:
+                    self._fallback("html")
+        
+        # Then the result pages over requests (more reliable for OLX than a browser)
+        if not all_results and self.block is None:
+            self._failure = None
+            try:
+                logger.info(f"Trying requests method for: {query}")
+                for page_items in self._record_pages(query,
+                                                     self._enrich(self._scrape_with_requests(base_search_url, max_pages)),
+                                                     seen_at):
+                    all_results.extend(page_items)
+                    self._count_listings("html", page_items)
+                    yield page_items
+                if all_results:
+                    logger.info(f"Successfully scraped {len(all_results)} listings with requests method")
+                elif self.block is None:
+                    logger.warning("Requests method failed, falling back to Playwright")
+            except JobCancelled:
+                raise
+            except Exception as e:
+                logger.error(f"Request method failed with error: {str(e)}")
+                self._failure = ERROR
+                if not all_results:
+                    logger.info("Falling back to Playwright")
+        
+        # If requests method failed or returned no results, try Playwright; never on a blocked host,
+        # where a browser only costs more to get the same CAPTCHA, nor when replaying offline
+        if not all_results and self.use_browser and self.block is None and not self.fetcher.offline:
+            self._fallback("playwright")
+            self._failure = None
+            try:
+                for page_items in self._record_pages(query,
+                                                     self._enrich(self._scrape_with_playwright(base_search_url, max_pages)),
+                                                     seen_at):
+                    all_results.extend(page_items)
+                    self._count_listings("playwright", page_items)
+                    yield page_items
+            except JobCancelled:
+                raise
+            except Exception as e:
+                logger.error(f"Playwright method also failed: {str(e)}")
+                self._failure = ERROR
+        
+        # A blocked search serves what the store already knows about the query rather than nothing
+        stale = []
+        if self.block is not None and not all_results and self.store is not None and self.store.has_listings(query):
+            stale = self.store.listings(query)
+            logger.warning(f"Serving {len(stale)} stored listings for: {query}")
+            self._count_listings("store", stale)
+            yield stale
+        
+        if self.block is not None:
+            self._degrade(self.block.kind, retry_in=round(self.block.retry_in), partial=bool(all_results),
+                          stale=bool(stale))
+        elif not all_results and self._failure is not None:
+            self._degrade(self._failure)
+        
+        # Only complete, live results are cached. The first pages of an incremental scrape
+        # are not the whole result either.
+        if all_results and self.cache is not None and not self.stopped_early and self.degraded is None:
+            self.cache.set(query, max_pages, all_results)
+    
+    def export(self, query, all_results, output_format="both", compression=None):
+        """
+        Streams the results to files in the export directory (static/downloads by default).
+        
+        With a listing store, the files hold every listing the store has for the query,
+        including those an incremental scrape did not page through again, read from the
+        store in columnar batches.
+        
+        Args:
+            query (str): Search query used in the file name
+            all_results (iterable): Listings to write when the store has none for the query
+            output_format (str): "json", "csv", "ndjson", "parquet", "both" (JSON and CSV)
+                or a comma-separated list of formats
+            compression (str): None, "gzip" or "zstd"
+            
+        Returns:
+            list: File info dicts with "path", "type" and "rows"
+        """
+        with timed("export", self.trace):
+            session = self.open_export(query, output_format, compression)
+            try:
+                if self.store is not None and self.store.has_listings(query):
+                    # Read back column by column, without a dict per stored listing
+                    for batch in self.store.iter_batches(query):
+                        session.write_batch(batch)
+                else:
+                    session.write_rows(all_results)
+            except Exception:
+                session.abort()
+                raise
+            return session.close()
+    
+    def open_export(self, query, output_format="both", compression=None):
+        """Open export files for the query, to be fed listings as they are produced"""
+        # Generate unique ID for this scrape
+        unique_id = uuid.uuid4().hex[:8]
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        filename_base = os.path.join(self.export_dir, f"olx_{query.replace(' ', '_')}_{timestamp}_{unique_id}")
+        return ExportSession(filename_base, output_format, compression)
+    
+    def page_url(self, query, page_num, source="html"):
+        """URL of one results page of the query, from the search API or the HTML result pages"""
+        encoded_query = quote_plus(query)
+        if source == "api":
+            return api_search_url(self.base_url, encoded_query, page_num)
+        return f"{self.base_url}/items/q-{encoded_query}?page={page_num}"
+    
+    def request_headers(self, source="html"):
+        """Fresh request headers for a page of the given source"""
+        return self._build_api_headers() if source == "api" else self._build_headers()
+    
+    def parse_page(self, text, page_num, source="html"):
+        """
+        Parse one fetched results page of either source.
+        
+        Returns:
+            tuple: (List of listings or None if the body is not a page of that source, whether a next page may exist)
+        """
+        if source == "api":
+            items = self._parse_api_page(text)
+            return items, bool(items)
+        return self._parse_requests_page(text, page_num)
+    
+    def _record_pages(self, query, pages, seen_at):
+        """Upsert each page into the listing store as it passes through, stopping early when incremental"""
+        if self.store is None:
+            yield from pages
+            return
+        
+        offset = 0
+        try:
+            for page_items in pages:
+                new_listings = self.store.upsert(query, page_items, seen_at=seen_at, offset=offset)
+                offset += len(page_items)
+                yield page_items
+                if self.incremental and not new_listings:
+                    logger.info("Page holds only known listings, stopping the incremental scrape")
+                    self.stopped_early = True
+                    break
+        finally:
+            pages.close()
+    
+    def _enrich(self, pages):
+        """Merge detail-page fields into each page as it passes through, when enrichment is on"""
+        if self.enricher is None:
+            return pages
+        # Detail pages are HTML whichever source found the listing
+        return self.enricher.enrich(pages, headers_factory=self._build_headers, trace=self.trace)
+    
+    def _scrape_with_api(self, encoded_query, max_pages):
+        """Fetch listings from OLX's JSON search API, yielding the listings of each page"""
+        urls = [api_search_url(self.base_url, encoded_query, page_num) for page_num in range(1, max_pages + 1)]
+        seen = set()
+        
+        pages = self.fetcher.fetch_ordered(urls, headers_factory=self._build_api_headers, window=self._fetch_window(),
+                                           trace=self.trace)
+        try:
+            for page_num, (url, response, error) in enumerate(pages, start=1):
+                self._check_cancelled()
+                
+                if error is not None:
+                    logger.error(f"Search API error on page {page_num}: {str(error)}")
+                    self._request_failed(error)
+                    break
+                identity = getattr(response, "identity", None)
+                if response.status_code != 200:
+                    logger.warning(f"Search API page {page_num} failed: Status code {response.status_code}")
+                    self._check_page(url, response.status_code, identity=identity)
+                    break
+                
+                ads = self._parse_api_page(response.text)
+                if ads is None:
+                    logger.warning(f"Search API page {page_num} is not a search response")
+                    # Bot challenges come back as HTML where the JSON should be
+                    if self._check_page(url, 200, response.text, identity=identity) == EMPTY:
+                        self._failure = ERROR
+                    break
+                self._check_page(url, 200, items=ads, identity=identity)
+                
+                # Pages can overlap when new ads are posted mid-search
+                items = self._unseen(ads, seen)
+                
+                logger.info(f"Found {len(items)} listings on search API page {page_num}")
+                self._page_done(page_num)
+                if items:
+                    yield items
+                if not ads:
+                    break
+        finally:
+            pages.close()
+    
+    def _scrape_with_requests(self, base_url, max_pages):
+        """Scrape OLX using requests and the configured HTML parser, yielding the listings of each page"""
+        urls = [f"{base_url}?page={page_num}" for page_num in range(1, max_pages + 1)]
+        seen = set()
+        
+        # Pages are fetched concurrently but parsed in page order, politeness comes from the fetcher's rate limit
+        pages = self.fetcher.fetch_ordered(urls, headers_factory=self._build_headers, window=self._fetch_window(),
+                                           trace=self.trace)
+        try:
+            for page_num, (url, response, error) in enumerate(pages, start=1):
+                self._check_cancelled()
+                
+                if error is not None:
+                    logger.error(f"Request error on page {page_num}: {str(error)}")
+                    self._request_failed(error)
+                    break
+                
+                # Check if request was successful
+                identity = getattr(response, "identity", None)
+                if response.status_code != 200:
+                    logger.warning(f"Failed to fetch page {page_num}: Status code {response.status_code}")
+                    self._check_page(url, response.status_code, identity=identity)
+                    break
+                
+                logger.info(f"Successfully fetched page {page_num}")
+                items, has_next_page = self._parse_requests_page(response.text, page_num)
+                kind = self._check_page(url, 200, response.text, items, identity)
+                self._page_done(page_num)
+                # Pages can overlap when new ads are posted mid-search
+                items = self._unseen(items, seen)
+                if items:
+                    yield items
+                
+                if kind == CAPTCHA:
+                    logger.warning("Detected anti-bot measures, stopping")
+                    break
+                
+                if not has_next_page:
+                    logger.info("No next page button found")
+                    break
+        finally:
+            pages.close()
+    
+    def _unseen(self, items, seen):
+        """The items whose listing key is not in `seen` yet, adding their keys to it"""
+        fresh = []
+        for item in items or []:
+            key = listing_key(item) or id(item)
+            if key not in seen:
+                seen.add(key)
+                fresh.append(item)
+        return fresh
+    
+    def _fetch_window(self):
+        """Incremental scrapes usually stop after the first page, so they fetch one page ahead at most"""
+        return 1 if self.incremental else None
+    
+    def _check_page(self, url, status_code, text=None, items=None, identity=None):
+        """
+        Classify a fetched page, reporting CAPTCHAs and real pages to the host's circuit breaker.
+        
+        `identity` is the one the page was fetched as, if the fetcher has an identity pool.
+        """
+        kind = classify_response(status_code, text, items)
+        breaker = self.fetcher.breaker
+        if kind in (OK, EMPTY):
+            breaker.record_success(url)
+        elif kind == CAPTCHA:
+            # 429 and 403 were already recorded by the fetcher
+            self.fetcher.record_block(url, kind, identity=identity)
+            self.fetcher.forget(url)
+        
+        if kind in BLOCK_KINDS:
+            blocked = breaker.blocked(url)
+            if blocked is None and identity is not None:
+                # Only this identity was ejected, the next source goes out as another one
+                self._failure = kind
+            else:
+                self._note_block(blocked or HostBlocked(urlsplit(url).netloc, kind, 0.0))
+        elif kind in (SERVER_ERROR, ERROR):
+            self._failure = kind
+        return kind
+    
+    def _request_failed(self, error):
+        if isinstance(error, HostBlocked):
+            self._note_block(error)
+        else:
+            self._failure = ERROR
+    
+    def _note_block(self, blocked):
+        if self.block is None:
+            self._event(f"blocked_{blocked.kind}")
+        self.block = blocked
+    
+    def _degrade(self, reason, **details):
+        self.degraded = {"reason": reason, **details}
+        logger.warning(f"Search degraded: {self.degraded}")
+        count("olx_degraded_searches_total", reason=reason)
+        self._event(f"degraded_{reason}")
+    
+    def _count_listings(self, source, items):
+        count("olx_listings_total", len(items), trace=self.trace, trace_key="listings", source=source)
+    
+    def _fallback(self, target):
+        """Count a fall back to a slower source (html or playwright)"""
+        count("olx_fallbacks_total", to=target)
+        self._event(f"fallback_to_{target}")
+    
+    def _event(self, name):
+        if self.trace is not None:
+            self.trace.event(name)
+    
+    def _page_done(self, page_num):
+        """Report progress to the owning job, if any"""
+        if self.progress_callback is not None:
+            self.progress_callback(page_num)
+    
+    def _check_cancelled(self):
+        """Abort the scrape between pages once the owning job has been cancelled"""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise JobCancelled()
+    
+    def _build_headers(self):
+        """Build browser-like request headers with a rotated user agent"""
+        return {
+            'User-Agent': random.choice(self.user_agents),
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'Connection': 'keep-alive',
+            'Sec-Ch-Ua': '"Chromium";v="115", "Not/A)Brand";v="99"',
+            'Sec-Ch-Ua-Mobile': '?0',
+            'Sec-Ch-Ua-Platform': '"Windows"',
+            'Sec-Fetch-Dest': 'document',
+            'Sec-Fetch-Mode': 'navigate',
+            'Sec-Fetch-Site': 'none',
+            'Sec-Fetch-User': '?1',
+            'Upgrade-Insecure-Requests': '1',
+            'Referer': 'https://www.google.com/'
+        }
+    
+    def _build_api_headers(self):
+        """Headers of the site's own XHR calls to the search API"""
+        headers = self._build_headers()
+        headers.update({
+            'Accept': 'application/json, text/plain, */*',
+            'Sec-Fetch-Dest': 'empty',
+            'Sec-Fetch-Mode': 'cors',
+            'Sec-Fetch-Site': 'same-origin',
+            'Referer': f'{self.base_url}/'
+        })
+        del headers['Sec-Fetch-User']
+        del headers['Upgrade-Insecure-Requests']
+        return headers
+    
+    def _parse_api_page(self, text):
+        """Listings of one search API response, or None if the body is not a search response"""
+        with timed("parse_api", self.trace):
+            try:
+                ads = parse_api_listings(json.loads(text))
+            except ValueError:
+                return None
+            if ads is None:
+                return None
+            return [normalize_ad(ad, self.base_url) for ad in ads]
+    
+    def _parse_requests_page(self, html, page_num):
+        """
+        Parse one search results page, from its embedded JSON state when present.
+        
+        Returns:
+            tuple: (List of listings, whether a next page may exist)
+        """
+        # Decoding the state blob is much cheaper than building a tree and carries typed fields
+        with timed("parse_state", self.trace):
+            ads = parse_state_listings(html)
+            if ads is not None:
+                results = [normalize_ad(ad, self.base_url) for ad in ads]
+        if ads is not None:
+            logger.info(f"Found {len(ads)} listings in the embedded state of page {page_num}")
+            return results, bool(ads)
+        
+        with timed("parse_dom", self.trace):
+            document = self.parser.parse(html)
+        
+        # Find listings with the first selector that matches, then extract every field of each card
+        with timed("extract", self.trace):
+            selector, listings = self.parser.find_listings(document)
+            results = [normalize_card(self.parser.extract(listing, self.base_url)) for listing in listings]
+            has_next_page = self.parser.has_next_page(document)
+        if listings:
+            logger.info(f"Found {len(listings)} listings with selector: {selector}")
+        else:
+            logger.warning(f"No listings found on page {page_num}")
+        
+        return results, has_next_page
+    
+    def _scrape_with_playwright(self, base_url, max_pages):
+        """Scrape OLX using Playwright as fallback, yielding the listings of each page"""
+        # The browser goes out as one of the fetcher's identities for the whole search, if it has any
+        identities = self.fetcher.identities
+        identity = None
+        if identities is not None:
+            try:
+                identity = identities.acquire(base_url)
+            except HostBlocked as e:
+                logger.warning(f"Not starting Playwright: {str(e)}")
+                self._note_block(e)
+                return
+        # Without a shared pool, launch a one-off browser for this search
+        pool = self.browser_pool or BrowserPool(base_url=self.base_url, user_agents=self.user_agents)
+        try:
+            yield from pool.run(lambda context: self._playwright_pages(context, base_url, max_pages, identity),
+                                identity)
+        finally:
+            if identity is not None:
+                identities.release(identity)
+            if pool is not self.browser_pool:
+                pool.close()
+    
+    def _playwright_pages(self, context, base_url, max_pages, identity=None):
+        """Scrape the result pages in a warmed browser context; runs on the pool's browser thread"""
+        page = context.new_page()
+        try:
+            # Set headers on the page
+            page.set_extra_http_headers({
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.9,hi;q=0.8',
+                'Accept-Encoding': 'gzip, deflate, br',
+                'Connection': 'keep-alive',
+                'Upgrade-Insecure-Requests': '1',
+                'Sec-Fetch-Dest': 'document',
+                'Sec-Fetch-Mode': 'navigate',
+                'Sec-Fetch-Site': 'none',
+                'Sec-Fetch-User': '?1',
+                'Referer': 'https://www.google.com/'
+            })
+            
+            page.set_default_timeout(30000)  # 30 seconds timeout
+            seen = set()
+            
+            for page_num in range(1, max_pages + 1):
+                url = f"{base_url}?page={page_num}"
+                
+                self._check_cancelled()
+                
+                try:
+                    # Politeness comes from the same per-host rate limit as the requests path
+                    self.fetcher.throttle(url, self.trace, identity)
+                    
+                    # Only wait for the HTML, then for the first listing card rather than for network idle
+                    logger.info(f"Navigating to: {url}")
+                    start = time.perf_counter()
+                    with timed("navigate", self.trace):
+                        page.goto(url, wait_until="domcontentloaded", timeout=30000)
+                    count("olx_browser_pages_total", trace=self.trace, trace_key="browser_pages")
+                    try:
+                        with timed("wait_for_listings", self.trace):
+                            page.wait_for_selector(LISTING_WAIT_SELECTOR, state="attached", timeout=15000)
+                    except Exception:
+                        logger.warning(f"No listing selector appeared on page {page_num}")
+                    logger.info(f"Loaded page {page_num} in {time.perf_counter() - start:.2f}s")
+                    
+                    # Find the cards and extract every field of every card in one round trip
+                    with timed("extract_in_page", self.trace):
+                        selector, page_items = extract_in_page(page, self.parser.extractor, self.base_url)
+                    page_items = [normalize_card(item) for item in page_items]
+                    
+                    # Only a page without listings is searched for a bot challenge
+                    kind = self._check_page(url, 200, None if page_items else page.content(), page_items, identity)
+                    if kind == CAPTCHA:
+                        logger.warning("Anti-bot protection detected, aborting")
+                        break
+                    if identity is not None:
+                        self.fetcher.identities.record_success(identity)
+                    
+                    if not page_items:
+                        logger.warning("No listings found on the page")
+                        # Take screenshot for debugging
+                        page.screenshot(path=f"debug_screenshot_page{page_num}.png")
+                        continue
+                    
+                    logger.info(f"Found {len(page_items)} listings with selector: {selector}")
+                    
+                    self._page_done(page_num)
+                    page_items = self._unseen(page_items, seen)
+                    if page_items:
+                        yield page_items
+                    
+                except HostBlocked as e:
+                    logger.warning(f"Stopping on page {page_num}: {str(e)}")
+                    self._note_block(e)
+                    break
+                except Exception as e:
+                    logger.error(f"Error on page {page_num}: {str(e)}")
+                    self._failure = ERROR
+                    if identity is not None:
+                        self.fetcher.identities.record_failure(identity, type(e).__name__)
+                    break
+            
+        finally:
+            page.close()
@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from cache import normalize_query
+from records import DETAIL_FIELDS, LISTING_FIELDS, TYPED_FIELDS, ListingBatch
+
+logger = logging.getLogger(__name__)
+
+# Fields only some sources know (the API and detail pages have coordinates and exact times,
+# cards do not): an upsert without them keeps the stored values. price_value always follows
+# the price it was parsed from
+_KEPT_FIELDS = frozenset([field for field in TYPED_FIELDS if field != "price_value"] + DETAIL_FIELDS)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS listings (
+    key TEXT PRIMARY KEY,
+    {", ".join(LISTING_FIELDS)},
+    {", ".join(DETAIL_FIELDS)},
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS query_listings (
+    query TEXT NOT NULL,
+    key TEXT NOT NULL REFERENCES listings(key),
+    position INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    PRIMARY KEY (query, key)
+);
+CREATE INDEX IF NOT EXISTS query_listings_recent ON query_listings (query, last_seen DESC, position);
+CREATE TABLE IF NOT EXISTS price_history (
+    key TEXT NOT NULL REFERENCES listings(key),
+    price TEXT,
+    price_value INTEGER,
+    seen_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS price_history_key ON price_history (key, seen_at);
+"""
+
+
+def listing_key(item):
+    """Stable identity of a listing: its OLX ad id, or its URL when the id is unknown"""
+    if item.get("ad_id"):
+        return f"ad:{item['ad_id']}"
+    url = item.get("url")
+    if url and url != "N/A":
+        return f"url:{url}"
+    return None
+
+
+class ListingStore:
+    """
+    SQLite store of every listing seen, de-duplicated across scrapes.
+
+    Listings are keyed by ad id (or URL) and upserted with first/last seen times;
+    each price change is appended to the listing's price history. Listings are also
+    linked to the normalized queries that found them, so a query's export is a read
+    from the store rather than a re-scrape. Detail-page fields, coordinates, locality,
+    city and posting time are kept once known; later upserts without them leave them as
+    they are.
+    """
+
+    def __init__(self, path="listings.db"):
+        self.path = path
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def _conn(self):
+        """
+        This process's connection, opened (and the schema created) on first use.
+
+        Nothing is opened at construction, so an app preloaded before forking gives
+        every worker its own connection instead of sharing the parent's.
+        """
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.row_factory = sqlite3.Row
+            with conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.executescript(SCHEMA)
+                # Stores created by older versions lack the columns added since (detail fields, locality, city)
+                columns = {row["name"] for row in conn.execute("PRAGMA table_info(listings)")}
+                for field in LISTING_FIELDS + DETAIL_FIELDS:
+                    if field not in columns:
+                        conn.execute(f"ALTER TABLE listings ADD COLUMN {field}")
+            self._connection = conn
+            self._pid = os.getpid()
+        return self._connection
+
+    def upsert(self, query, items, seen_at=None, offset=0):
+        """
+        Insert or refresh the listings found by a query.
+
+        `offset` is the position of the first item in the scrape, so listings read
+        back for the query keep their page order.
+
+        Returns:
+            int: How many of the listings the query had not found before
+        """
+        query = normalize_query(query)
+        seen_at = seen_at or time.time()
+        new_for_query = 0
+
+        with self._lock, self._conn:
+            for position, item in enumerate(items, start=offset):
+                key = listing_key(item)
+                if key is None:
+                    continue
+                values = [item.get(field) for field in LISTING_FIELDS]
+                details = _detail_values(item)
+
+                row = self._conn.execute(
+                    "SELECT price, price_value FROM listings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        f"INSERT INTO listings (key, {', '.join(LISTING_FIELDS + DETAIL_FIELDS)}, first_seen, last_seen) "
+                        f"VALUES (?, {', '.join('?' for _ in LISTING_FIELDS + DETAIL_FIELDS)}, ?, ?)",
+                        [key] + values + details + [seen_at, seen_at]
+                    )
+                else:
+                    self._conn.execute(
+                        f"UPDATE listings SET {', '.join(_assignment(field) for field in LISTING_FIELDS + DETAIL_FIELDS)}, "
+                        "last_seen = ? WHERE key = ?",
+                        values + details + [seen_at, key]
+                    )
+                if row is None or (row["price"], row["price_value"]) != (item.get("price"), item.get("price_value")):
+                    self._conn.execute(
+                        "INSERT INTO price_history (key, price, price_value, seen_at) VALUES (?, ?, ?, ?)",
+                        (key, item.get("price"), item.get("price_value"), seen_at)
+                    )
+
+                cursor = self._conn.execute(
+                    "UPDATE query_listings SET position = ?, last_seen = ? WHERE query = ? AND key = ?",
+                    (position, seen_at, query, key)
+                )
+                if cursor.rowcount == 0:
+                    self._conn.execute(
+                        "INSERT INTO query_listings (query, key, position, first_seen, last_seen) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (query, key, position, seen_at, seen_at)
+                    )
+                    new_for_query += 1
+        return new_for_query
+
+    def listings(self, query, limit=None):
+        """Return every listing the query has found, most recently seen first and in page order"""
+        return list(self.iter_listings(query, limit))
+
+    def iter_listings(self, query, limit=None, chunk_size=1000):
+        """
+        Yield the query's listings like listings(), reading them in chunks.
+
+        Uses its own read-only connection, so a long export neither holds the whole
+        result in memory nor blocks writers (the database is in WAL mode).
+        """
+        for rows in self._query_chunks(query, limit, chunk_size):
+            for row in rows:
+                yield _listing(row)
+
+    def iter_batches(self, query, limit=None, chunk_size=1000, fields=None):
+        """
+        Yield the query's listings as ListingBatch columns of up to `chunk_size` rows each.
+
+        Rows go straight from the database into the columns, without a dict per listing;
+        `fields` picks the columns (every listing field plus first_seen/last_seen by default).
+        """
+        fields = list(fields or LISTING_FIELDS + DETAIL_FIELDS + ["first_seen", "last_seen"])
+        for rows in self._query_chunks(query, limit, chunk_size):
+            batch = ListingBatch(fields)
+            for row in rows:
+                batch.append_row([_column(row, field) for field in fields])
+            yield batch
+
+    def _query_chunks(self, query, limit, chunk_size):
+        sql = (
+            f"SELECT {', '.join(f'l.{field}' for field in LISTING_FIELDS + DETAIL_FIELDS)}, "
+            "ql.first_seen AS first_seen, ql.last_seen AS last_seen, l.key AS key "
+            "FROM query_listings ql JOIN listings l ON l.key = ql.key "
+            "WHERE ql.query = ? ORDER BY ql.last_seen DESC, ql.position"
+        )
+        params = [normalize_query(query)]
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+
+        with self._lock:
+            self._conn  # creates the file and schema if this is the store's first use
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            conn.close()
+
+    def details(self, keys, since):
+        """Return {key: detail-page fields} of the listings among `keys` enriched at or after `since`"""
+        keys = list(keys)
+        if not keys:
+            return {}
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, {', '.join(DETAIL_FIELDS)}, seller, posted_at, location, locality, city, latitude, longitude "
+                f"FROM listings WHERE key IN ({', '.join('?' for _ in keys)}) AND enriched_at >= ?",
+                keys + [since]
+            ).fetchall()
+        return {row["key"]: {field: value for field, value in _listing(row).items() if field != "key"} for row in rows}
+
+    def has_listings(self, query):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM query_listings WHERE query = ? LIMIT 1", (normalize_query(query),)
+            ).fetchone()
+        return row is not None
+
+    def price_history(self, key):
+        """Return the (price, price_value, seen_at) changes of one listing, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT price, price_value, seen_at FROM price_history WHERE key = ? ORDER BY seen_at",
+                (key,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self):
+        with self._lock:
+            listings = self._conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+            queries = self._conn.execute("SELECT COUNT(DISTINCT query) FROM query_listings").fetchone()[0]
+            price_changes = self._conn.execute(
+                "SELECT COUNT(*) - COUNT(DISTINCT key) FROM price_history"
+            ).fetchone()[0]
+            enriched = self._conn.execute("SELECT COUNT(enriched_at) FROM listings").fetchone()[0]
+        return {
+            "listings": listings,
+            "enriched": enriched,
+            "queries": queries,
+            "price_changes": price_changes,
+            "path": self.path
+        }
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+
+def _assignment(field):
+    return f"{field} = COALESCE(?, {field})" if field in _KEPT_FIELDS else f"{field} = ?"
+
+
+def _detail_values(item):
+    if not item.get("enriched_at"):
+        return [None] * len(DETAIL_FIELDS)
+    return [json.dumps(item[field]) if field == "images" and item.get(field) is not None else item.get(field)
+            for field in DETAIL_FIELDS]
+
+
+def _listing(row):
+    listing = dict(row)
+    if listing.get("images"):
+        listing["images"] = json.loads(listing["images"])
+    return listing
+
+
+def _column(row, field):
+    if field == "images" and row["images"]:
+        return json.loads(row["images"])
+    return row[field]
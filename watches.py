@@ -0,0 +1,541 @@
+import heapq
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from metrics import count
+from records import json_default
+from store import listing_key
+
+logger = logging.getLogger(__name__)
+
+NEW_LISTING = "new_listing"
+PRICE_DROP = "price_drop"
+
+
+class Watch:
+    """
+    A query scraped every `interval` seconds, with the listings (and their prices) it last saw.
+
+    `known` maps each listing key of the last run to its price_value; the next run is
+    diffed against it. `last_seen` holds the run each key was last seen in, so keys
+    kept across incomplete runs can be forgotten once they stop turning up.
+    """
+
+    def __init__(self, query, pages=1, interval=3600, incremental=True, id=None, created_at=None):
+        self.id = id or uuid.uuid4().hex
+        self.query = query
+        self.pages = pages
+        self.interval = interval
+        self.incremental = incremental
+        self.created_at = created_at or time.time()
+        self.known = {}
+        self.last_seen = {}
+        self.runs = 0
+        self.events = 0
+        self.running = False
+        self.next_run_at = None
+        self.last_run_at = None
+        self.last_events = 0
+        self.last_error = None
+
+    def to_dict(self, include_known=False):
+        data = {
+            "id": self.id,
+            "query": self.query,
+            "pages": self.pages,
+            "interval": self.interval,
+            "incremental": self.incremental,
+            "created_at": self.created_at,
+            "runs": self.runs,
+            "events": self.events,
+            "running": self.running,
+            "next_run_at": self.next_run_at,
+            "last_run_at": self.last_run_at,
+            "last_events": self.last_events,
+            "known_listings": len(self.known)
+        }
+        if self.last_error:
+            data["last_error"] = self.last_error
+        if include_known:
+            data["known"] = dict(self.known)
+            data["last_seen"] = dict(self.last_seen)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        watch = cls(data["query"], data["pages"], data["interval"], data.get("incremental", True),
+                    data["id"], data.get("created_at"))
+        watch.known = dict(data.get("known") or {})
+        watch.runs = data.get("runs", 0)
+        # A known listing without a run of its own counts as seen in the watch's last run
+        watch.last_seen = {key: data.get("last_seen", {}).get(key, watch.runs) for key in watch.known}
+        watch.events = data.get("events", 0)
+        watch.next_run_at = data.get("next_run_at")
+        watch.last_run_at = data.get("last_run_at")
+        watch.last_events = data.get("last_events", 0)
+        watch.last_error = data.get("last_error")
+        return watch
+
+
+def diff_listings(watch, listings, detected_at=None):
+    """
+    Compare a run's listings with what the watch saw last time.
+
+    Returns:
+        tuple: (events for new listings and price drops, {key: price_value} of this run)
+    """
+    detected_at = detected_at or time.time()
+    events = []
+    current = {}
+    for item in listings:
+        key = listing_key(item)
+        if key is None or key in current:
+            continue
+        price = item.get("price_value")
+        current[key] = price
+        if key not in watch.known:
+            kind = NEW_LISTING
+        elif price is not None and watch.known[key] is not None and price < watch.known[key]:
+            kind = PRICE_DROP
+        else:
+            continue
+        events.append({
+            "type": kind,
+            "watch_id": watch.id,
+            "query": watch.query,
+            "key": key,
+            "price_value": price,
+            "previous_price": watch.known.get(key),
+            "detected_at": detected_at,
+            "listing": item
+        })
+    return events, current
+
+
+class EventLog:
+    """Append-only NDJSON file of watch events, one line per event"""
+
+    name = "event_log"
+
+    def __init__(self, path):
+        self.path = path
+        self.written = 0
+        self._lock = threading.Lock()
+
+    def emit(self, events):
+        lines = "".join(json.dumps(event, ensure_ascii=False, default=json_default) + "\n" for event in events)
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+            self.written += len(events)
+
+    def stats(self):
+        with self._lock:
+            return {"path": self.path, "written": self.written}
+
+    def close(self):
+        pass
+
+
+class WebhookSink:
+    """
+    POSTs watch events to a URL as {"events": [...]}, several at a time.
+
+    Events are queued and sent by a background thread, up to `batch_size` per request
+    after waiting `linger` seconds for more to arrive. A failed request keeps its events
+    at the head of the queue and is retried with exponential backoff, together with
+    whatever arrived meanwhile, so an outage costs a few large requests rather than one
+    per event. Beyond `max_pending` queued events the oldest are dropped.
+    """
+
+    name = "webhook"
+
+    def __init__(self, url, batch_size=100, linger=1.0, timeout=10.0, backoff=2.0, max_backoff=300.0,
+                 max_pending=10000):
+        self.url = url
+        self.batch_size = batch_size
+        self.linger = linger
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_pending = max_pending
+        self._session = requests.Session()
+        self._pending = []
+        self._failures = 0
+        self._retry_at = 0.0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stats = {"delivered": 0, "requests": 0, "failed_requests": 0, "dropped": 0}
+
+    def emit(self, events):
+        with self._cond:
+            self._pending.extend(events)
+            self._trim()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._deliver, name="watch-webhook", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+            stats["consecutive_failures"] = self._failures
+        stats["url"] = self.url
+        return stats
+
+    def close(self, timeout=10.0):
+        """Stop the delivery thread after one last attempt to send what is queued"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._session.close()
+
+    def _deliver(self):
+        while True:
+            with self._cond:
+                # New events do not cut a backoff short, they wait to go out with the retry
+                while not self._closed and (not self._pending or time.monotonic() < self._retry_at):
+                    self._cond.wait(max(0.0, self._retry_at - time.monotonic()) if self._pending else None)
+                if not self._pending:
+                    return
+                deadline = time.monotonic() + self.linger
+                while not self._closed and len(self._pending) < self.batch_size and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                events = self._pending[:self.batch_size]
+                del self._pending[:len(events)]
+                closing = self._closed
+            delivered = self._post(events)
+            with self._cond:
+                if delivered:
+                    self._failures = 0
+                    self._stats["delivered"] += len(events)
+                    continue
+                # Back at the head of the queue, to go out with whatever arrives meanwhile
+                self._pending[:0] = events
+                self._trim()
+                if closing:
+                    return
+                self._failures += 1
+                delay = min(self.max_backoff, self.backoff * 2 ** (self._failures - 1)) * random.uniform(0.5, 1.5)
+                self._retry_at = time.monotonic() + delay
+                logger.warning(f"Webhook delivery of {len(events)} events failed, retrying in {delay:.1f}s")
+
+    def _trim(self):
+        """Drop the oldest events beyond max_pending; call with the condition held"""
+        overflow = len(self._pending) - self.max_pending
+        if overflow > 0:
+            del self._pending[:overflow]
+            self._stats["dropped"] += overflow
+            logger.warning(f"Webhook queue full, dropped the {overflow} oldest events")
+
+    def _post(self, events):
+        with self._cond:
+            self._stats["requests"] += 1
+        try:
+            response = self._session.post(
+                self.url,
+                data=json.dumps({"events": events}, ensure_ascii=False, default=json_default).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                timeout=self.timeout
+            )
+            ok = 200 <= response.status_code < 300
+            if not ok:
+                logger.warning(f"Webhook answered {response.status_code}")
+        except requests.RequestException as e:
+            logger.warning(f"Webhook request failed: {str(e)}")
+            ok = False
+        count("olx_webhook_requests_total", result="ok" if ok else "failed")
+        if not ok:
+            with self._cond:
+                self._stats["failed_requests"] += 1
+        return ok
+
+
+class WatchManager:
+    """
+    Runs watches on schedule and emits only what changed since their last run.
+
+    `runner(watch)` scrapes the watch's query and returns (listings, degraded, complete),
+    `degraded` being the scraper's degraded dict or None and `complete` False when the
+    scrape stopped before its page budget (an incremental stop, or a partial result).
+    Each run is diffed against the watch's last one: listings it had not seen and lower
+    prices become events, handed to every sink. A watch's first run only records a
+    baseline. An incomplete run adds to what the watch knows instead of replacing it,
+    forgetting listings not seen for `forget_after` runs, and a run that was blocked or
+    failed outright is not diffed at all.
+
+    Runs start `interval` seconds apart, each stretched or shrunk by up to `jitter` of
+    it, and new watches start at a random point in their first interval so a set of
+    watches added together does not fire together; at most `max_concurrent` run at
+    once. Watches are kept in the `path` directory, when given, one JSON file each,
+    so they survive a restart; a run only rewrites its own watch's file.
+
+    Nothing runs until `start()`, which loads the saved watches and starts the scheduler
+    thread; a process that forks after building the manager calls it in the child.
+    """
+
+    def __init__(self, runner, sinks=(), max_concurrent=2, jitter=0.1, min_interval=60.0, path=None,
+                 forget_after=20):
+        self.runner = runner
+        self.sinks = list(sinks)
+        self.max_concurrent = max_concurrent
+        self.jitter = jitter
+        self.min_interval = min_interval
+        self.path = path
+        self.forget_after = forget_after
+        self._watches = {}
+        self._due = []
+        self._running = 0
+        self._closed = False
+        self._started = False
+        self._cond = threading.Condition()
+        self._save_lock = threading.Lock()
+        self._thread = None
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="watch")
+        self._stats = {"runs": 0, "failed_runs": 0, "events": 0}
+
+    def start(self):
+        """Load the saved watches and start running them; later calls do nothing"""
+        with self._cond:
+            if self._started or self._closed:
+                return
+            self._started = True
+        if self.path:
+            self._load()
+        with self._cond:
+            self._ensure_thread()
+
+    def add(self, query, pages=1, interval=3600, incremental=True):
+        """Register a watch; raises ValueError for an empty query or an interval under min_interval"""
+        query = " ".join(str(query).split())
+        if not query:
+            raise ValueError("A watch needs a query")
+        if interval < self.min_interval:
+            raise ValueError(f"Watch interval must be at least {self.min_interval:g}s")
+        watch = Watch(query, pages, interval, incremental)
+        watch.next_run_at = time.time() + random.uniform(0, interval * self.jitter)
+        with self._cond:
+            self._watches[watch.id] = watch
+            self._schedule(watch)
+        self._save(watch)
+        logger.info(f"Watching {query!r} every {interval:g}s, Pages: {pages}")
+        return watch
+
+    def remove(self, watch_id):
+        with self._cond:
+            watch = self._watches.pop(watch_id, None)
+        if watch is not None:
+            self._delete(watch)
+            logger.info(f"Stopped watching {watch.query!r}")
+        return watch
+
+    def get(self, watch_id):
+        with self._cond:
+            return self._watches.get(watch_id)
+
+    def list(self):
+        with self._cond:
+            return sorted(self._watches.values(), key=lambda watch: watch.created_at)
+
+    def run_now(self, watch_id):
+        """Move a watch's next run to now; returns the watch or None"""
+        with self._cond:
+            watch = self._watches.get(watch_id)
+            if watch is not None and not watch.running:
+                watch.next_run_at = time.time()
+                self._schedule(watch)
+        return watch
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["watches"] = len(self._watches)
+            stats["running"] = self._running
+        stats["max_concurrent"] = self.max_concurrent
+        stats["sinks"] = {sink.name: sink.stats() for sink in self.sinks}
+        return stats
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        for sink in self.sinks:
+            sink.close()
+
+    def _schedule(self, watch):
+        """Queue the watch's next run; call with the condition held"""
+        heapq.heappush(self._due, (watch.next_run_at, watch.id))
+        self._ensure_thread()
+        self._cond.notify()
+
+    def _ensure_thread(self):
+        if self._started and self._thread is None and self._due:
+            self._thread = threading.Thread(target=self._loop, name="watch-scheduler", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        with self._cond:
+            while not self._closed:
+                now = time.time()
+                watch = None
+                while self._due and self._running < self.max_concurrent:
+                    run_at, watch_id = self._due[0]
+                    candidate = self._watches.get(watch_id)
+                    # Entries of removed or rescheduled watches are stale, skip them
+                    if candidate is None or candidate.running or candidate.next_run_at != run_at:
+                        heapq.heappop(self._due)
+                        continue
+                    if run_at <= now:
+                        heapq.heappop(self._due)
+                        watch = candidate
+                    break
+                if watch is None:
+                    timeout = self._due[0][0] - now if self._due and self._running < self.max_concurrent else None
+                    self._cond.wait(timeout)
+                    continue
+                watch.running = True
+                self._running += 1
+                self._executor.submit(self._run, watch)
+
+    def _run(self, watch):
+        started = time.time()
+        events = []
+        error = None
+        known = watch.known
+        last_seen = watch.last_seen
+        run = watch.runs + 1
+        try:
+            listings, degraded, complete = self.runner(watch)
+        except Exception as e:
+            listings, degraded, complete = [], {"reason": "error"}, False
+            error = str(e)
+        if degraded is not None and not degraded.get("partial"):
+            # Blocked, failed, or stale listings from the store: nothing live to compare
+            error = error or f"degraded: {degraded['reason']}"
+        else:
+            events, current = diff_listings(watch, listings, started)
+            if watch.runs == 0:
+                events = []
+            seen_now = dict.fromkeys(current, run)
+            if complete and degraded is None:
+                known, last_seen = current, seen_now
+            else:
+                # Keep what this run did not reach, but not forever
+                last_seen = {key: seen for key, seen in {**watch.last_seen, **seen_now}.items()
+                             if seen > run - self.forget_after}
+                known = {key: price for key, price in {**watch.known, **current}.items() if key in last_seen}
+        if events:
+            self._emit(events)
+
+        with self._cond:
+            watch.known = known
+            watch.last_seen = last_seen
+            watch.running = False
+            watch.runs += 1
+            watch.last_run_at = started
+            watch.last_events = len(events)
+            watch.events += len(events)
+            watch.last_error = error
+            self._running -= 1
+            self._stats["runs"] += 1
+            self._stats["failed_runs"] += error is not None
+            self._stats["events"] += len(events)
+            if watch.id in self._watches:
+                watch.next_run_at = time.time() + watch.interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+                self._schedule(watch)
+            else:
+                self._cond.notify()
+        count("olx_watch_runs_total", result="failed" if error else "ok")
+        if error:
+            logger.warning(f"Watch {watch.query!r} failed: {error}")
+        else:
+            logger.info(f"Watch {watch.query!r}: {len(listings)} listings, {len(events)} events")
+        if watch.id in self._watches:
+            self._save(watch)
+
+    def _emit(self, events):
+        for kind in (NEW_LISTING, PRICE_DROP):
+            found = sum(1 for event in events if event["type"] == kind)
+            if found:
+                count("olx_watch_events_total", found, type=kind)
+        for sink in self.sinks:
+            try:
+                sink.emit(events)
+            except Exception as e:
+                logger.error(f"Could not hand {len(events)} events to the {sink.name}: {str(e)}")
+
+    def _watch_path(self, watch_id):
+        return os.path.join(self.path, f"{watch_id}.json")
+
+    def _save(self, watch):
+        """Write one watch's file; the other watches' files are left alone"""
+        if not self.path:
+            return
+        with self._cond:
+            data = watch.to_dict(include_known=True)
+        path = self._watch_path(watch.id)
+        tmp_path = f"{path}.tmp"
+        with self._save_lock:
+            try:
+                os.makedirs(self.path, exist_ok=True)
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logger.warning(f"Could not save watch {watch.id} to {path}: {str(e)}")
+
+    def _delete(self, watch):
+        if not self.path:
+            return
+        with self._save_lock:
+            try:
+                os.remove(self._watch_path(watch.id))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Could not delete watch {watch.id}: {str(e)}")
+
+    def _load(self):
+        if not os.path.isdir(self.path):
+            return
+        entries = []
+        for name in sorted(os.listdir(self.path)):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.path, name), "r", encoding="utf-8") as f:
+                    entries.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Could not load watch {name} from {self.path}: {str(e)}")
+        if not entries:
+            return
+        now = time.time()
+        watches = []
+        with self._cond:
+            for entry in entries:
+                watch = Watch.from_dict(entry)
+                # Runs missed while the process was down are spread over the first interval
+                if watch.next_run_at is None or watch.next_run_at < now:
+                    watch.next_run_at = now + random.uniform(0, watch.interval * self.jitter)
+                self._watches[watch.id] = watch
+                self._schedule(watch)
+                watches.append(watch)
+        logger.info(f"Loaded {len(watches)} watches from {self.path}")